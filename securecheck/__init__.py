@@ -0,0 +1 @@
+# SecureCheck data layer shared by the Streamlit dashboard and the headless tools
@@ -0,0 +1,507 @@
+import argparse
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+from securecheck import db
+from securecheck.cube import MEASURES, age_group
+from securecheck.filters import FILTERS, active_filters
+from securecheck.loader import clean_chunk, iter_clean_chunks
+from securecheck.overview import ESTIMATE_QUERY
+from securecheck.rollups import ROLLUP_LOCK_KEY
+
+
+# Two-sided 95% normal quantile for the confidence intervals
+Z_95 = 1.96
+
+# The sample is stratified by country: every country keeps its own reservoir, so small
+# countries are estimated as well as large ones
+STRATUM = "country_name"
+SAMPLE_COLUMNS = ["country_name", "violation", "driver_gender", "driver_race", "driver_age", "stop_duration",
+                  "stop_date", "search_conducted", "is_arrested", "drugs_related_stop"]
+RATE_DIMENSIONS = ["country_name", "violation", "driver_gender", "driver_race", "stop_duration", "age_group"]
+RATE_MEASURES = [measure for measure, column in MEASURES.items() if column is not None]
+TOP_MEASURES = list(MEASURES)
+
+# Columns with a distinct-count sketch
+SKETCH_COLUMNS = ["violation", "vehicle_number", "country_name", "driver_race", "search_type"]
+
+# 2**14 registers: about 0.8% standard error, 16 KB per column
+HLL_PRECISION = 14
+# Count-min sketch per measure: an overcount of at most e / width of all counted stops,
+# with probability 1 - e**-depth
+CMS_DEPTH = 4
+CMS_WIDTH = 2 ** 16
+# Candidate plates tracked per measure for the top-N lists
+HEAVY_HITTERS = 1000
+# pandas hash keys are 16 characters; one per count-min row
+CMS_KEYS = [f"securecheck-cms{i}" for i in range(CMS_DEPTH)]
+
+# Rows of an in-memory ledger folded in at a time
+LOAD_CHUNKSIZE = 1_000_000
+
+SOURCE_QUERY = f"""SELECT stop_id, vehicle_number, search_type, {', '.join(SAMPLE_COLUMNS)}
+FROM traffic_stops
+WHERE stop_id > :low AND stop_id <= :high"""
+
+# Block sample used while the synopsis is still being built: SYSTEM reads only the sampled
+# pages, so it is fast at any size, but rows stored together are sampled together and the
+# intervals come out somewhat too narrow on clustered data
+QUICK_SAMPLE_QUERY = f"""SELECT {', '.join(SAMPLE_COLUMNS)}
+FROM traffic_stops TABLESAMPLE SYSTEM (:percent) REPEATABLE (:seed)"""
+
+# Exact counterparts of the approximate answers, run when the exact toggle is on
+AGE_GROUP_SQL = """case
+	when driver_age <= 18 then 'under18'
+	when driver_age <= 25 then '18-25'
+	when driver_age <= 35 then '26-35'
+	when driver_age <= 50 then '36-50'
+	when driver_age <= 65 then '51-65'
+	else '65+'
+end"""
+
+DISTINCT_QUERY = "SELECT COUNT(DISTINCT {column}) AS distinct_values FROM traffic_stops"
+
+TOP_QUERY = """SELECT vehicle_number, {count} AS {measure}
+FROM traffic_stops
+GROUP BY vehicle_number
+ORDER BY {measure} DESC, vehicle_number
+LIMIT {limit}"""
+
+RATE_QUERY = """SELECT {column} AS {by}, COUNT(*) AS stops, {count} AS {measure},
+    ROUND({count} * 100.0 / COUNT(*), 2) AS rate
+FROM traffic_stops
+GROUP BY 1
+ORDER BY 1"""
+
+
+def _count_sql(measure):
+    column = MEASURES[measure]
+    return "COUNT(*)" if column is None else f"COUNT(*) FILTER (WHERE {column})"
+
+
+def distinct_query(column):
+    if column not in SKETCH_COLUMNS:
+        raise ValueError(f"No distinct count for {column!r}")
+    return DISTINCT_QUERY.format(column=column)
+
+
+def top_query(measure, limit=10):
+    return TOP_QUERY.format(count=_count_sql(measure), measure=measure, limit=int(limit))
+
+
+def rate_query(by, measure):
+    if by not in RATE_DIMENSIONS:
+        raise ValueError(f"Cannot group rates by {by!r}")
+    column = AGE_GROUP_SQL if by == "age_group" else by
+    return RATE_QUERY.format(column=column, by=by, count=_count_sql(measure), measure=measure)
+
+
+def _flags(df, column):
+    if column is None:
+        return np.ones(len(df), dtype=bool)
+    if column not in df.columns:
+        return np.zeros(len(df), dtype=bool)
+    return df[column].fillna(False).to_numpy(dtype=bool)
+
+
+# Non-null values of a column as a plain object array, ready for hashing
+def _values(df, column):
+    if column not in df.columns:
+        return np.empty(0, dtype=object)
+    values = df[column].dropna()
+    return values.astype(str).to_numpy(dtype=object)
+
+
+# Number of significant bits of each unsigned 64-bit value
+def _bit_length(values):
+    length = np.zeros(len(values), dtype=np.int64)
+    for shift in (32, 16, 8, 4, 2, 1):
+        big = values >= (np.uint64(1) << np.uint64(shift))
+        length += shift * big
+        values = np.where(big, values >> np.uint64(shift), values)
+    return length + (values > 0)
+
+
+# Distinct count of everything added, to about 1.04 / sqrt(2**precision) relative standard error
+class HyperLogLog:
+    def __init__(self, precision=HLL_PRECISION):
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    def add(self, values):
+        if len(values) == 0:
+            return
+        hashes = pd.util.hash_array(values)
+        rest_bits = 64 - self.precision
+        index = (hashes >> np.uint64(rest_bits)).astype(np.int64)
+        rest = hashes & np.uint64((1 << rest_bits) - 1)
+        rank = (rest_bits - _bit_length(rest) + 1).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+
+    def relative_error(self):
+        return 1.04 / np.sqrt(len(self.registers))
+
+    def estimate(self):
+        m = len(self.registers)
+        raw = 0.7213 / (1 + 1.079 / m) * m * m / np.sum(np.exp2(-self.registers.astype(np.float64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * m and zeros:  # small ranges: linear counting is more accurate
+            return m * np.log(m / zeros)
+        return raw
+
+
+# Per-value counts that never undercount; overcounts are at most error() with high probability
+class CountMinSketch:
+    def __init__(self, depth=CMS_DEPTH, width=CMS_WIDTH):
+        self.width = width
+        self.table = np.zeros((depth, width), dtype=np.int64)
+        self.total = 0
+
+    def _columns(self, values):
+        return [(pd.util.hash_array(values, hash_key=key) % np.uint64(self.width)).astype(np.int64)
+                for key in CMS_KEYS[:len(self.table)]]
+
+    def add(self, values):
+        if len(values) == 0:
+            return
+        for row, columns in enumerate(self._columns(values)):
+            self.table[row] += np.bincount(columns, minlength=self.width)
+        self.total += len(values)
+
+    def estimate(self, values):
+        if len(values) == 0:
+            return np.zeros(0, dtype=np.int64)
+        return np.min([self.table[row][columns] for row, columns in enumerate(self._columns(values))], axis=0)
+
+    def error(self):
+        return np.e / self.width * self.total
+
+
+# Rows of a cleaned chunk kept in the sample, with categories as plain values (None for NULL)
+# so reservoirs built from different chunks concatenate cleanly
+def _sample_rows(df):
+    rows = pd.DataFrame(index=df.index)
+    for column in SAMPLE_COLUMNS:
+        if column not in df.columns:
+            rows[column] = pd.NA
+        elif isinstance(df[column].dtype, pd.CategoricalDtype):
+            rows[column] = df[column].astype(object).where(df[column].notna(), None)
+        else:
+            rows[column] = df[column]
+    return rows.reset_index(drop=True)
+
+
+# Rows of the sample that pass the insight filters
+def _filter_mask(df, filters):
+    mask = np.ones(len(df), dtype=bool)
+    for name, value in active_filters(filters).items():
+        column, comparison = FILTERS[name]
+        values = df[column]
+        if column == "stop_date":
+            values, value = pd.to_datetime(values, errors="coerce"), pd.Timestamp(value)
+        if comparison == "=":
+            mask &= (values == value).fillna(False).to_numpy(dtype=bool)
+        elif comparison == ">=":
+            mask &= (values >= value).fillna(False).to_numpy(dtype=bool)
+        else:
+            mask &= (values <= value).fillna(False).to_numpy(dtype=bool)
+    return mask
+
+
+# Sample variance of a 0/1 variable with `ones` ones among n values
+def _binary_variance(ones, n):
+    return np.where(n > 1, (ones - ones * ones / n) / np.maximum(n - 1, 1), 0.0)
+
+
+# Small synopses of the ledger for approximate exploration: a stratified reservoir sample
+# for rates and counts under any filter, HyperLogLog sketches for distinct counts and
+# count-min sketches with heavy-hitter candidates for the top vehicles. Built in one pass
+# over the ledger and extended as stops arrive, like the count cube. The ledger is read with
+# NULL categories kept, so NULL is neither a distinct value nor a group apart from SQL's.
+class Synopsis:
+    def __init__(self, sample_size, seed=0):
+        self.sample_size = sample_size
+        self.watermark = 0
+        self.refreshed_at = 0.0
+        self.offline = False
+        self.sketched = True
+        self.rows = 0
+        self._rng = np.random.default_rng(seed)
+        self._reservoirs = {}  # stratum -> sampled rows
+        self._population = {}  # stratum -> stops seen
+        self._sample = None  # every reservoir together, built on the first read after a change
+        self._distinct = {column: HyperLogLog() for column in SKETCH_COLUMNS}
+        self._counts = {measure: CountMinSketch() for measure in MEASURES}
+        self._candidates = {measure: pd.Index([], dtype=object) for measure in MEASURES}
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+    # Algorithm R over one stratum's new rows. Every row gets its arrival number; the first
+    # sample_size fill the reservoir and row t (0-based) then replaces a random slot with
+    # probability sample_size / (t + 1). Within a chunk the last row to draw a slot keeps it.
+    def _reservoir_add(self, stratum, rows):
+        seen = self._population.get(stratum, 0)
+        current = self._reservoirs.get(stratum)
+        arrival = seen + np.arange(len(rows))
+        fill = arrival < self.sample_size
+        if fill.any():
+            current = rows[fill] if current is None else pd.concat([current, rows[fill]], ignore_index=True)
+        later = np.flatnonzero(~fill)
+        if len(later):
+            slots = self._rng.integers(0, arrival[later] + 1)
+            drawn = slots < self.sample_size
+            slots, later = slots[drawn][::-1], later[drawn][::-1]
+            slots, last = np.unique(slots, return_index=True)
+            if len(slots):
+                kept = np.ones(len(current), dtype=bool)
+                kept[slots] = False
+                current = pd.concat([current[kept], rows.iloc[later[last]]], ignore_index=True)
+        self._reservoirs[stratum] = current
+        self._population[stratum] = seen + len(rows)
+
+    def _sketch(self, df):
+        for column, sketch in self._distinct.items():
+            sketch.add(_values(df, column))
+        if "vehicle_number" not in df.columns:
+            return
+        plates = df["vehicle_number"].astype(str).to_numpy(dtype=object)
+        present = df["vehicle_number"].notna().to_numpy()
+        for measure, column in MEASURES.items():
+            counted = plates[present & _flags(df, column)]
+            sketch = self._counts[measure]
+            sketch.add(counted)
+            # Plates counted in this chunk compete with the current candidates for a place
+            candidates = self._candidates[measure].append(pd.Index(pd.unique(counted))).unique()
+            estimates = pd.Series(sketch.estimate(candidates.to_numpy(dtype=object)), index=candidates)
+            self._candidates[measure] = estimates.nlargest(HEAVY_HITTERS).index
+
+    # Fold a cleaned ledger chunk into the sample and the sketches
+    def add_frame(self, df):
+        if df.empty:
+            return 0
+        rows = _sample_rows(df)
+        strata = rows[STRATUM].fillna("Unknown")
+        with self._lock:
+            for stratum, positions in strata.groupby(strata, sort=False).indices.items():
+                self._reservoir_add(stratum, rows.iloc[positions])
+            self._sketch(df)
+            self._sample = None
+            self.rows += len(df)
+            if "stop_id" in df.columns:
+                self.watermark = max(self.watermark, int(df["stop_id"].max()))
+        return len(df)
+
+    # Build from a cleaned in-memory ledger (the local snapshot) instead of the database
+    def load_frame(self, df):
+        self.offline = True
+        for start in range(0, len(df), LOAD_CHUNKSIZE):
+            self.add_frame(df.iloc[start:start + LOAD_CHUNKSIZE])
+        self.refreshed_at = time.monotonic()
+        return self.rows
+
+    # A sample drawn elsewhere (a TABLESAMPLE block sample) standing for `population` stops,
+    # as a single stratum and without sketches
+    def load_sample(self, df, population):
+        with self._lock:
+            self._reservoirs = {"ledger": _sample_rows(df)}
+            self._population = {"ledger": max(int(population), len(df))}
+            self._sample = None
+            self.sketched = False
+            self.offline = True
+            self.rows = len(df)
+        self.refreshed_at = time.monotonic()
+        return self.rows
+
+    # Fold in stops committed since the last refresh (the first call reads the whole ledger).
+    # Waiting on the rollup lock means no writer still holds a stop_id below the new watermark.
+    def refresh(self):
+        with self._refresh_lock:
+            with db.connect() as conn, conn.begin():
+                conn.execute(text(f"SELECT pg_advisory_xact_lock({ROLLUP_LOCK_KEY})"))
+                high = conn.execute(text("SELECT COALESCE(MAX(stop_id), 0) FROM traffic_stops")).scalar()
+            added = 0
+            if high > self.watermark:
+                for chunk in iter_clean_chunks(SOURCE_QUERY, params={"low": self.watermark, "high": high},
+                                               fill_unknown=False):
+                    added += self.add_frame(chunk)
+                self.watermark = high
+            self.refreshed_at = time.monotonic()
+            return added
+
+    def refresh_if_stale(self, max_age=30):
+        if not self.offline and time.monotonic() - self.refreshed_at >= max_age:
+            self.refresh()
+
+    # The whole sample with a stratum column, and the population of every stratum
+    def _snapshot(self):
+        with self._lock:
+            if self._sample is None:
+                self._sample = (pd.concat(self._reservoirs, names=["stratum"]).reset_index(level=0)
+                                if self._reservoirs else pd.DataFrame(columns=["stratum"] + SAMPLE_COLUMNS))
+            return self._sample, dict(self._population)
+
+    # Estimated stops per group and, for a measure other than stops, how many of them had it
+    # and the rate in percent; every estimate with a 95% confidence interval. Filters are the
+    # insight filters. Stratum totals are scaled up by population / sampled, and the variance
+    # is the stratified one with the finite population correction, so strata sampled in full
+    # contribute no error. Rates are ratio estimates (linearized variance).
+    def rates(self, by, measure="arrests", filters=None):
+        if by not in RATE_DIMENSIONS:
+            raise ValueError(f"Cannot group rates by {by!r}")
+        sample, population = self._snapshot()
+        if sample.empty:
+            return pd.DataFrame(columns=[by, "stops", "stops_low", "stops_high"])
+        groups = age_group(sample["driver_age"].to_numpy()) if by == "age_group" else sample[by].to_numpy(dtype=object)
+        mask = _filter_mask(sample, filters)
+        flag = _flags(sample, MEASURES[measure]) & mask
+        cells = pd.DataFrame({"stratum": sample["stratum"].to_numpy(), "group": groups,
+                              "x": mask.astype(np.int64), "y": flag.astype(np.int64)})[mask]
+        cells = cells.groupby(["stratum", "group"], sort=False, dropna=False)[["x", "y"]].sum().reset_index()
+        sampled = sample["stratum"].value_counts()
+        n = cells["stratum"].map(sampled).to_numpy(dtype=np.float64)
+        N = cells["stratum"].map(population).to_numpy(dtype=np.float64)
+        scale = N * N * (1 - n / N) / n
+        x, y = cells["x"].to_numpy(dtype=np.float64), cells["y"].to_numpy(dtype=np.float64)
+        cells = cells.assign(stops=N / n * x, hits=N / n * y,
+                             var_stops=scale * _binary_variance(x, n), var_hits=scale * _binary_variance(y, n))
+        totals = cells.groupby("group", sort=True, dropna=False)[["x", "stops", "hits", "var_stops", "var_hits"]].sum()
+
+        result = pd.DataFrame({by: totals.index.to_numpy(dtype=object)})
+        result["stops"] = totals["stops"].round().astype("int64").to_numpy()
+        stops_margin = Z_95 * np.sqrt(totals["var_stops"].to_numpy())
+        result["stops_low"] = np.maximum(totals["stops"].to_numpy() - stops_margin, 0).round().astype("int64")
+        result["stops_high"] = (totals["stops"].to_numpy() + stops_margin).round().astype("int64")
+        if MEASURES[measure] is not None:
+            # Residuals z = y - R x of every sampled row of the stratum, for the ratio's variance
+            ratio = totals["hits"] / totals["stops"]
+            R = cells["group"].map(ratio).to_numpy(dtype=np.float64)
+            sum_z2 = y * (1 - R) ** 2 + (x - y) * R ** 2
+            mean_z = (y - R * x) / n
+            var_z = np.where(n > 1, (sum_z2 - n * mean_z ** 2) / np.maximum(n - 1, 1), 0.0)
+            var_ratio = pd.Series(scale * var_z).groupby(cells["group"].to_numpy(), sort=True, dropna=False).sum()
+            rate_margin = Z_95 * np.sqrt(var_ratio.to_numpy()) / totals["stops"].to_numpy()
+            result[measure] = totals["hits"].round().astype("int64").to_numpy()
+            result["rate"] = np.round(ratio.to_numpy() * 100, 2)
+            result["rate_low"] = np.round(np.clip(ratio.to_numpy() - rate_margin, 0, 1) * 100, 2)
+            result["rate_high"] = np.round(np.clip(ratio.to_numpy() + rate_margin, 0, 1) * 100, 2)
+        result["sampled"] = totals["x"].astype("int64").to_numpy()
+        return result
+
+    # Distinct values of a column with a 95% interval, or None without a sketch for it
+    def distinct(self, column):
+        if not self.sketched or column not in self._distinct:
+            return None
+        sketch = self._distinct[column]
+        with self._lock:
+            estimate = sketch.estimate()
+        margin = Z_95 * sketch.relative_error() * estimate
+        return {"estimate": int(round(estimate)), "low": int(max(round(estimate - margin), 0)),
+                "high": int(round(estimate + margin))}
+
+    # Vehicles with the most stops, searches, arrests or drug stops. The count-min estimate is
+    # an upper bound; the lower bound subtracts the sketch's overcount bound. None without sketches.
+    def top_vehicles(self, measure="searches", limit=10):
+        if not self.sketched:
+            return None
+        sketch = self._counts[measure]
+        with self._lock:
+            candidates = self._candidates[measure].to_numpy(dtype=object)
+            estimates = sketch.estimate(candidates)
+            error = sketch.error()
+        top = pd.DataFrame({"vehicle_number": candidates, measure: estimates})
+        top = top[top[measure] > 0].sort_values([measure, "vehicle_number"], ascending=[False, True]).head(limit)
+        top[f"{measure}_low"] = np.maximum(top[measure] - np.floor(error), 0).astype("int64")
+        return top.reset_index(drop=True)
+
+    def stats(self):
+        sample, population = self._snapshot()
+        return {"rows": self.rows, "sampled": len(sample), "strata": len(population), "watermark": self.watermark,
+                "sketched": self.sketched}
+
+
+def approx_enabled():
+    return db.setting("approx_mode").strip().lower() in ("1", "true", "yes", "on")
+
+
+_synopsis = None
+_synopsis_lock = threading.Lock()
+_quick = None
+_quick_lock = threading.Lock()
+
+
+# Process-wide synopsis, built on first use from the database, or from a cleaned in-memory
+# ledger when one is given
+def get_synopsis(ledger=None):
+    global _synopsis
+    if _synopsis is None:
+        with _synopsis_lock:
+            if _synopsis is None:
+                synopsis = Synopsis(int(db.setting("approx_sample_size")))
+                if ledger is not None:
+                    synopsis.load_frame(ledger)
+                else:
+                    synopsis.refresh()
+                _synopsis = synopsis
+    return _synopsis
+
+
+# Stops in the ledger from the planner estimate, or from the stop_id key while a table has
+# not been analyzed yet; neither needs a scan
+def _ledger_size():
+    estimate = db.fetch_data(ESTIMATE_QUERY)
+    if not estimate.empty and pd.notna(estimate["lowest"].iloc[0]) and estimate["lowest"].iloc[0] >= 0:
+        return int(estimate["n"].iloc[0])
+    high = db.fetch_data("SELECT COALESCE(MAX(stop_id), 0) AS n FROM traffic_stops")
+    return int(high["n"].iloc[0]) if not high.empty else 0
+
+
+# A TABLESAMPLE block sample of about approx_quick_rows stops, for answers while the full
+# synopsis is still being built; drawn once per process
+def get_quick_synopsis(seed=0):
+    global _quick
+    if _quick is None:
+        with _quick_lock:
+            if _quick is None:
+                population = _ledger_size()
+                wanted = int(db.setting("approx_quick_rows"))
+                percent = min(100.0, wanted * 100.0 / population) if population > 0 else 100.0
+                sample = db.fetch_data(QUICK_SAMPLE_QUERY, {"percent": percent, "seed": seed})
+                synopsis = Synopsis(len(sample), seed)
+                synopsis.load_sample(clean_chunk(sample, fill_unknown=False), population)
+                _quick = synopsis
+    return _quick
+
+
+def format_interval(estimate, low, high):
+    return f"{estimate:,} (95% CI {low:,} – {high:,})"
+
+
+# Command line: python -m securecheck.approx rates --by country_name --measure drug_stops
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Approximate answers from the ledger synopsis")
+    sub = parser.add_subparsers(dest="command", required=True)
+    rates = sub.add_parser("rates", help="estimated stops and rate per group")
+    rates.add_argument("--by", choices=RATE_DIMENSIONS, default="country_name")
+    rates.add_argument("--measure", choices=RATE_MEASURES, default="arrests")
+    distinct = sub.add_parser("distinct", help="estimated distinct values of a column")
+    distinct.add_argument("column", choices=SKETCH_COLUMNS)
+    top = sub.add_parser("top", help="vehicles with the most stops, searches, arrests or drug stops")
+    top.add_argument("--measure", choices=TOP_MEASURES, default="searches")
+    top.add_argument("--limit", type=int, default=10)
+    args = parser.parse_args()
+    started = time.perf_counter()
+    synopsis = get_synopsis()
+    print(f"synopsis of {synopsis.rows:,} stops built in {time.perf_counter() - started:.1f}s")
+    started = time.perf_counter()
+    if args.command == "rates":
+        print(synopsis.rates(args.by, args.measure).to_string(index=False))
+    elif args.command == "distinct":
+        found = synopsis.distinct(args.column)
+        print(f"{args.column}: {format_interval(found['estimate'], found['low'], found['high'])}")
+    else:
+        print(synopsis.top_vehicles(args.measure, args.limit).to_string(index=False))
+    print(f"answered in {(time.perf_counter() - started) * 1000:.1f} ms")
@@ -0,0 +1,206 @@
+import re
+import threading
+import time
+
+from securecheck import db
+from securecheck.cache import fetch_cached
+from securecheck.instrument import record_query
+from securecheck.loader import iter_chunks
+from securecheck.queries import COMPLEX_QUERIES, MEDIUM_QUERIES
+from securecheck.rollups import insight_queries, refresh_if_stale
+
+try:
+    import duckdb
+except ImportError:  # the embedded engine is optional
+    duckdb = None
+
+
+# PostgreSQL TO_CHAR template patterns and their strftime equivalents, longest first
+_TO_CHAR_PATTERNS = [
+    ("Month", "%B"), ("Mon", "%b"), ("Day", "%A"), ("Dy", "%a"),
+    ("YYYY", "%Y"), ("HH24", "%H"), ("HH12", "%I"), ("MM", "%m"), ("DD", "%d"),
+    ("MI", "%M"), ("SS", "%S"), ("AM", "%p"), ("PM", "%p"),
+]
+
+
+def _to_strftime(template):
+    pattern = re.compile("|".join(re.escape(token) for token, _ in _TO_CHAR_PATTERNS))
+    mapping = dict(_TO_CHAR_PATTERNS)
+    return pattern.sub(lambda m: mapping[m.group(0)], template)
+
+
+# Rewrite every call NAME(args...) in sql with rewrite(list of top-level argument strings)
+def _rewrite_calls(sql, name, rewrite):
+    pattern = re.compile(rf"\b{name}\s*\(", re.IGNORECASE)
+    out, pos = [], 0
+    for match in pattern.finditer(sql):
+        if match.start() < pos:
+            continue
+        depth, args, start, i = 1, [], match.end(), match.end()
+        while i < len(sql) and depth:
+            char = sql[i]
+            if char == "'":
+                i = sql.index("'", i + 1)
+            elif char == "(":
+                depth += 1
+            elif char == ")":
+                depth -= 1
+            elif char == "," and depth == 1:
+                args.append(sql[start:i].strip())
+                start = i + 1
+            i += 1
+        args.append(sql[start:i - 1].strip())
+        out.append(sql[pos:match.start()])
+        out.append(rewrite(args))
+        pos = i
+    out.append(sql[pos:])
+    return "".join(out)
+
+
+def _duckdb_to_char(args):
+    value, template = args
+    if template.startswith("'") and template.endswith("'"):
+        formatted = f"strftime({value}, '{_to_strftime(template[1:-1])}')"
+        # Postgres blank-pads a bare Month/Day to nine characters
+        return f"rpad({formatted}, 9, ' ')" if template in ("'Month'", "'Day'") else formatted
+    raise ValueError(f"Cannot translate TO_CHAR with a non-literal template: {template}")
+
+
+# Translate the Postgres SQL used by the insights into another engine's dialect
+def translate(sql, dialect):
+    if dialect == "postgresql":
+        return sql
+    if dialect == "duckdb":
+        sql = _rewrite_calls(sql, "TO_CHAR", _duckdb_to_char)
+        return db.BIND_PARAM.sub(r"$\1", sql)
+    raise ValueError(f"Unknown SQL dialect {dialect!r}")
+
+
+# The PostgreSQL ledger: insights read the rollups and go through the result cache
+class PostgresBackend:
+    name = "PostgreSQL"
+    dialect = "postgresql"
+
+    def insight_queries(self, filters=None):
+        return insight_queries(use_rollups=True, filters=filters)
+
+    # Parameterized queries go through prepared statements so each filter change reuses the plan
+    def run(self, query, params=None):
+        return fetch_cached(query, params=params, prepared=bool(params))
+
+    # Fold newly logged stops into the rollups before insights read them
+    def before_insights(self):
+        refresh_if_stale()
+
+    def run_insight(self, query, params=None):
+        self.before_insights()
+        return self.run(query, params)
+
+    # Result in DataFrame chunks through a server-side cursor, for exports
+    def iter_chunks(self, query, params=None, chunksize=100_000):
+        return iter_chunks(query, chunksize, params)
+
+
+# In-process DuckDB over a local copy of the ledger (the Arrow snapshot, Parquet files or a
+# DataFrame). Exposes the same traffic_stops columns and types the Postgres queries expect.
+class DuckDBBackend:
+    name = "DuckDB"
+    dialect = "duckdb"
+
+    # The cleaning step stores stop_time as seconds since midnight; expose it as TIME again.
+    # Partition archives already hold TIME values and only need the date cast.
+    LEDGER_VIEW = """CREATE OR REPLACE VIEW traffic_stops AS
+SELECT * REPLACE (CAST(stop_date AS DATE) AS stop_date{stop_time})
+FROM {source}"""
+    SECONDS_TO_TIME = ", make_time(stop_time // 3600, stop_time // 60 % 60, stop_time % 60) AS stop_time"
+
+    def __init__(self, source):
+        if duckdb is None:
+            raise RuntimeError("The embedded engine needs duckdb: pip install duckdb")
+        self._conn = duckdb.connect()
+        # A registered frame or Arrow table is visible only to the connection it is registered on,
+        # so every cursor registers it again (zero-copy) before querying
+        self._source = None if isinstance(source, str) else source
+        if isinstance(source, str):
+            relation = f"read_parquet('{source}', hive_partitioning = true)"
+        else:
+            self._conn.register("ledger_source", source)
+            relation = "ledger_source"
+        types = dict(row[:2] for row in self._conn.execute(f"DESCRIBE SELECT * FROM {relation}").fetchall())
+        stop_time = "" if types.get("stop_time", "").startswith("TIME") else self.SECONDS_TO_TIME
+        self._conn.execute(self.LEDGER_VIEW.format(source=relation, stop_time=stop_time))
+
+    @classmethod
+    def from_snapshot(cls, directory=None):
+        from securecheck.snapshot import load_table
+        table = load_table(directory)
+        if table is None:
+            raise RuntimeError("The local snapshot is empty; run python -m securecheck.snapshot first")
+        return cls(table)
+
+    # The plain ledger queries: columnar scans make the rollups unnecessary here
+    def insight_queries(self, filters=None):
+        return dict(MEDIUM_QUERIES), dict(COMPLEX_QUERIES)
+
+    # One cursor per call keeps concurrent callers apart
+    def _cursor(self):
+        cursor = self._conn.cursor()
+        if self._source is not None:
+            cursor.register("ledger_source", self._source)
+        return cursor
+
+    def run(self, query, params=None):
+        cursor = self._cursor()
+        started = time.perf_counter()
+        try:
+            cursor.execute(translate(query, self.dialect), params or {})
+            executed = time.perf_counter()
+            df = cursor.df()
+            record_query(query, params, executed - started, time.perf_counter() - executed, df, engine=self.dialect)
+            return df
+        except Exception as e:
+            record_query(query, params, time.perf_counter() - started, 0.0, error=str(e), engine=self.dialect)
+            raise
+        finally:
+            cursor.close()
+
+    # Result in DataFrame chunks from DuckDB's Arrow record batch reader, for exports
+    def iter_chunks(self, query, params=None, chunksize=100_000):
+        cursor = self._cursor()
+        try:
+            cursor.execute(translate(query, self.dialect), params or {})
+            # to_arrow_reader replaces fetch_record_batch in newer DuckDB releases
+            reader = cursor.to_arrow_reader(chunksize) if hasattr(cursor, "to_arrow_reader") else cursor.fetch_record_batch(chunksize)
+            for batch in reader:
+                yield batch.to_pandas()
+        finally:
+            cursor.close()
+
+    def before_insights(self):
+        pass
+
+    def run_insight(self, query, params=None):
+        return self.run(query, params)
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+# Process-wide query backend chosen by the query_backend setting ("postgres" or "duckdb");
+# defaults to DuckDB when the app runs from the snapshot. DuckDB reads the Parquet files named
+# by embedded_source, or the snapshot when that is empty.
+def get_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                choice = db.setting("query_backend")
+                if not choice:
+                    choice = "duckdb" if db.setting("data_source") == "snapshot" else "postgres"
+                if choice == "duckdb":
+                    source = db.setting("embedded_source")
+                    _backend = DuckDBBackend(source) if source else DuckDBBackend.from_snapshot()
+                else:
+                    _backend = PostgresBackend()
+    return _backend
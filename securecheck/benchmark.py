@@ -0,0 +1,233 @@
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from securecheck.approx import RATE_DIMENSIONS, SKETCH_COLUMNS, TOP_MEASURES, Synopsis
+from securecheck.backends import DuckDBBackend, PostgresBackend
+from securecheck.cache import result_cache
+from securecheck.cube import COMPLEX_ANSWERS, MEDIUM_ANSWERS, CountCube, answer_insight
+from securecheck.db import setting
+from securecheck.kpis import KPI_QUERY, essential_statistics, statistics_from_frame
+from securecheck.loader import clean_chunks, clean_data, iter_chunks, load_clean
+from securecheck.prediction import KEY_FIELDS, PredictionIndex
+from securecheck.report import plan_scan, shared_scan
+from securecheck.scoring import score_frame
+from securecheck.synthetic import iter_stops
+from securecheck.vehicles import VehicleLookup
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+
+DEFAULT_SIZES = [100_000, 1_000_000, 10_000_000, 50_000_000]
+DEFAULT_REPEATS = 5
+PERCENTILES = [50, 90, 95, 99]
+
+# clean_data needs the whole raw ledger in memory; above this size only the chunked path is timed
+CLEAN_DATA_MAX_ROWS = 10_000_000
+PREDICTION_LOOKUPS = 1_000
+PLATE_LOOKUPS = 1_000
+
+# A case regresses when its p50 or peak memory grows by more than the tolerance and by more
+# than these floors, so timer noise on millisecond queries is not reported
+DEFAULT_TOLERANCE = 0.25
+MIN_REGRESSION_MS = 5.0
+MIN_REGRESSION_MB = 1.0
+
+
+def _max_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _summary(timings, peak_bytes=None):
+    ms = np.array(timings) * 1000
+    summary = {f"p{p}_ms": float(np.percentile(ms, p)) for p in PERCENTILES}
+    summary.update({"mean_ms": float(ms.mean()), "min_ms": float(ms.min()), "max_ms": float(ms.max()),
+                    "runs": len(timings)})
+    if peak_bytes is not None:
+        summary["peak_mb"] = peak_bytes / (1024 * 1024)
+    return summary
+
+
+# Time fn over several runs, then run it once more under tracemalloc for peak Python/NumPy memory
+# (kept out of the timed runs because tracing slows allocation-heavy code down)
+def measure(fn, repeats=DEFAULT_REPEATS, before=None):
+    timings = []
+    for _ in range(repeats):
+        if before:
+            before()
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    if before:
+        before()
+    tracemalloc.start()
+    try:
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return _summary(timings, peak)
+
+
+# Per-call latency of the prediction lookup for stops drawn from the ledger
+def measure_lookups(predictor, ledger, lookups=PREDICTION_LOOKUPS, seed=0):
+    sample = ledger[KEY_FIELDS].sample(n=min(lookups, len(ledger)), replace=len(ledger) < lookups, random_state=seed)
+    timings = []
+    for row in sample.itertuples(index=False):
+        started = time.perf_counter()
+        predictor.predict(*row)
+        timings.append(time.perf_counter() - started)
+    return _summary(timings)
+
+
+# Per-call latency of uncached plate lookups for plates drawn from the ledger
+def measure_plate_lookups(lookup, ledger, lookups=PLATE_LOOKUPS, seed=0):
+    plates = ledger["vehicle_number"].dropna()
+    sample = plates.sample(n=min(lookups, len(plates)), replace=len(plates) < lookups, random_state=seed)
+    timings = []
+    for plate in sample:
+        started = time.perf_counter()
+        lookup.lookup(plate, use_cache=False)
+        timings.append(time.perf_counter() - started)
+    return _summary(timings)
+
+
+# Every case for one ledger: insight queries, the shared scan that replaces most of them in reports, KPIs,
+# cleaning, prediction (single and batch), the count cube, the approximate synopsis and plate lookups
+def run_cases(backend, ledger, raw=None, repeats=DEFAULT_REPEATS, before=None, kpis=None, plate_lookup=None):
+    results = {}
+    medium, complex_ = backend.insight_queries()
+    for group, queries in (("medium", medium), ("complex", complex_)):
+        for label, query in queries.items():
+            results[f"{group}: {label}"] = measure(lambda: backend.run_insight(query), repeats, before)
+            print(f"  {group}: {label}: {results[f'{group}: {label}']['p50_ms']:.1f} ms", flush=True)
+    shapes = list(plan_scan({label: answer for answers in (MEDIUM_ANSWERS, COMPLEX_ANSWERS)
+                             for label, answer in answers.items()}))
+    results["shared_scan"] = measure(lambda: shared_scan(backend, shapes), repeats, before)
+    results["kpis"] = measure(kpis or (lambda: backend.run(KPI_QUERY)), repeats, before)
+    results["kpis_from_frame"] = measure(lambda: statistics_from_frame(ledger), repeats)
+    if raw is not None:
+        results["clean_data"] = measure(lambda: clean_data(raw), repeats)
+    results["prediction_index_build"] = measure(lambda: PredictionIndex().load_frame(ledger), repeats)
+    predictor = PredictionIndex()
+    predictor.load_frame(ledger)
+    results["prediction_lookup"] = measure_lookups(predictor, ledger)
+    results["batch_scoring"] = measure(lambda: score_frame(ledger[KEY_FIELDS], predictor), repeats)
+    results["count_cube_build"] = measure(lambda: CountCube().load_frame(ledger), repeats)
+    cube = CountCube()
+    cube.load_frame(ledger)
+    results["count_cube_answers"] = measure(
+        lambda: [answer_insight(cube, group, label) for group, queries in (("medium", medium), ("complex", complex_))
+                 for label in queries], repeats)
+    sample_size = int(setting("approx_sample_size"))
+    results["approx_synopsis_build"] = measure(lambda: Synopsis(sample_size).load_frame(ledger), repeats)
+    synopsis = Synopsis(sample_size)
+    synopsis.load_frame(ledger)
+    results["approx_answers"] = measure(
+        lambda: ([synopsis.rates(by) for by in RATE_DIMENSIONS] + [synopsis.distinct(column) for column in SKETCH_COLUMNS]
+                 + [synopsis.top_vehicles(name) for name in TOP_MEASURES]), repeats)
+    if not ledger.empty:
+        results["vehicle_lookup"] = measure_plate_lookups(
+            plate_lookup or VehicleLookup(cache_size=0, cache_ttl=0, frame=ledger), ledger)
+    return results
+
+
+# Synthetic ledgers of each size on the embedded engine; needs no database
+def benchmark_embedded(sizes, repeats=DEFAULT_REPEATS, seed=0):
+    runs = {}
+    for rows in sizes:
+        print(f"{rows:,} rows", flush=True)
+        started = time.perf_counter()
+        raw = pd.concat(iter_stops(rows, seed=seed), ignore_index=True) if rows <= CLEAN_DATA_MAX_ROWS else None
+        ledger = clean_chunks([raw] if raw is not None else iter_stops(rows, seed=seed))
+        generated = time.perf_counter() - started
+        backend = DuckDBBackend(ledger)
+        runs[str(rows)] = {"rows": rows, "generate_seconds": generated,
+                           "cases": run_cases(backend, ledger, raw, repeats), "max_rss_mb": _max_rss_mb()}
+        del raw, ledger, backend
+    return runs
+
+
+# The configured PostgreSQL ledger as it is; the result cache is cleared before every run
+def benchmark_database(repeats=DEFAULT_REPEATS):
+    ledger = load_clean()
+    rows = len(ledger)
+    raw = pd.concat(iter_chunks(), ignore_index=True) if rows <= CLEAN_DATA_MAX_ROWS else None
+    print(f"{rows:,} rows", flush=True)
+    cases = run_cases(PostgresBackend(), ledger, raw, repeats, before=result_cache.clear,
+                      kpis=essential_statistics, plate_lookup=VehicleLookup(cache_size=0, cache_ttl=0))
+    return {str(rows): {"rows": rows, "cases": cases, "max_rss_mb": _max_rss_mb()}}
+
+
+def run_benchmark(backend="duckdb", sizes=DEFAULT_SIZES, repeats=DEFAULT_REPEATS, seed=0):
+    runs = benchmark_database(repeats) if backend == "postgres" else benchmark_embedded(sizes, repeats, seed)
+    return {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "backend": backend,
+        "repeats": repeats,
+        "seed": seed,
+        "environment": {"python": platform.python_version(), "platform": platform.platform(),
+                        "pandas": pd.__version__, "numpy": np.__version__},
+        "sizes": runs,
+    }
+
+
+# Cases that got slower or hungrier than the baseline; only sizes and cases present in both count
+def compare(current, baseline, tolerance=DEFAULT_TOLERANCE):
+    regressions = []
+    for size, run in current["sizes"].items():
+        base_cases = baseline.get("sizes", {}).get(size, {}).get("cases", {})
+        for case, stats in run["cases"].items():
+            base = base_cases.get(case)
+            if not base:
+                continue
+            for metric, floor in (("p50_ms", MIN_REGRESSION_MS), ("peak_mb", MIN_REGRESSION_MB)):
+                if metric in stats and metric in base:
+                    now, before = stats[metric], base[metric]
+                    if now > before * (1 + tolerance) and now - before > floor:
+                        regressions.append({"size": size, "case": case, "metric": metric,
+                                            "baseline": before, "current": now, "change": now / before - 1 if before else None})
+    return regressions
+
+
+def format_regression(regression):
+    change = f"{regression['change']:+.0%}" if regression["change"] is not None else "new"
+    return (f"{int(regression['size']):,} rows  {regression['case']}  {regression['metric']}: "
+            f"{regression['baseline']:.1f} -> {regression['current']:.1f} ({change})")
+
+
+# Command line: python -m securecheck.benchmark --sizes 100000 1000000 --out bench.json --baseline baseline.json
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the SecureCheck queries, KPIs, cleaning and prediction")
+    parser.add_argument("--backend", choices=["duckdb", "postgres"], default="duckdb",
+                        help="duckdb: synthetic ledgers in process; postgres: the configured database as it is")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--repeats", type=int, default=DEFAULT_REPEATS)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="save results as JSON")
+    parser.add_argument("--baseline", help="JSON results to compare against; exits 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args()
+    results = run_benchmark(args.backend, args.sizes, args.repeats, args.seed)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {format_regression(regression)}")
+        print(f"{len(regressions)} regression(s) against {args.baseline}")
+        sys.exit(1 if regressions else 0)
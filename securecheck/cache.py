@@ -0,0 +1,143 @@
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+
+from securecheck import db
+from securecheck.filters import tables_read
+from securecheck.instrument import normalize_sql
+
+
+# In-process write counters, bumped by anything in this process that writes to a table
+_local_versions = {}
+# Last server-side write counter per table: (value, fetched_at)
+_server_versions = {}
+_version_lock = threading.Lock()
+
+
+# Tables a query reads from, used to scope invalidation: only real relations (the ledger and
+# the rollups), never a column after EXTRACT(... FROM ...) or a CTE name
+def referenced_tables(query):
+    return frozenset(tables_read(query))
+
+
+# Writes counted by the statistics collector, summed over the leaves of the table's partition
+# tree: a partitioned parent's own counters never move. A plain table is its own single leaf.
+VERSION_QUERY = """SELECT SUM(s.n_tup_ins + s.n_tup_upd + s.n_tup_del) AS writes
+FROM pg_partition_tree(to_regclass(:table)) AS t
+JOIN pg_stat_user_tables AS s ON s.relid = t.relid
+WHERE t.isleaf"""
+
+
+# Server-side write counter for a table, polled at most once per version_poll seconds
+def _server_version(table):
+    poll = float(db.setting("version_poll"))
+    now = time.monotonic()
+    cached = _server_versions.get(table)
+    if cached and now - cached[1] < poll:
+        return cached[0]
+    marker = db.fetch_data(VERSION_QUERY, params={"table": table})
+    value = int(marker["writes"].iloc[0]) if not marker.empty and pd.notna(marker["writes"].iloc[0]) else None
+    _server_versions[table] = (value, now)
+    return value
+
+
+# Version marker for a table: local writes plus the server's write counter
+def table_version(table):
+    with _version_lock:
+        local = _local_versions.get(table, 0)
+    return (local, _server_version(table))
+
+
+# Record a write to a table and drop every cached result that depends on it
+def notify_write(table):
+    table = table.lower()
+    with _version_lock:
+        _local_versions[table] = _local_versions.get(table, 0) + 1
+        _server_versions.pop(table, None)
+    result_cache.invalidate_table(table)
+
+
+# TTL + memory-bounded LRU cache of query results (pandas DataFrames)
+class ResultCache:
+    def __init__(self, ttl_seconds, max_bytes):
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (df, tables, size, expires_at)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[3] < time.monotonic():
+                if entry is not None:
+                    self._drop(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, df, tables):
+        size = int(df.memory_usage(deep=True).sum())
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (df, tables, size, time.monotonic() + self.ttl_seconds)
+            self._bytes += size
+            # Evict least recently used entries until we are back under budget
+            while self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate_table(self, table):
+        with self._lock:
+            for key in [k for k, entry in self._entries.items() if table in entry[1]]:
+                self._drop(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _drop(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry[2]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+result_cache = ResultCache(
+    ttl_seconds=float(db.setting("cache_ttl")),
+    max_bytes=int(float(db.setting("cache_max_mb")) * 1024 * 1024),
+)
+
+
+# fetch_data (or fetch_prepared) with result caching keyed on normalized SQL, params and
+# table versions. Cached frames are shared between callers, so treat them as read-only.
+def fetch_cached(query, params=None, prepared=False):
+    tables = referenced_tables(query)
+    versions = tuple(sorted((table, table_version(table)) for table in tables))
+    key = (normalize_sql(query), tuple(sorted((params or {}).items())), versions)
+    df = result_cache.get(key)
+    if df is not None:
+        return df
+    df = db.fetch_prepared(query, params=params) if prepared else db.fetch_data(query, params=params)
+    if not df.empty:
+        result_cache.put(key, df, tables)
+    return df
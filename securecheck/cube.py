@@ -0,0 +1,472 @@
+import calendar
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+from securecheck import db
+from securecheck.loader import iter_clean_chunks
+from securecheck.rollups import ROLLUP_LOCK_KEY
+
+
+# Dimensions of the count cube. Values are coded 0..n-1 in order of first appearance;
+# a missing value (NULL) is a value of its own, like a GROUP BY key. The ledger is read with
+# NULL categories kept; a cleaned snapshot already holds 'Unknown' instead, as does SQL over it.
+DIMENSIONS = ["country_name", "violation", "driver_gender", "driver_race", "driver_age", "stop_duration",
+              "stop_year", "stop_month", "stop_hour"]
+
+# Every cell counts the same measures; None means "every stop"
+MEASURES = {
+    "stops": None,
+    "searches": "search_conducted",
+    "arrests": "is_arrested",
+    "drug_stops": "drugs_related_stop",
+}
+
+# Dense sub-cubes over the dimension combinations the insights group by (the in-memory
+# counterpart of the rollup tables). A roll-up reads the smallest sub-cube holding its dimensions.
+CUBES = {
+    "country_year": ["country_name", "stop_year"],
+    "time": ["stop_year", "stop_month", "stop_hour"],
+    "demographics": ["country_name", "driver_gender", "driver_race", "driver_age"],
+    "violations": ["violation", "country_name", "driver_race", "driver_age", "stop_duration"],
+}
+
+# Columns read from the ledger to build or extend the cube
+SOURCE_QUERY = """SELECT stop_id, country_name, violation, driver_gender, driver_race, driver_age, stop_duration,
+    stop_date, stop_time, search_conducted, is_arrested, drugs_related_stop
+FROM traffic_stops
+WHERE stop_id > :low AND stop_id <= :high"""
+
+DURATION_MINUTES = {"0-15 Min": 15, "16-30 Min": 30, "30+ Min": 45}
+
+
+# Raised by a roll-up whose dimensions no sub-cube holds together
+class MissingDimension(LookupError):
+    pass
+
+
+# Values of one dimension for a cleaned ledger chunk; missing columns are all NULL
+def _dimension_values(df, dim):
+    if dim in ("stop_year", "stop_month"):
+        if "stop_date" not in df.columns:
+            return pd.Series(pd.NA, index=df.index)
+        dates = pd.to_datetime(df["stop_date"], errors="coerce")
+        return (dates.dt.year if dim == "stop_year" else dates.dt.month).astype("Int64")
+    if dim == "stop_hour":
+        if "stop_time" not in df.columns:
+            return pd.Series(pd.NA, index=df.index)
+        return (df["stop_time"].astype("Int64") // 3600).astype("Int64")
+    if dim not in df.columns:
+        return pd.Series(pd.NA, index=df.index)
+    if dim == "driver_age":
+        return df[dim].astype("Int64")
+    return df[dim].astype("object")
+
+
+def _flag(df, column):
+    if column not in df.columns:
+        return np.zeros(len(df), dtype=bool)
+    return df[column].fillna(False).to_numpy(dtype=bool)
+
+
+def _plain(value):
+    return value.item() if hasattr(value, "item") else value
+
+
+# A where condition as a predicate over dimension values: a callable, a (low, high) range
+# (inclusive, None for open), a list of values, or a single value. NULL never matches.
+def predicate(condition):
+    if callable(condition):
+        return condition
+    if isinstance(condition, tuple):
+        low, high = condition
+        return lambda v: v is not None and (low is None or v >= low) and (high is None or v <= high)
+    if isinstance(condition, (list, set, frozenset)):
+        return lambda v: v in condition
+    return lambda v: v == condition
+
+
+# Counts of stops, searches, arrests and drug stops over the dashboard's categorical dimensions,
+# held as NumPy integer arrays indexed by dimension codes. Built in one pass over the ledger
+# and extended in place as stops arrive.
+class CountCube:
+    def __init__(self):
+        self.watermark = 0
+        self.refreshed_at = 0.0
+        self.offline = False
+        self.rows = 0
+        self._values = {dim: [] for dim in DIMENSIONS}  # code -> value
+        self._codes = {dim: {} for dim in DIMENSIONS}  # value -> code
+        self._arrays = {name: np.zeros((0,) * len(dims) + (len(MEASURES),), dtype=np.int64)
+                        for name, dims in CUBES.items()}
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+    # Codes for a column, adding values not seen before to the dimension
+    def _encode(self, dim, values):
+        inverse, uniques = pd.factorize(values, use_na_sentinel=True)
+        codes = self._codes[dim]
+        mapping = []
+        for value in list(uniques) + [None]:  # the last slot is where the -1 (NULL) sentinel lands
+            value = None if value is None or pd.isna(value) else _plain(value)
+            if value not in codes:
+                codes[value] = len(self._values[dim])
+                self._values[dim].append(value)
+            mapping.append(codes[value])
+        return np.asarray(mapping, dtype=np.int64)[inverse]
+
+    # Pad a sub-cube along any dimension that gained values since it was last grown
+    def _grow(self, name):
+        array = self._arrays[name]
+        wanted = tuple(len(self._values[dim]) for dim in CUBES[name])
+        if array.shape[:-1] != wanted:
+            padding = [(0, size - current) for size, current in zip(wanted, array.shape[:-1])] + [(0, 0)]
+            array = self._arrays[name] = np.pad(array, padding)
+        return array
+
+    # Count a cleaned ledger chunk into every sub-cube: one bincount per sub-cube and measure.
+    # Updated arrays replace the old ones, so a roll-up running meanwhile reads a consistent cube.
+    def add_frame(self, df):
+        if df.empty:
+            return 0
+        flags = {measure: None if column is None else _flag(df, column) for measure, column in MEASURES.items()}
+        with self._lock:
+            codes = {dim: self._encode(dim, _dimension_values(df, dim)) for dim in DIMENSIONS}
+            for name, dims in CUBES.items():
+                array = self._grow(name).copy()
+                shape = array.shape[:-1]
+                flat = np.ravel_multi_index([codes[dim] for dim in dims], shape)
+                size = int(np.prod(shape))
+                for i, selected in enumerate(flags.values()):
+                    cells = flat if selected is None else flat[selected]
+                    array[..., i] += np.bincount(cells, minlength=size).reshape(shape)
+                self._arrays[name] = array
+            self.rows += len(df)
+            if "stop_id" in df.columns:
+                self.watermark = max(self.watermark, int(df["stop_id"].max()))
+        return len(df)
+
+    # Build from a cleaned in-memory ledger (the local snapshot) instead of the database
+    def load_frame(self, df):
+        self.offline = True
+        self.add_frame(df)
+        self.refreshed_at = time.monotonic()
+        return self.rows
+
+    # Fold in stops committed since the last refresh (the first call reads the whole ledger).
+    # Waiting on the rollup lock means no writer still holds a stop_id below the new watermark.
+    def refresh(self):
+        with self._refresh_lock:
+            with db.connect() as conn, conn.begin():
+                conn.execute(text(f"SELECT pg_advisory_xact_lock({ROLLUP_LOCK_KEY})"))
+                high = conn.execute(text("SELECT COALESCE(MAX(stop_id), 0) FROM traffic_stops")).scalar()
+            added = 0
+            if high > self.watermark:
+                for chunk in iter_clean_chunks(SOURCE_QUERY, params={"low": self.watermark, "high": high},
+                                               fill_unknown=False):
+                    added += self.add_frame(chunk)
+                self.watermark = high
+            self.refreshed_at = time.monotonic()
+            return added
+
+    def refresh_if_stale(self, max_age=30):
+        if not self.offline and time.monotonic() - self.refreshed_at >= max_age:
+            self.refresh()
+
+    def values(self, dim):
+        with self._lock:
+            return list(self._values[dim])
+
+    # Smallest sub-cube holding every dimension asked for
+    def _cube_for(self, dims):
+        candidates = [name for name, cube_dims in CUBES.items() if set(dims) <= set(cube_dims)]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda name: self._arrays[name].size)
+
+    # Slice and roll up: measures summed over every dimension not in dims, for the cells
+    # matching where ({dim: condition}). Returns a DataFrame with one row per combination of
+    # dims that has stops.
+    def rollup(self, dims, where=None):
+        where = where or {}
+        name = self._cube_for(list(dims) + list(where))
+        if name is None:
+            raise MissingDimension(f"No sub-cube holds {', '.join(list(dims) + list(where))}")
+        cube_dims = CUBES[name]
+        with self._lock:
+            array = self._grow(name)
+            values = {dim: list(self._values[dim]) for dim in cube_dims}
+        kept = {dim: np.arange(len(values[dim])) for dim in cube_dims}
+        for dim, condition in where.items():
+            matches = predicate(condition)
+            mask = np.fromiter((matches(value) for value in values[dim]), dtype=bool, count=len(values[dim]))
+            array = np.compress(mask, array, axis=cube_dims.index(dim))
+            kept[dim] = kept[dim][mask]
+        summed = tuple(axis for axis, dim in enumerate(cube_dims) if dim not in dims)
+        reduced = array.sum(axis=summed) if summed else array
+        remaining = [dim for dim in cube_dims if dim in dims]
+        reduced = np.moveaxis(reduced, [remaining.index(dim) for dim in dims], range(len(dims)))
+        cells = np.nonzero(reduced[..., 0])
+        frame = {dim: np.asarray(values[dim], dtype=object)[kept[dim][codes]] for dim, codes in zip(dims, cells)}
+        totals = reduced[cells]
+        frame.update({measure: totals[:, i] for i, measure in enumerate(MEASURES)})
+        return pd.DataFrame(frame, columns=list(dims) + list(MEASURES))
+
+    def stats(self):
+        with self._lock:
+            return {"rows": self.rows, "cells": sum(array[..., 0].size for array in self._arrays.values()),
+                    "bytes": sum(array.nbytes for array in self._arrays.values()), "watermark": self.watermark}
+
+
+# Percentages of stops, rounded like the insight SQL
+def percent(part, whole):
+    return np.round(part * 100.0 / np.where(whole == 0, np.nan, whole), 2)
+
+
+# SQL RANK(): ties share a rank and leave a gap
+def rank(values, descending=True):
+    return pd.Series(values).rank(method="min", ascending=not descending).astype("int64").to_numpy()
+
+
+# Running totals per partition in order, like SUM(...) OVER (PARTITION BY ... ORDER BY ...)
+def cumulative(df, partition, order, columns):
+    df = df.sort_values([partition, order], kind="stable")
+    for column, source in columns.items():
+        df[column] = df.groupby(partition, dropna=False)[source].cumsum()
+    return df
+
+
+# Same buckets as the age group insight
+def age_group(ages):
+    ages = np.asarray(ages, dtype=object)
+    numeric = np.array([np.nan if age is None else age for age in ages], dtype=float)
+    return np.select(
+        [numeric <= 18, numeric <= 25, numeric <= 35, numeric <= 50, numeric <= 65],
+        ["under18", "18-25", "26-35", "36-50", "51-65"],
+        default="65+",
+    )
+
+
+def _not_null(df, *columns):
+    return df[df[list(columns)].notna().all(axis=1)]
+
+
+# Insight answers from the cube; each mirrors its SQL (same columns, order and limits).
+# Medium 1 and 2 are per-vehicle and stay in SQL.
+def _medium_3(cube, where):
+    df = cube.rollup(["driver_age"], where)
+    df["arrest_rate"] = df["arrests"] / df["stops"]
+    df["age_group"] = age_group(df["driver_age"])
+    return df.sort_values("arrest_rate", ascending=False, kind="stable").head(1)[["age_group", "driver_age", "arrest_rate"]]
+
+
+def _medium_4(cube, where):
+    df = cube.rollup(["country_name", "driver_gender"], where).rename(columns={"stops": "num_stops"})
+    return df.sort_values(["country_name", "driver_gender"], kind="stable")[["country_name", "driver_gender", "num_stops"]]
+
+
+def _medium_5(cube, where):
+    df = cube.rollup(["driver_race", "driver_gender"], where)
+    df = df.rename(columns={"searches": "num_searches", "stops": "total_stops"})
+    df["search_rate"] = percent(df["num_searches"], df["total_stops"])
+    return df.sort_values("search_rate", ascending=False, kind="stable").head(1)[
+        ["driver_race", "driver_gender", "num_searches", "total_stops", "search_rate"]]
+
+
+def _medium_6(cube, where):
+    df = _not_null(cube.rollup(["stop_hour"], where), "stop_hour")
+    df = df.rename(columns={"stop_hour": "hour_of_day", "stops": "no_of_stops"})
+    return df.sort_values("no_of_stops", ascending=False, kind="stable").head(1)[["hour_of_day", "no_of_stops"]]
+
+
+def _medium_7(cube, where):
+    df = _not_null(cube.rollup(["violation", "stop_duration"], where), "stop_duration")
+    minutes = df["stop_duration"].map(DURATION_MINUTES)
+    df = df.assign(weighted=minutes * df["stops"], known=df["stops"].where(minutes.notna()))
+    df = df.groupby("violation", dropna=False, sort=False)[["weighted", "known"]].sum(min_count=1).reset_index()
+    df["avg_duration"] = np.round(df["weighted"] / df["known"], 3)
+    return df.sort_values("avg_duration", ascending=False, na_position="first", kind="stable")[["violation", "avg_duration"]]
+
+
+def _medium_8(cube, where):
+    df = cube.rollup(["stop_hour"], where)
+    hours = pd.to_numeric(df["stop_hour"], errors="coerce")
+    df["time_of_day"] = np.where(hours.between(6, 17), "Day", "Night")
+    df = df.groupby("time_of_day")[["stops", "arrests"]].sum().reset_index()
+    df = df.rename(columns={"stops": "total_stops", "arrests": "total_arrests"})
+    df["arrest_rate_percentage"] = percent(df["total_arrests"], df["total_stops"])
+    return df
+
+
+def _violation_rates(cube, where, search_name, arrest_name):
+    df = cube.rollup(["violation"], where)
+    df = df.rename(columns={"stops": "total_stops", "searches": "total_searches", "arrests": "total_arrests"})
+    df[search_name] = percent(df["total_searches"], df["total_stops"])
+    df[arrest_name] = percent(df["total_arrests"], df["total_stops"])
+    return df[["violation", "total_stops", "total_searches", "total_arrests", search_name, arrest_name]]
+
+
+def _medium_9(cube, where):
+    df = _violation_rates(cube, where, "search_rate_percentage", "arrest_rate_percentage")
+    return df.sort_values(["total_searches", "total_arrests"], ascending=False, kind="stable")
+
+
+def _medium_10(cube, where):
+    where = dict(where)
+    limit = lambda age: age is not None and age < 25
+    if "driver_age" in where:
+        outer = predicate(where["driver_age"])
+        where["driver_age"] = lambda age: limit(age) and outer(age)
+    else:
+        where["driver_age"] = limit
+    df = cube.rollup(["violation"], where).rename(columns={"stops": "young_driver_stops"})
+    return df.sort_values("young_driver_stops", ascending=False, kind="stable")[["violation", "young_driver_stops"]]
+
+
+def _medium_11(cube, where):
+    df = _violation_rates(cube, where, "search_percent", "arrest_percent")
+    return df.sort_values(["total_searches", "total_arrests"], kind="stable").head(5)
+
+
+def _medium_12(cube, where):
+    df = cube.rollup(["country_name"], where)
+    df = df.rename(columns={"stops": "total_stops", "drug_stops": "total_drug_related_stops"})
+    df["total_drug_related_stops_percent"] = percent(df["total_drug_related_stops"], df["total_stops"])
+    return df.sort_values("total_drug_related_stops_percent", ascending=False, kind="stable")[
+        ["country_name", "total_stops", "total_drug_related_stops", "total_drug_related_stops_percent"]]
+
+
+def _medium_13(cube, where):
+    df = cube.rollup(["country_name", "violation"], where)
+    df = df.rename(columns={"stops": "total_stops", "arrests": "total_arrests"})
+    df["arrest_percent"] = percent(df["total_arrests"], df["total_stops"])
+    return df.sort_values("arrest_percent", ascending=False, kind="stable")[
+        ["country_name", "violation", "total_stops", "total_arrests", "arrest_percent"]]
+
+
+def _medium_14(cube, where):
+    df = cube.rollup(["country_name"], where)
+    df = df[df["searches"] > 0].rename(columns={"searches": "total_stops_per_country"})
+    return df.sort_values("total_stops_per_country", ascending=False, kind="stable").head(1)[
+        ["country_name", "total_stops_per_country"]]
+
+
+def _complex_1(cube, where):
+    df = cube.rollup(["country_name", "stop_year"], where)
+    df = df.rename(columns={"stop_year": "year", "stops": "total_stops", "arrests": "total_arrests"})
+    df["arrest_rate"] = percent(df["total_arrests"], df["total_stops"])
+    df = cumulative(df, "country_name", "year", {"cumulative_stops": "total_stops",
+                                                 "cumulative_arrests": "total_arrests"})
+    return df[["country_name", "year", "total_stops", "total_arrests", "arrest_rate",
+               "cumulative_stops", "cumulative_arrests"]]
+
+
+def _complex_2(cube, where):
+    df = _not_null(cube.rollup(["driver_age", "driver_race", "violation"], where), "driver_age", "driver_race")
+    df["total_stops"] = df.groupby(["driver_age", "driver_race"])["stops"].transform("sum")
+    df = _not_null(df, "violation").rename(columns={"stops": "stop_count"})
+    df["violation_percent"] = percent(df["stop_count"], df["total_stops"])
+    return df.sort_values("violation_percent", ascending=False, kind="stable").head(100)[
+        ["driver_age", "driver_race", "violation", "stop_count", "total_stops", "violation_percent"]]
+
+
+def _complex_3(cube, where):
+    df = _not_null(cube.rollup(["stop_year", "stop_month", "stop_hour"], where), "stop_year", "stop_hour")
+    df["stop_month_name"] = df["stop_month"].map(lambda month: calendar.month_name[month].ljust(9))  # like TO_CHAR 'Month'
+    df = df.rename(columns={"stops": "total_stops"})
+    return df.sort_values(["stop_year", "stop_month", "stop_hour"], kind="stable")[
+        ["stop_year", "stop_month_name", "stop_month", "stop_hour", "total_stops"]]
+
+
+def _complex_4(cube, where):
+    df = _not_null(cube.rollup(["violation"], where), "violation")
+    df = df.rename(columns={"stops": "total_stops", "searches": "total_searches", "arrests": "total_arrests"})
+    df["search_rate"] = percent(df["total_searches"], df["total_stops"])
+    df["arrest_rate"] = percent(df["total_arrests"], df["total_stops"])
+    df["search_rank"] = rank(df["total_searches"] / df["total_stops"])
+    df["arrest_rank"] = rank(df["total_arrests"] / df["total_stops"])
+    df = df.iloc[np.argsort((df["search_rank"] + df["arrest_rank"]).to_numpy(), kind="stable")].head(10)
+    return df[["violation", "total_stops", "total_searches", "total_arrests", "search_rate", "arrest_rate",
+               "search_rank", "arrest_rank"]]
+
+
+def _complex_5(cube, where):
+    df = cube.rollup(["country_name", "driver_age", "driver_gender", "driver_race"], where)
+    return df.sort_values(["country_name", "driver_age"], kind="stable")[
+        ["country_name", "driver_age", "driver_gender", "driver_race"]]
+
+
+def _complex_6(cube, where):
+    df = _not_null(cube.rollup(["violation"], where), "violation")
+    df = df.rename(columns={"stops": "total_stops", "arrests": "total_arrests"})
+    df["arrest_rate"] = percent(df["total_arrests"], df["total_stops"])
+    return df.sort_values("arrest_rate", ascending=False, kind="stable").head(5)[
+        ["violation", "total_stops", "total_arrests", "arrest_rate"]]
+
+
+# Insight number (the "3" of "3: Which driver age group...") -> answer
+MEDIUM_ANSWERS = {"3": _medium_3, "4": _medium_4, "5": _medium_5, "6": _medium_6, "7": _medium_7, "8": _medium_8,
+                  "9": _medium_9, "10": _medium_10, "11": _medium_11, "12": _medium_12, "13": _medium_13,
+                  "14": _medium_14}
+COMPLEX_ANSWERS = {"1": _complex_1, "2": _complex_2, "3": _complex_3, "4": _complex_4, "5": _complex_5,
+                   "6": _complex_6}
+
+# Insight filters the cube can apply as an equality on a dimension of the same name
+_FILTER_CONDITIONS = {
+    "country_name": "country_name",
+    "violation": "violation",
+    "driver_gender": "driver_gender",
+}
+
+
+# Insight filters as cube conditions; None when a filter needs a dimension the cube lacks
+# (a stop date range is finer than the year/month dimensions)
+def filter_conditions(filters):
+    where = {}
+    active = {name: value for name, value in (filters or {}).items()
+              if value is not None and value != "" and value != "All"}
+    for name, value in active.items():
+        if name in _FILTER_CONDITIONS:
+            where[_FILTER_CONDITIONS[name]] = value
+        elif name not in ("age_min", "age_max"):
+            return None
+    if "age_min" in active or "age_max" in active:
+        where["driver_age"] = (active.get("age_min"), active.get("age_max"))
+    return where
+
+
+# An insight answered from the cube, or None when it needs SQL: group is "medium" or "complex",
+# label a key of MEDIUM_QUERIES / COMPLEX_QUERIES
+def answer_insight(cube, group, label, filters=None):
+    answers = MEDIUM_ANSWERS if group == "medium" else COMPLEX_ANSWERS
+    fn = answers.get(label.split(":", 1)[0].strip())
+    where = filter_conditions(filters)
+    if fn is None or where is None:
+        return None
+    try:
+        return fn(cube, where).reset_index(drop=True)
+    except MissingDimension:  # e.g. a violation filter on an insight over the demographics
+        return None
+
+
+_cube = None
+_cube_lock = threading.Lock()
+
+
+# Process-wide count cube, built on first use from the database, or from a cleaned in-memory
+# ledger when one is given
+def get_cube(ledger=None):
+    global _cube
+    if _cube is None:
+        with _cube_lock:
+            if _cube is None:
+                cube = CountCube()
+                if ledger is not None:
+                    cube.load_frame(ledger)
+                else:
+                    cube.refresh()
+                _cube = cube
+    return _cube
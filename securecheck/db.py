@@ -0,0 +1,215 @@
+import configparser
+import hashlib
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import URL
+
+from securecheck import instrument
+
+
+# Optional config file; environment variables (SECURECHECK_<NAME>) take precedence
+CONFIG_FILE = os.environ.get("SECURECHECK_CONFIG", "securecheck.ini")
+
+DEFAULTS = {
+    "url": "",
+    "driver": "postgresql+psycopg2",
+    "host": "localhost",
+    "port": "5432",
+    "user": "postgres",
+    "password": "Regular30",
+    "dbname": "Testing_db",
+    "pool_size": "5",
+    "max_overflow": "10",
+    "pool_timeout": "30",
+    "pool_recycle": "1800",
+    "pool_pre_ping": "true",
+    "cache_ttl": "300",
+    "cache_max_mb": "256",
+    "version_poll": "5",
+    "data_source": "database",
+    "snapshot_dir": "snapshot",
+    "query_backend": "",
+    "embedded_source": "",
+    "slow_query_ms": "500",
+    "explain_slow_queries": "false",
+    "query_log_size": "500",
+    "query_log_file": "",
+    "partition_interval": "month",
+    "archive_dir": "archive",
+    "query_workers": "",
+    "lookup_cache_size": "10000",
+    "lookup_cache_ttl": "60",
+    "export_dir": "exports",
+    "export_download_mb": "200",
+    "insight_cube": "true",
+    "approx_mode": "false",
+    "approx_sample_size": "20000",
+    "approx_quick_rows": "200000",
+}
+
+_config = configparser.ConfigParser()
+_config.read(CONFIG_FILE)
+
+# :name bind variables (not :: casts)
+BIND_PARAM = re.compile(r"(?<![:\w]):(\w+)")
+
+_engine = None
+_engine_lock = threading.Lock()
+
+# Pool counters, updated from the SQLAlchemy pool events
+_stats_lock = threading.Lock()
+_pool_stats = {"checkouts": 0, "checkins": 0, "connects": 0, "waits": 0, "wait_seconds": 0.0}
+
+
+# Read one setting: environment first, then the [database] section, then the default
+def setting(name):
+    value = os.environ.get(f"SECURECHECK_{name.upper()}")
+    if value is not None:
+        return value
+    if _config.has_option("database", name):
+        return _config.get("database", name)
+    return DEFAULTS[name]
+
+
+def _flag(name):
+    return setting(name).strip().lower() in ("1", "true", "yes", "on")
+
+
+# Full DSN, either given directly or built from the individual parts
+def database_url():
+    if setting("url"):
+        return setting("url")
+    return URL.create(
+        setting("driver"),
+        username=setting("user"),
+        password=setting("password"),
+        host=setting("host"),
+        port=int(setting("port")),
+        database=setting("dbname"),
+    )
+
+
+def _count(key, amount=1):
+    with _stats_lock:
+        _pool_stats[key] += amount
+
+
+def _attach_pool_listeners(engine):
+    event.listen(engine, "connect", lambda dbapi_conn, record: _count("connects"))
+    event.listen(engine, "checkout", lambda dbapi_conn, record, proxy: _count("checkouts"))
+    event.listen(engine, "checkin", lambda dbapi_conn, record: _count("checkins"))
+
+
+# Process-wide SQLAlchemy engine, created once and shared by every caller
+def get_engine():
+    global _engine
+    if _engine is not None:
+        return _engine
+    with _engine_lock:
+        if _engine is None:
+            try:
+                engine = create_engine(
+                    database_url(),
+                    pool_size=int(setting("pool_size")),
+                    max_overflow=int(setting("max_overflow")),
+                    pool_timeout=float(setting("pool_timeout")),
+                    pool_recycle=int(setting("pool_recycle")),
+                    pool_pre_ping=_flag("pool_pre_ping"),
+                )
+                _attach_pool_listeners(engine)
+                _engine = engine
+            except Exception as e:
+                print(f"Error creating engine: {e}")
+                return None
+    return _engine
+
+
+# Check out a pooled connection, recording a wait when the pool is exhausted
+@contextmanager
+def connect():
+    engine = get_engine()
+    if engine is None:
+        raise RuntimeError("Database engine is not available")
+    pool = engine.pool
+    exhausted = pool.checkedin() == 0 and pool.checkedout() >= pool.size() + int(setting("max_overflow"))
+    start = time.perf_counter()
+    conn = engine.connect()
+    if exhausted:
+        with _stats_lock:
+            _pool_stats["waits"] += 1
+            _pool_stats["wait_seconds"] += time.perf_counter() - start
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
+# Snapshot of the pool counters plus the live pool state
+def pool_stats():
+    with _stats_lock:
+        stats = dict(_pool_stats)
+    engine = _engine
+    if engine is not None:
+        pool = engine.pool
+        stats.update({
+            "pool_size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "overflow": pool.overflow(),
+        })
+    return stats
+
+
+# Run a query over a pooled connection and build a DataFrame; execution and DataFrame build
+# are timed separately and recorded in the query log
+def _fetch(query, params, run):
+    started = time.perf_counter()
+    try:
+        with connect() as conn:
+            result = run(conn)
+            columns = list(result.keys())
+            rows = result.fetchall()
+        fetched = time.perf_counter()
+        df = pd.DataFrame.from_records(rows, columns=columns, coerce_float=True)
+        instrument.record_query(query, params, fetched - started, time.perf_counter() - fetched, df)
+        return df
+    except Exception as e:
+        print(f"Error executing query: {e}")
+        instrument.record_query(query, params, time.perf_counter() - started, 0.0, error=str(e))
+        return pd.DataFrame()
+
+
+# Fetch data using pandas over a pooled connection
+def fetch_data(query, params=None):
+    return _fetch(query, params, lambda conn: conn.execute(text(query), params or {}))
+
+
+# fetch_data through a server-side prepared statement. Each pooled connection prepares a query
+# once; later calls with other bind values skip parsing, and Postgres switches to a cached
+# generic plan once that is no worse than planning each call.
+def fetch_prepared(query, params=None):
+    names = list(dict.fromkeys(BIND_PARAM.findall(query)))
+    statement = "sc_" + hashlib.sha1(query.encode()).hexdigest()[:16]
+
+    def run(conn):
+        prepared = conn.connection.info.setdefault("prepared_statements", set())
+        if statement not in prepared:
+            positional = BIND_PARAM.sub(lambda m: f"${names.index(m.group(1)) + 1}", query)
+            conn.execute(text(f"PREPARE {statement} AS {positional}"))
+            prepared.add(statement)
+        arguments = f"({', '.join(f':{name}' for name in names)})" if names else ""
+        return conn.execute(text(f"EXECUTE {statement}{arguments}"), params or {})
+
+    return _fetch(query, params, run)
+
+
+# Run a write statement in its own transaction and return the number of affected rows
+def execute(statement, params=None):
+    with connect() as conn, conn.begin():
+        return conn.execute(text(statement), params or {}).rowcount
@@ -0,0 +1,138 @@
+import argparse
+import datetime
+import os
+import re
+import time
+
+from securecheck import db
+from securecheck.loader import iter_chunks
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet export is optional
+    pa = None
+
+
+# Rows held in memory at once while exporting; peak memory depends on this, not on the export size
+EXPORT_CHUNKSIZE = 50_000
+FORMATS = {"csv": "text/csv", "parquet": "application/vnd.apache.parquet"}
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise RuntimeError("Parquet export needs pyarrow: pip install pyarrow")
+
+
+def format_for(path):
+    return "parquet" if path.lower().endswith(".parquet") else "csv"
+
+
+# File name for an export of `label`, unique per second: "medium-3-which-driver-20240101-120000.csv"
+def export_name(label, file_format):
+    slug = re.sub(r"[^a-z0-9]+", "-", label.lower()).strip("-")[:48] or "export"
+    return f"{slug}-{time.strftime('%Y%m%d-%H%M%S')}.{file_format}"
+
+
+def export_path(label, file_format, directory=None):
+    directory = directory or db.setting("export_dir")
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, export_name(label, file_format))
+
+
+# Rows of an in-memory frame in export-sized slices
+def frame_chunks(df, chunksize=EXPORT_CHUNKSIZE):
+    for start in range(0, len(df), chunksize):
+        yield df.iloc[start:start + chunksize]
+
+
+def _write_csv(chunks, path, on_chunk):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        header = True
+        for chunk in chunks:
+            chunk.to_csv(f, index=False, header=header)
+            header = False
+            on_chunk(chunk)
+
+
+# Arrow schema fixed by the first chunk; columns that were all NULL there are written as strings
+def _parquet_schema(chunk):
+    schema = pa.Table.from_pandas(chunk, preserve_index=False).schema
+    for i, field in enumerate(schema):
+        if pa.types.is_null(field.type):
+            schema = schema.set(i, pa.field(field.name, pa.string()))
+    return schema.remove_metadata()
+
+
+def _write_parquet(chunks, path, on_chunk):
+    _require_pyarrow()
+    writer = None
+    try:
+        for chunk in chunks:
+            if writer is None:
+                writer = pq.ParquetWriter(path, _parquet_schema(chunk))
+            writer.write_table(pa.Table.from_pandas(chunk, schema=writer.schema, preserve_index=False))
+            on_chunk(chunk)
+    finally:
+        if writer is not None:
+            writer.close()
+    if writer is None:  # no rows: still leave a readable file
+        pq.write_table(pa.table({}), path)
+
+
+# Write DataFrame chunks to a CSV or Parquet file one chunk at a time. progress(rows, total)
+# is called after every chunk; total is the expected row count if the caller knows it.
+# The file appears under its final name only once complete. Returns counts and timing.
+def export_chunks(chunks, path, file_format=None, progress=None, total=None):
+    file_format = file_format or format_for(path)
+    if file_format not in FORMATS:
+        raise ValueError(f"Unknown export format {file_format!r}; use 'csv' or 'parquet'")
+    started = time.perf_counter()
+    written = 0
+
+    def on_chunk(chunk):
+        nonlocal written
+        written += len(chunk)
+        if progress:
+            progress(written, total)
+
+    try:
+        (_write_parquet if file_format == "parquet" else _write_csv)(chunks, path + ".tmp", on_chunk)
+    except BaseException:
+        if os.path.exists(path + ".tmp"):
+            os.remove(path + ".tmp")
+        raise
+    os.replace(path + ".tmp", path)
+    seconds = time.perf_counter() - started
+    return {"path": path, "format": file_format, "rows": written, "bytes": os.path.getsize(path),
+            "seconds": seconds, "rows_per_sec": written / seconds if seconds else 0.0}
+
+
+# Stream a query's result to a file through a server-side cursor
+def export_query(query, path, params=None, file_format=None, chunksize=EXPORT_CHUNKSIZE, progress=None, total=None):
+    return export_chunks(iter_chunks(query, chunksize, params), path, file_format, progress, total)
+
+
+def format_export(report):
+    return (f"{report['rows']:,} rows, {report['bytes'] / 1024 / 1024:.1f} MB written to {report['path']} "
+            f"in {report['seconds']:.2f}s ({report['rows_per_sec']:,.0f} rows/sec)")
+
+
+# Command line: python -m securecheck.export stops.parquet [--query SQL | --date-from ... --date-to ...]
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stream traffic_stops (or any query) to CSV or Parquet")
+    parser.add_argument("out", help="output file; .parquet writes Parquet, anything else CSV")
+    parser.add_argument("--query", help="SQL to export (default: the ledger); not combined with the date options")
+    parser.add_argument("--date-from", type=datetime.date.fromisoformat, help="first stop date (YYYY-MM-DD)")
+    parser.add_argument("--date-to", type=datetime.date.fromisoformat, help="last stop date (YYYY-MM-DD)")
+    parser.add_argument("--chunksize", type=int, default=EXPORT_CHUNKSIZE)
+    args = parser.parse_args()
+    if args.query and (args.date_from or args.date_to):
+        parser.error("--date-from and --date-to filter the ledger export; put the dates in the --query instead")
+    if args.query:
+        query, params = args.query, {}
+    else:
+        from securecheck.overview import ledger_query
+        query, params = ledger_query({"date_from": args.date_from, "date_to": args.date_to})
+    print(format_export(export_query(query, args.out, params, chunksize=args.chunksize,
+                                     progress=lambda rows, total: print(f"\r{rows:,} rows", end="", flush=True))))
@@ -0,0 +1,68 @@
+import re
+
+
+# Filters every insight accepts: name -> (column, comparison). The filter name doubles as the
+# bind variable, so one filter combination always produces the same SQL text and cache key.
+FILTERS = {
+    "country_name": ("country_name", "="),
+    "violation": ("violation", "="),
+    "driver_gender": ("driver_gender", "="),
+    "date_from": ("stop_date", ">="),
+    "date_to": ("stop_date", "<="),
+    "age_min": ("driver_age", ">="),
+    "age_max": ("driver_age", "<="),
+}
+
+# Same bands as the age group insight: label -> (age_min, age_max), bounds inclusive
+AGE_BANDS = {
+    "under18": (None, 18),
+    "18-25": (19, 25),
+    "26-35": (26, 35),
+    "36-50": (36, 50),
+    "51-65": (51, 65),
+    "65+": (66, None),
+}
+
+# A read of the ledger or a rollup, with its alias if it has one
+_SOURCE = re.compile(
+    r"\b(FROM|JOIN)\s+(traffic_stops|rollup_\w+)\b(?:\s+(?:AS\s+)?(?!(?:where|group|order|limit|join|left|right|inner|"
+    r"full|cross|on|window|union|having|offset)\b)([a-z_]\w*))?",
+    re.IGNORECASE,
+)
+
+
+# Filters that are actually set, ignoring unknown names and empty / "All" values
+def active_filters(filters):
+    return {name: value for name, value in (filters or {}).items()
+            if name in FILTERS and value is not None and value != "" and value != "All"}
+
+
+def age_band_filters(label):
+    age_min, age_max = AGE_BANDS.get(label, (None, None))
+    return {"age_min": age_min, "age_max": age_max}
+
+
+# Columns a filter set restricts; a rollup can serve the query only if it has all of them
+def filter_columns(filters):
+    return {FILTERS[name][0] for name in active_filters(filters)}
+
+
+# Tables an insight reads from directly (traffic_stops and the rollups)
+def tables_read(query):
+    return {match.group(2).lower() for match in _SOURCE.finditer(query)}
+
+
+# Turn an insight into a parameterized template: every read of traffic_stops or a rollup is
+# replaced by the same table filtered with bind variables. The planner inlines the subquery,
+# so the predicates reach the indexes and partition pruning. Returns (query, params).
+def apply_filters(query, filters):
+    filters = active_filters(filters)
+    if not filters:
+        return query, {}
+    where = " AND ".join(f"{FILTERS[name][0]} {FILTERS[name][1]} :{name}" for name in sorted(filters))
+
+    def replace(match):
+        keyword, table, alias = match.group(1), match.group(2), match.group(3) or match.group(2)
+        return f"{keyword} (SELECT * FROM {table} WHERE {where}) AS {alias}"
+
+    return _SOURCE.sub(replace, query), dict(filters)
@@ -0,0 +1,239 @@
+import argparse
+import io
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import pandas as pd
+from sqlalchemy import text
+
+from securecheck.cache import notify_write
+from securecheck.db import connect
+from securecheck.loader import clean_chunk
+from securecheck.partitions import ensure_partitions, is_partitioned
+from securecheck.rollups import ROLLUP_LOCK_KEY
+from securecheck.schema import LEDGER_COLUMNS
+from securecheck.vehicles import forget_plates, normalize_plates
+
+
+DEDUP_KEY = ["vehicle_number", "stop_date", "stop_time"]
+INGEST_LOCK_KEY = "hashtext('securecheck_ingest')"
+
+# Rows kept in one staging table / transaction when loading files
+DEFAULT_COMMIT_EVERY = 500_000
+DEFAULT_CHUNKSIZE = 50_000
+
+# Past this many distinct plates in one ingest the whole plate cache is dropped instead
+MAX_FORGET_PLATES = 100_000
+
+# Staging rows that are not already in the ledger, one per vehicle + timestamp. Staged plates
+# are normalized; stored ones are compared as schema.PLATE_KEY (and its index) so stops stored
+# before plates were normalized on write are still recognised.
+INSERT_NEW_STOPS = """INSERT INTO traffic_stops ({columns})
+SELECT DISTINCT ON (s.vehicle_number, s.stop_date, s.stop_time) {staged_columns}
+FROM staging_stops s
+WHERE NOT EXISTS (
+    SELECT 1 FROM traffic_stops t
+    WHERE upper(trim(t.vehicle_number)) = s.vehicle_number
+      AND t.stop_date = s.stop_date
+      AND t.stop_time = s.stop_time
+)"""
+
+
+# Validate and normalize a batch and shape it for COPY: types, flags, dates, times and plates
+# are parsed with the clean_data rules, but nothing is imputed; a missing value is stored as
+# NULL (the median age and 'Unknown' fills belong to the read path).
+# Rows without a vehicle number, date or time cannot be deduplicated and are rejected.
+# Returns (rows ready for COPY, rejected row count).
+def prepare_rows(df):
+    df = df.rename(columns=lambda col: str(col).strip().lower().replace(" ", "_"))
+    df = df[[col for col in LEDGER_COLUMNS if col in df.columns]]
+    if "vehicle_number" in df.columns:
+        df = df.assign(vehicle_number=normalize_plates(df["vehicle_number"]).replace("", pd.NA))
+    df = clean_chunk(df, fill_unknown=False)
+    for col in DEDUP_KEY:
+        if col not in df.columns:
+            df[col] = pd.NA
+    valid = df[DEDUP_KEY].notna().all(axis=1)
+    rejected = int((~valid).sum())
+    df = df[valid].drop_duplicates(subset=DEDUP_KEY)
+
+    # Back to the text forms Postgres COPY expects
+    out = pd.DataFrame(index=df.index)
+    for col in df.columns:
+        if col == "stop_date":
+            out[col] = df[col].dt.strftime("%Y-%m-%d")
+        elif col == "stop_time":
+            seconds = df[col].astype("int64")
+            out[col] = [f"{s // 3600:02d}:{s // 60 % 60:02d}:{s % 60:02d}" for s in seconds]
+        elif df[col].dtype in (bool, "boolean"):
+            out[col] = df[col].map({True: "t", False: "f"}).astype("string")
+        else:
+            out[col] = df[col].astype("string")
+    return out, rejected
+
+
+def _copy_frame(conn, df):
+    buffer = io.StringIO()
+    df.to_csv(buffer, index=False, header=False, na_rep="")
+    buffer.seek(0)
+    cursor = conn.connection.cursor()
+    try:
+        cursor.copy_expert(f"COPY staging_stops ({', '.join(df.columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+    finally:
+        cursor.close()
+
+
+# Write prepared batches in one transaction: COPY into a temp staging table, create any missing
+# stop_date partitions, then insert only the new stops. Holds the shared rollup lock so rollup
+# refreshes wait for this commit.
+def _write_batches(batches, columns):
+    staged = 0
+    with connect() as conn, conn.begin():
+        conn.execute(text(f"SELECT pg_advisory_xact_lock({INGEST_LOCK_KEY})"))
+        conn.execute(text(f"SELECT pg_advisory_xact_lock_shared({ROLLUP_LOCK_KEY})"))
+        conn.execute(text(
+            f"CREATE TEMP TABLE staging_stops ON COMMIT DROP AS "
+            f"SELECT {', '.join(columns)} FROM traffic_stops WITH NO DATA"
+        ))
+        for batch in batches:
+            _copy_frame(conn, batch[columns])
+            staged += len(batch)
+        if is_partitioned(conn):
+            months = conn.execute(text("SELECT DISTINCT date_trunc('month', stop_date)::date FROM staging_stops"))
+            ensure_partitions(conn, months.scalars().all())
+        inserted = conn.execute(text(INSERT_NEW_STOPS.format(
+            columns=", ".join(columns),
+            staged_columns=", ".join(f"s.{col}" for col in columns),
+        ))).rowcount
+    return staged, inserted
+
+
+# Ingest DataFrame chunks: validate, clean, dedupe and bulk load them, committing every
+# commit_every rows. Returns counts and throughput.
+def ingest_frames(frames, commit_every=DEFAULT_COMMIT_EVERY):
+    started = time.perf_counter()
+    report = {"rows_read": 0, "rows_rejected": 0, "duplicates": 0, "rows_inserted": 0}
+    pending, pending_rows, columns = [], 0, None
+    plates = set()
+
+    def flush():
+        nonlocal pending, pending_rows
+        if pending:
+            staged, inserted = _write_batches(pending, columns)
+            report["rows_inserted"] += inserted
+            report["duplicates"] += staged - inserted
+            pending, pending_rows = [], 0
+
+    for frame in frames:
+        report["rows_read"] += len(frame)
+        rows, rejected = prepare_rows(frame)
+        report["rows_rejected"] += rejected
+        report["duplicates"] += len(frame) - rejected - len(rows)
+        if rows.empty:
+            continue
+        if columns is not None and list(rows.columns) != columns:
+            flush()
+        columns = list(rows.columns)
+        if plates is not None:
+            plates.update(rows["vehicle_number"])
+            if len(plates) > MAX_FORGET_PLATES:
+                plates = None
+        pending.append(rows)
+        pending_rows += len(rows)
+        if pending_rows >= commit_every:
+            flush()
+    flush()
+
+    if report["rows_inserted"]:
+        notify_write("traffic_stops")
+        forget_plates(plates)
+    report["seconds"] = time.perf_counter() - started
+    report["rows_per_sec"] = report["rows_read"] / report["seconds"] if report["seconds"] else 0.0
+    return report
+
+
+# Read a check-post export in chunks; CSV or JSON lines, picked from the extension unless given
+def read_export(path_or_buffer, file_format=None, chunksize=DEFAULT_CHUNKSIZE):
+    name = getattr(path_or_buffer, "name", str(path_or_buffer)).lower()
+    file_format = file_format or ("jsonl" if name.endswith((".jsonl", ".json", ".ndjson")) else "csv")
+    if file_format == "jsonl":
+        return pd.read_json(path_or_buffer, lines=True, chunksize=chunksize, dtype=False)
+    return pd.read_csv(path_or_buffer, chunksize=chunksize, dtype=str, keep_default_na=True)
+
+
+def ingest_file(path_or_buffer, file_format=None, chunksize=DEFAULT_CHUNKSIZE, commit_every=DEFAULT_COMMIT_EVERY):
+    return ingest_frames(read_export(path_or_buffer, file_format, chunksize), commit_every)
+
+
+# Background writer for single stops from the log form: submissions are queued and committed
+# together every flush_interval seconds or batch_size stops, whichever comes first. submit()
+# returns a Future that resolves to the batch's ingest report, or raises the batch's error.
+class StopWriter:
+    def __init__(self, batch_size=200, flush_interval=1.0):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.last_report = None
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="stop-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, stop):
+        future = Future()
+        self._queue.put((stop, future))
+        return future
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                report = self.last_report = ingest_frames([pd.DataFrame([stop for stop, _ in batch])])
+            except Exception as e:
+                print(f"Error writing stops: {e}")
+                for _, future in batch:
+                    future.set_exception(e)
+            else:
+                for _, future in batch:
+                    future.set_result(report)
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+# Process-wide StopWriter, started on first use
+def get_stop_writer():
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = StopWriter()
+    return _writer
+
+
+def format_report(report):
+    return (f"{report['rows_read']:,} rows read, {report['rows_inserted']:,} inserted, "
+            f"{report['duplicates']:,} duplicates, {report['rows_rejected']:,} rejected "
+            f"in {report['seconds']:.2f}s ({report['rows_per_sec']:,.0f} rows/sec)")
+
+
+# Command line: python -m securecheck.ingest shift_export.csv [more files...]
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk load check-post stop exports into traffic_stops")
+    parser.add_argument("files", nargs="+", help="CSV or JSON-lines exports")
+    parser.add_argument("--format", choices=["csv", "jsonl"], help="override format detection")
+    parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE)
+    parser.add_argument("--commit-every", type=int, default=DEFAULT_COMMIT_EVERY)
+    args = parser.parse_args()
+    for path in args.files:
+        print(f"{path}: {format_report(ingest_file(path, args.format, args.chunksize, args.commit_every))}")
@@ -0,0 +1,147 @@
+import json
+import logging
+import re
+import threading
+import time
+from collections import deque
+
+import pandas as pd
+from sqlalchemy import text
+
+from securecheck import db
+
+
+# One JSON object per executed query; attach a handler (or set query_log_file) to keep them
+logger = logging.getLogger("securecheck.queries")
+
+# Re-capture a query's plan at most this often
+PLAN_MAX_AGE = 600
+
+
+# Collapse comments and whitespace so cosmetic edits to a query share one entry
+def normalize_sql(query):
+    query = re.sub(r"--[^\n]*", " ", query)
+    query = re.sub(r"\s+", " ", query).strip()
+    return query.rstrip(";").strip()
+
+
+_READ_ONLY = re.compile(r"(select|with)\b", re.IGNORECASE)
+
+
+# Ring buffer of recent query executions, with captured EXPLAIN plans per normalized query
+class QueryLog:
+    def __init__(self, size, slow_ms, explain_slow):
+        self.slow_ms = slow_ms
+        self.explain_slow = explain_slow
+        self._records = deque(maxlen=size)
+        self._plans = {}  # normalized sql -> (plan text, captured_at)
+        self._explaining = set()
+        self._lock = threading.Lock()
+
+    def record(self, query, params, execute_seconds, build_seconds, df=None, error=None, engine="postgresql"):
+        sql = normalize_sql(query)
+        entry = {
+            "at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "engine": engine,
+            "sql": sql,
+            "params": {key: str(value) for key, value in (params or {}).items()},
+            "wall_ms": (execute_seconds + build_seconds) * 1000,
+            "execute_ms": execute_seconds * 1000,
+            "build_ms": build_seconds * 1000,
+            "rows": len(df) if df is not None else 0,
+            "bytes": int(df.memory_usage(deep=True).sum()) if df is not None else 0,
+            "error": error,
+        }
+        with self._lock:
+            self._records.append(entry)
+        logger.info(json.dumps(entry))
+        if (self.explain_slow and engine == "postgresql" and error is None
+                and entry["wall_ms"] >= self.slow_ms and _READ_ONLY.match(sql)):
+            self._capture_plan_later(query, params, sql)
+        return entry
+
+    # EXPLAIN ANALYZE runs the query again, so do it off the caller's thread and not too often
+    def _capture_plan_later(self, query, params, sql):
+        with self._lock:
+            captured = self._plans.get(sql)
+            if sql in self._explaining or (captured and time.time() - captured[1] < PLAN_MAX_AGE):
+                return
+            self._explaining.add(sql)
+        threading.Thread(target=self._capture_plan, args=(query, params, sql), daemon=True).start()
+
+    def _capture_plan(self, query, params, sql):
+        try:
+            with db.connect() as conn:  # never committed: the connection rolls back on close
+                rows = conn.execute(text(f"EXPLAIN (ANALYZE, BUFFERS) {query}"), params or {}).fetchall()
+            plan = "\n".join(row[0] for row in rows)
+            with self._lock:
+                self._plans[sql] = (plan, time.time())
+        except Exception as e:
+            print(f"Error capturing plan: {e}")
+        finally:
+            with self._lock:
+                self._explaining.discard(sql)
+
+    def plan(self, query):
+        with self._lock:
+            captured = self._plans.get(normalize_sql(query))
+        return captured[0] if captured else None
+
+    def recent(self, limit=50):
+        with self._lock:
+            records = list(self._records)[-limit:]
+        return pd.DataFrame(records[::-1])
+
+    # Queries at or above the slow threshold, one row per normalized query, slowest first
+    def slow_queries(self, limit=20):
+        with self._lock:
+            records = list(self._records)
+            plans = set(self._plans)
+        df = pd.DataFrame(records)
+        if df.empty:
+            return df
+        summary = df.groupby("sql").agg(
+            calls=("wall_ms", "size"),
+            p50_ms=("wall_ms", "median"),
+            max_ms=("wall_ms", "max"),
+            execute_ms=("execute_ms", "median"),
+            build_ms=("build_ms", "median"),
+            rows=("rows", "last"),
+            bytes=("bytes", "last"),
+            last_run=("at", "last"),
+        ).reset_index()
+        summary = summary[summary["max_ms"] >= self.slow_ms]
+        summary["plan"] = summary["sql"].isin(plans)
+        return summary.sort_values("max_ms", ascending=False).head(limit).reset_index(drop=True)
+
+    def clear(self):
+        with self._lock:
+            self._records.clear()
+            self._plans.clear()
+
+
+_query_log = None
+_query_log_lock = threading.Lock()
+
+
+# Process-wide query log, built from the settings on first use
+def get_query_log():
+    global _query_log
+    if _query_log is None:
+        with _query_log_lock:
+            if _query_log is None:
+                if db.setting("query_log_file"):
+                    handler = logging.FileHandler(db.setting("query_log_file"))
+                    handler.setFormatter(logging.Formatter("%(message)s"))
+                    logger.addHandler(handler)
+                    logger.setLevel(logging.INFO)
+                _query_log = QueryLog(
+                    size=int(db.setting("query_log_size")),
+                    slow_ms=float(db.setting("slow_query_ms")),
+                    explain_slow=db.setting("explain_slow_queries").strip().lower() in ("1", "true", "yes", "on"),
+                )
+    return _query_log
+
+
+def record_query(query, params, execute_seconds, build_seconds, df=None, error=None, engine="postgresql"):
+    return get_query_log().record(query, params, execute_seconds, build_seconds, df, error, engine)
@@ -0,0 +1,54 @@
+import pandas as pd
+
+from securecheck.cache import fetch_cached
+
+
+# Every Essential Statistics number in a single pass over traffic_stops:
+# the () grouping set gives the ledger-wide KPIs, the driver_gender set feeds the pie chart.
+KPI_QUERY = """SELECT
+    GROUPING(driver_gender) AS is_total,
+    driver_gender,
+    COUNT(*) AS total_stops,
+    COUNT(*) FILTER (WHERE stop_outcome = 'Arrest') AS total_arrests,
+    COUNT(*) FILTER (WHERE stop_outcome = 'Warning') AS total_warnings,
+    COUNT(*) FILTER (WHERE search_conducted) AS total_searches,
+    COUNT(*) FILTER (WHERE drugs_related_stop) AS drug_searches,
+    COUNT(DISTINCT violation) AS unique_violations
+FROM traffic_stops
+GROUP BY GROUPING SETS ((), (driver_gender))"""
+
+KPI_NAMES = ["total_stops", "total_arrests", "total_warnings", "total_searches", "drug_searches", "unique_violations"]
+
+
+# KPI values as a dict plus drug-related stop counts per gender (a Series indexed by gender)
+def essential_statistics():
+    result = fetch_cached(KPI_QUERY)
+    if result.empty:
+        return {name: 0 for name in KPI_NAMES}, pd.Series(dtype="int64")
+    totals = result[result["is_total"] == 1].iloc[0]
+    kpis = {name: int(totals[name]) for name in KPI_NAMES}
+    by_gender = result[result["is_total"] == 0]
+    drug_by_gender = pd.Series(
+        by_gender["drug_searches"].astype("int64").values,
+        index=by_gender["driver_gender"].fillna("Unknown"),
+    )
+    drug_by_gender = drug_by_gender[drug_by_gender > 0].sort_values(ascending=False)
+    return kpis, drug_by_gender
+
+
+# Same numbers computed from a cleaned in-memory ledger (e.g. the local snapshot)
+def statistics_from_frame(df):
+    if df.empty:
+        return {name: 0 for name in KPI_NAMES}, pd.Series(dtype="int64")
+    outcome = df["stop_outcome"]
+    kpis = {
+        "total_stops": len(df),
+        "total_arrests": int((outcome == "Arrest").sum()),
+        "total_warnings": int((outcome == "Warning").sum()),
+        "total_searches": int(df["search_conducted"].sum()),
+        "drug_searches": int(df["drugs_related_stop"].sum()),
+        # Cleaning turns NULL violations into 'Unknown'; COUNT(DISTINCT violation) skips NULLs
+        "unique_violations": int(df["violation"].loc[df["violation"] != "Unknown"].nunique()),
+    }
+    drug_by_gender = df.loc[df["drugs_related_stop"], "driver_gender"].value_counts()
+    return kpis, drug_by_gender[drug_by_gender > 0].astype("int64")
@@ -0,0 +1,140 @@
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+from securecheck.db import connect
+
+
+CATEGORY_COLS = ['driver_gender', 'driver_race', 'country_name', 'violation', 'stop_outcome', 'search_type', 'stop_duration']
+BOOL_COLS = ['search_conducted', 'drugs_related_stop', 'is_arrested']
+BOOL_TEXT = {'true': True, 't': True, '1': True, 'yes': True, 'y': True,
+             'false': False, 'f': False, '0': False, 'no': False, 'n': False}
+
+DEFAULT_CHUNKSIZE = 100_000
+
+
+# Ages as nullable Int16 (truncated like the old astype(int)); out-of-range values become NA
+def _clean_age(values):
+    ages = pd.to_numeric(values, errors='coerce')
+    ages = ages.where(ages.between(0, 150))
+    return np.trunc(ages).astype('Int16')
+
+
+# Time of day as Int32 seconds since midnight; accepts time objects, 'HH:MM:SS' and 'HH:MM'
+def _clean_time(values):
+    times = values.astype(str)
+    times = times.where(times.str.count(':') != 1, times + ':00')
+    seconds = pd.to_timedelta(times, errors='coerce').dt.total_seconds()
+    return np.trunc(seconds.where(seconds.between(0, 86399))).astype('Int32')
+
+
+# Text flags from files and forms ('True', 'f', '1', 'no', ...) as booleans; anything else is NA
+def _parse_bool(values):
+    return values.astype('string').str.strip().str.lower().map(BOOL_TEXT)
+
+
+# Vectorised cleaning of one chunk. Ages are left as NA so the caller can fill them with the
+# median of the whole ledger rather than of this chunk. fill_unknown=False keeps missing
+# categories and flags as NA, for aggregates that must group NULL the way SQL does and for
+# rows written back to the ledger.
+def clean_chunk(df, fill_unknown=True):
+    df = df.copy()
+    for col in CATEGORY_COLS:
+        if col in df.columns:
+            if not fill_unknown:
+                df[col] = df[col].astype('category')
+                continue
+            # Already-cleaned frames (e.g. a scoring batch cut from the ledger) arrive categorical
+            if isinstance(df[col].dtype, pd.CategoricalDtype) and 'Unknown' not in df[col].cat.categories:
+                df[col] = df[col].cat.add_categories('Unknown')
+            df[col] = df[col].fillna('Unknown').astype('category')
+    for col in BOOL_COLS:
+        if col in df.columns:
+            if df[col].dtype == object:
+                df[col] = _parse_bool(df[col])
+            df[col] = df[col].astype('boolean')
+            if fill_unknown:
+                df[col] = df[col].fillna(False).astype(bool)
+    if 'driver_age' in df.columns:
+        df['driver_age'] = _clean_age(df['driver_age'])
+    if 'stop_date' in df.columns:
+        df['stop_date'] = pd.to_datetime(df['stop_date'], errors='coerce')
+    if 'stop_time' in df.columns:
+        df['stop_time'] = _clean_time(df['stop_time'])
+    return df
+
+
+# Median from an {age: count} histogram, matching Series.median()
+def histogram_median(histogram):
+    total = sum(histogram.values())
+    if total == 0:
+        return None
+    ranks = {(total - 1) // 2, total // 2}
+    found, seen = [], 0
+    for value in sorted(histogram):
+        count = histogram[value]
+        for rank in sorted(ranks):
+            if seen <= rank < seen + count:
+                found.append(value)
+        seen += count
+    return sum(found) / len(found)
+
+
+# Stream a query through a server-side cursor, yielding raw DataFrame chunks
+def iter_chunks(query="SELECT * FROM traffic_stops", chunksize=DEFAULT_CHUNKSIZE, params=None):
+    with connect() as conn:
+        conn = conn.execution_options(stream_results=True, max_row_buffer=chunksize)
+        yield from pd.read_sql(text(query), con=conn, params=params, chunksize=chunksize)
+
+
+# Same as iter_chunks, with every chunk passed through clean_chunk
+def iter_clean_chunks(query="SELECT * FROM traffic_stops", chunksize=DEFAULT_CHUNKSIZE, params=None, fill_unknown=True):
+    for chunk in iter_chunks(query, chunksize, params):
+        yield clean_chunk(chunk, fill_unknown)
+
+
+# Stitch cleaned chunks together, unifying categories so concat keeps the category dtype,
+# dropping columns that were empty in every chunk and filling ages with the global median
+def combine_chunks(chunks, age_histogram, non_empty):
+    if not chunks:
+        return pd.DataFrame()
+    for col in CATEGORY_COLS:
+        if col in chunks[0].columns:
+            categories = pd.api.types.union_categoricals([chunk[col] for chunk in chunks]).categories
+            for chunk in chunks:
+                chunk[col] = chunk[col].cat.set_categories(categories)
+    df = pd.concat(chunks, ignore_index=True)
+    df = df[[col for col in df.columns if col in non_empty]]
+    median = histogram_median(age_histogram)
+    if 'driver_age' in df.columns and median is not None:
+        df['driver_age'] = df['driver_age'].fillna(int(median))
+    return df
+
+
+# Clean raw chunks from any source into one frame; the age median is gathered in the same pass
+def clean_chunks(raw_chunks):
+    chunks, age_histogram, non_empty = [], Counter(), set()
+    for raw in raw_chunks:
+        non_empty.update(raw.columns[raw.notna().any()])
+        chunk = clean_chunk(raw)
+        if 'driver_age' in chunk.columns:
+            age_histogram.update(chunk['driver_age'].value_counts().to_dict())
+        chunks.append(chunk)
+    return combine_chunks(chunks, age_histogram, non_empty)
+
+
+# Load and clean traffic_stops chunk by chunk
+def load_clean(query="SELECT * FROM traffic_stops", chunksize=DEFAULT_CHUNKSIZE, params=None):
+    return clean_chunks(iter_chunks(query, chunksize, params))
+
+
+# Cleaning data function for a DataFrame that is already in memory
+def clean_data(df):
+    # Drop columns where all values are NaN
+    df = clean_chunk(df.dropna(axis=1, how='all'))
+    # Handle missing ages: fill with the median
+    if 'driver_age' in df.columns and df['driver_age'].notna().any():
+        df['driver_age'] = df['driver_age'].fillna(int(df['driver_age'].median()))
+    return df
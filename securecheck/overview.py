@@ -0,0 +1,152 @@
+import pandas as pd
+
+from securecheck.cache import fetch_cached
+from securecheck.db import fetch_data
+from securecheck.schema import LEDGER_COLUMNS, PLATE_KEY
+from securecheck.vehicles import normalize_plate, normalize_plates
+
+
+# Columns the Overview grid can filter on with an exact match
+FILTER_COLUMNS = ["country_name", "driver_gender", "violation", "stop_outcome"]
+
+# Unique, ordered row identifier used as the keyset tie-breaker
+ROW_KEY = "stop_id"
+ROW_KEY_TYPE = "bigint"
+
+
+# Turn pandas/numpy scalars into plain Python values the DB driver can bind
+def _plain(value):
+    if value is None or pd.isna(value):
+        return None
+    if isinstance(value, pd.Timestamp):
+        return value.to_pydatetime()
+    if hasattr(value, "item"):
+        return value.item()
+    return value
+
+
+# WHERE clauses and bind parameters for the grid filters
+def _filter_clauses(filters):
+    clauses, params = [], {}
+    for column in FILTER_COLUMNS:
+        if filters.get(column):
+            clauses.append(f"{column} = :{column}")
+            params[column] = filters[column]
+    if filters.get("vehicle_number"):
+        prefix = normalize_plate(filters["vehicle_number"]).replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        clauses.append(f"{PLATE_KEY} LIKE :vehicle_prefix")
+        params["vehicle_prefix"] = prefix + "%"
+    if filters.get("date_from"):
+        clauses.append("stop_date >= :date_from")
+        params["date_from"] = filters["date_from"]
+    if filters.get("date_to"):
+        clauses.append("stop_date <= :date_to")
+        params["date_to"] = filters["date_to"]
+    return clauses, params
+
+
+def _where(clauses):
+    return f"WHERE {' AND '.join(clauses)}" if clauses else ""
+
+
+# One page of the ledger using keyset pagination.
+# Rows are ordered by (sort_column IS NULL, sort_column, ROW_KEY); the cursor is the
+# (sort value, row key) of the last row on the previous page, so every page is an
+# index-friendly range scan instead of an OFFSET over everything before it.
+def fetch_page(sort_column="stop_date", descending=False, filters=None, page_size=50, cursor=None):
+    if sort_column not in LEDGER_COLUMNS:
+        raise ValueError(f"Cannot sort the ledger by {sort_column!r}")
+    clauses, params = _filter_clauses(filters or {})
+    if cursor is not None:
+        after_value, after_key = cursor
+        params["after_key"] = after_key
+        key_clause = f"{ROW_KEY} > CAST(:after_key AS {ROW_KEY_TYPE})"
+        if after_value is None:
+            clauses.append(f"({sort_column} IS NULL AND {key_clause})")
+        else:
+            op = "<" if descending else ">"
+            clauses.append(
+                f"({sort_column} IS NULL OR {sort_column} {op} :after_value"
+                f" OR ({sort_column} = :after_value AND {key_clause}))"
+            )
+            params["after_value"] = after_value
+    direction = "DESC" if descending else "ASC"
+    params["page_limit"] = page_size + 1  # one extra row tells us whether a next page exists
+    query = f"""SELECT {ROW_KEY}::text AS row_key, *
+FROM traffic_stops
+{_where(clauses)}
+ORDER BY {sort_column} IS NULL, {sort_column} {direction}, {ROW_KEY}
+LIMIT :page_limit"""
+    page = fetch_data(query, params=params)
+    if page.empty:
+        return page.drop(columns="row_key", errors="ignore"), None
+    next_cursor = None
+    if len(page) > page_size:
+        page = page.head(page_size)
+        last = page.iloc[-1]
+        next_cursor = (_plain(last[sort_column]), last["row_key"])
+    return page.drop(columns="row_key"), next_cursor
+
+
+# Planner estimate summed over the ledger's leaf tables (itself, or its partitions);
+# any table not analyzed yet reports -1 and makes the estimate unusable
+ESTIMATE_QUERY = """SELECT SUM(c.reltuples)::bigint AS n, MIN(c.reltuples) AS lowest
+FROM pg_partition_tree('traffic_stops') p
+JOIN pg_class c ON c.oid = p.relid
+WHERE p.isleaf"""
+
+
+# The filtered ledger in storage order, for streaming exports; returns (query, params)
+def ledger_query(filters=None):
+    clauses, params = _filter_clauses(filters or {})
+    return f"SELECT * FROM traffic_stops {_where(clauses)}", params
+
+
+# Row count for the current filters; unfiltered counts use the planner estimate
+def count_rows(filters=None):
+    clauses, params = _filter_clauses(filters or {})
+    if not clauses:
+        estimate = fetch_data(ESTIMATE_QUERY)
+        if not estimate.empty and pd.notna(estimate["lowest"].iloc[0]) and estimate["lowest"].iloc[0] >= 0:
+            return int(estimate["n"].iloc[0]), True
+    exact = fetch_cached(f"SELECT count(*) AS n FROM traffic_stops {_where(clauses)}", params=params)
+    return (int(exact["n"].iloc[0]) if not exact.empty else 0), False
+
+
+# Distinct values offered in a filter dropdown
+def filter_options(column):
+    if column not in FILTER_COLUMNS:
+        raise ValueError(f"Cannot filter the ledger by {column!r}")
+    options = fetch_cached(f"SELECT DISTINCT {column} FROM traffic_stops WHERE {column} IS NOT NULL ORDER BY {column}")
+    return options[column].tolist() if not options.empty else []
+
+
+
+# Rows of an in-memory ledger (the local snapshot) matching the grid filters
+def frame_slice(df, filters=None):
+    filters = filters or {}
+    mask = pd.Series(True, index=df.index)
+    for column in FILTER_COLUMNS:
+        if filters.get(column):
+            mask &= df[column] == filters[column]
+    if filters.get("vehicle_number"):
+        plates = normalize_plates(df["vehicle_number"])
+        mask &= plates.str.startswith(normalize_plate(filters["vehicle_number"])).fillna(False)
+    if filters.get("date_from"):
+        mask &= df["stop_date"] >= pd.Timestamp(filters["date_from"])
+    if filters.get("date_to"):
+        mask &= df["stop_date"] <= pd.Timestamp(filters["date_to"])
+    return df[mask]
+
+
+# Overview page from an in-memory ledger; returns (page, matching rows)
+def frame_page(df, sort_column="stop_date", descending=False, filters=None, page_size=50, page_index=0):
+    if sort_column not in df.columns:
+        raise ValueError(f"Cannot sort the ledger by {sort_column!r}")
+    view = frame_slice(df, filters).sort_values(sort_column, ascending=not descending, na_position="last", kind="stable")
+    start = page_index * page_size
+    return view.iloc[start:start + page_size], len(view)
+
+
+def frame_filter_options(df, column):
+    return sorted(df[column].dropna().unique().tolist()) if column in df.columns else []
@@ -0,0 +1,89 @@
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import pandas as pd
+
+from securecheck import db
+
+
+# Threads for long one-off builds (the count cube, the approximate synopsis)
+BACKGROUND_WORKERS = 2
+
+_executor = None
+_background_executor = None
+_executor_lock = threading.Lock()
+
+
+# Threads for concurrent queries; defaults to the connection pool size so parallel
+# fetches never queue for a connection or spill into overflow connections
+def max_workers():
+    return int(db.setting("query_workers") or db.setting("pool_size"))
+
+
+# Process-wide thread pool shared by every page render
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=max_workers(), thread_name_prefix="query")
+    return _executor
+
+
+# Start fn on the shared pool; call .result() on the returned future where the value is needed
+def submit(fn, *args, **kwargs):
+    return get_executor().submit(fn, *args, **kwargs)
+
+
+# Separate pool for builds that take minutes, so they never hold the threads page renders wait on
+def get_background_executor():
+    global _background_executor
+    if _background_executor is None:
+        with _executor_lock:
+            if _background_executor is None:
+                _background_executor = ThreadPoolExecutor(max_workers=BACKGROUND_WORKERS, thread_name_prefix="background")
+    return _background_executor
+
+
+def submit_background(fn, *args, **kwargs):
+    return get_background_executor().submit(fn, *args, **kwargs)
+
+
+def _timed(backend, query, params):
+    started = time.perf_counter()
+    try:
+        return backend.run(query, params), time.perf_counter() - started, None
+    except Exception as e:
+        return pd.DataFrame(), time.perf_counter() - started, str(e)
+
+
+# Every insight at once on the shared pool, at most `concurrency` in flight (never more than the
+# pool has threads); queries maps label -> (sql, params). A query is submitted only when an
+# earlier one finishes, so a batch never queues ahead of the page renders sharing the pool.
+# The backend is brought up to date once up front rather than by each query.
+# Returns ({label: result frame}, summary frame, wall seconds).
+def run_all_insights(backend, queries, concurrency=None):
+    started = time.perf_counter()
+    backend.before_insights()
+    limit = min(concurrency or max_workers(), max_workers())
+    results, timings = {}, {}
+    pending = iter(queries.items())
+    running = {}
+
+    def submit_next():
+        for label, (query, params) in pending:
+            running[submit(_timed, backend, query, params)] = label
+            return
+
+    for _ in range(limit):
+        submit_next()
+    while running:
+        done, _ = wait(running, return_when=FIRST_COMPLETED)
+        for future in done:
+            label = running.pop(future)
+            results[label], seconds, error = future.result()
+            timings[label] = {"insight": label, "rows": len(results[label]), "seconds": round(seconds, 3), "error": error}
+            submit_next()
+    summary = pd.DataFrame([timings[label] for label in queries], columns=["insight", "rows", "seconds", "error"])
+    return {label: results[label] for label in queries}, summary, time.perf_counter() - started
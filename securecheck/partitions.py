@@ -0,0 +1,233 @@
+import argparse
+import datetime
+import os
+import re
+
+from sqlalchemy import text
+
+from securecheck import db
+from securecheck.cache import notify_write
+from securecheck.loader import iter_chunks
+from securecheck.rollups import ROLLUP_LOCK_KEY, ROLLUPS, subtract_rollups
+from securecheck.schema import LEDGER_SCHEMA
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # archiving is optional
+    pa = None
+
+
+# traffic_stops range-partitioned on stop_date, one partition per month (or year).
+# Rows with no stop_date, or outside every partition, land in the default partition.
+DEFAULT_PARTITION = "traffic_stops_default"
+
+PARTITIONS_QUERY = """SELECT c.relname AS name,
+    pg_get_expr(c.relpartbound, c.oid) AS bounds,
+    c.reltuples::bigint AS estimated_rows,
+    pg_total_relation_size(c.oid) AS bytes
+FROM pg_inherits i
+JOIN pg_class c ON c.oid = i.inhrelid
+WHERE i.inhparent = to_regclass('traffic_stops')
+ORDER BY c.relname"""
+
+_BOUNDS = re.compile(r"FROM \('(\d{4}-\d{2}-\d{2})'\) TO \('(\d{4}-\d{2}-\d{2})'\)")
+
+_ARROW_TYPES = {
+    "date": "date32", "time": "time64", "text": "string", "double precision": "float64",
+    "smallint": "int16", "boolean": "bool_",
+}
+
+
+# Partition name and [start, end) range holding a given day
+def partition_for(day, interval=None):
+    interval = interval or db.setting("partition_interval")
+    if interval == "year":
+        return f"traffic_stops_y{day.year}", datetime.date(day.year, 1, 1), datetime.date(day.year + 1, 1, 1)
+    if interval == "month":
+        end = datetime.date(day.year + day.month // 12, day.month % 12 + 1, 1)
+        return f"traffic_stops_y{day.year}m{day.month:02d}", datetime.date(day.year, day.month, 1), end
+    raise ValueError(f"Unknown partition interval {interval!r}; use 'month' or 'year'")
+
+
+# Every partition from the one holding first to the one holding last
+def partitions_between(first, last, interval=None):
+    partitions, day = [], first
+    while day <= last:
+        partition = partition_for(day, interval)
+        partitions.append(partition)
+        day = partition[2]
+    return partitions
+
+
+# [start, end) range of a partition from its bounds expression; None for the default partition
+def partition_range(partition):
+    bounds = _BOUNDS.search(partition["bounds"] or "")
+    return tuple(datetime.date.fromisoformat(day) for day in bounds.groups()) if bounds else None
+
+
+# Interval the ledger was partitioned with, read from the existing partitions; None if there are none.
+# New partitions follow it whatever partition_interval says now, so ranges never overlap.
+def existing_interval(partitions):
+    for partition in partitions:
+        bounds = partition_range(partition)
+        if bounds:
+            return "year" if (bounds[1] - bounds[0]).days > 31 else "month"
+    return None
+
+
+def is_partitioned(conn):
+    return conn.execute(text(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass('traffic_stops'))"
+    )).scalar()
+
+
+def list_partitions(conn):
+    return [dict(row) for row in conn.execute(text(PARTITIONS_QUERY)).mappings()]
+
+
+# Create the partitions for the given days that do not exist yet, with the interval of the
+# existing partitions unless one is given. Rows parked in the default partition for a new range
+# are moved into it first, so ATTACH does not fail on them.
+# Runs on the caller's connection and transaction; returns the names created.
+def ensure_partitions(conn, days, interval=None):
+    partitions = list_partitions(conn)
+    existing = {partition["name"] for partition in partitions}
+    interval = interval or existing_interval(partitions)
+    created = []
+    for name, start, end in sorted({partition_for(day, interval) for day in days if day is not None}):
+        if name in existing:
+            continue
+        conn.execute(text(f"CREATE TABLE {name} (LIKE traffic_stops INCLUDING DEFAULTS)"))
+        conn.execute(text(
+            f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE stop_date >= :start AND stop_date < :end "
+            f"RETURNING *) INSERT INTO {name} SELECT * FROM moved"
+        ), {"start": start, "end": end})
+        conn.execute(text(f"ALTER TABLE traffic_stops ATTACH PARTITION {name} FOR VALUES FROM ('{start}') TO ('{end}')"))
+        created.append(name)
+    return created
+
+
+# A unique index on a partitioned table must include the partition key
+def _partitioned_index(definition):
+    if " UNIQUE " not in definition:
+        return definition
+    return re.sub(r"USING (\w+) \(([^)]*)\)",
+                  lambda m: m.group(0) if "stop_date" in m.group(2) else f"USING {m.group(1)} ({m.group(2)}, stop_date)",
+                  definition, count=1)
+
+
+# Rebuild traffic_stops as a range-partitioned table, keeping stop_ids, the stop_id sequence
+# and every index. One transaction under an exclusive lock: readers and writers wait until it commits.
+def partition_ledger(interval=None):
+    with db.connect() as conn, conn.begin():
+        if is_partitioned(conn):
+            return []
+        conn.execute(text("LOCK TABLE traffic_stops IN ACCESS EXCLUSIVE MODE"))
+        sequence = conn.execute(text("SELECT pg_get_serial_sequence('traffic_stops', 'stop_id')")).scalar()
+        indexes = conn.execute(text(
+            "SELECT indexdef FROM pg_indexes WHERE schemaname = current_schema() AND tablename = 'traffic_stops'"
+        )).scalars().all()
+        first, last = conn.execute(text("SELECT MIN(stop_date), MAX(stop_date) FROM traffic_stops")).one()
+
+        conn.execute(text("CREATE TABLE traffic_stops_partitioned (LIKE traffic_stops INCLUDING DEFAULTS) "
+                          "PARTITION BY RANGE (stop_date)"))
+        conn.execute(text(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF traffic_stops_partitioned DEFAULT"))
+        created = []
+        if first is not None:
+            for name, start, end in partitions_between(first, last, interval):
+                conn.execute(text(f"CREATE TABLE {name} PARTITION OF traffic_stops_partitioned "
+                                  f"FOR VALUES FROM ('{start}') TO ('{end}')"))
+                created.append(name)
+        conn.execute(text("INSERT INTO traffic_stops_partitioned SELECT * FROM traffic_stops"))
+        if sequence:
+            conn.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY traffic_stops_partitioned.stop_id"))
+        conn.execute(text("DROP TABLE traffic_stops"))
+        conn.execute(text("ALTER TABLE traffic_stops_partitioned RENAME TO traffic_stops"))
+        for definition in indexes:
+            conn.execute(text(_partitioned_index(definition)))
+        conn.execute(text("ANALYZE traffic_stops"))
+    notify_write("traffic_stops")
+    return created
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise RuntimeError("Archiving partitions needs pyarrow: pip install pyarrow")
+
+
+def _archive_schema():
+    fields = [pa.field("stop_id", pa.int64())]
+    for column, sql_type in LEDGER_SCHEMA:
+        arrow_type = getattr(pa, _ARROW_TYPES[sql_type])
+        fields.append(pa.field(column, arrow_type("us") if sql_type == "time" else arrow_type()))
+    return pa.schema(fields)
+
+
+# Copy one partition to a Parquet file; returns rows written
+def _export_partition(name, path, chunksize=100_000):
+    schema, rows = _archive_schema(), 0
+    with pq.ParquetWriter(path + ".tmp", schema) as writer:
+        for chunk in iter_chunks(f"SELECT {', '.join(schema.names)} FROM {name}", chunksize):
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+            rows += len(chunk)
+    os.replace(path + ".tmp", path)
+    return rows
+
+
+# Move partitions that end on or before a date to Parquet files in the archive directory,
+# then detach them (and drop them unless keep=True). Their stops are taken out of the rollups in
+# the same transaction, so rollup insights keep matching the ledger. Returns {partition: rows archived}.
+def archive_partitions(before, directory=None, keep=False):
+    _require_pyarrow()
+    directory = directory or db.setting("archive_dir")
+    os.makedirs(directory, exist_ok=True)
+    with db.connect() as conn:
+        partitions = list_partitions(conn)
+    archived = {}
+    for partition in partitions:
+        bounds = partition_range(partition)
+        if not bounds or bounds[1] > before:
+            continue
+        name = partition["name"]
+        rows = _export_partition(name, os.path.join(directory, f"{name}.parquet"))
+        with db.connect() as conn, conn.begin():
+            conn.execute(text(f"SELECT pg_advisory_xact_lock({ROLLUP_LOCK_KEY})"))
+            count = conn.execute(text(f"SELECT count(*) FROM {name}")).scalar()
+            if count != rows:
+                raise RuntimeError(f"{name} changed while it was archived ({rows:,} exported, {count:,} now)")
+            subtract_rollups(conn, name)
+            conn.execute(text(f"ALTER TABLE traffic_stops DETACH PARTITION {name}"))
+            if not keep:
+                conn.execute(text(f"DROP TABLE {name}"))
+        archived[name] = rows
+    if archived:
+        for table in ["traffic_stops", *ROLLUPS]:
+            notify_write(table)
+    return archived
+
+
+# Command line: python -m securecheck.partitions {list,convert,archive}
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage the stop_date partitions of traffic_stops")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="show partitions with row estimates and sizes")
+    convert = commands.add_parser("convert", help="rebuild traffic_stops as a partitioned table")
+    convert.add_argument("--interval", choices=["month", "year"],
+                         help="default: partition_interval setting; later ingests keep the interval chosen here")
+    archive = commands.add_parser("archive", help="move old partitions to Parquet and take their stops out of the rollups")
+    archive.add_argument("--before", required=True, type=datetime.date.fromisoformat,
+                         help="archive partitions ending on or before this date (YYYY-MM-DD)")
+    archive.add_argument("--dir", help="archive directory (default: archive_dir setting)")
+    archive.add_argument("--keep", action="store_true", help="detach but do not drop the partitions")
+    args = parser.parse_args()
+    if args.command == "convert":
+        print(f"Created {len(partition_ledger(args.interval))} partition(s)")
+    elif args.command == "archive":
+        for name, rows in archive_partitions(args.before, args.dir, args.keep).items():
+            print(f"{name}: {rows:,} rows archived")
+    else:
+        with db.connect() as conn:
+            for partition in list_partitions(conn):
+                print(f"{partition['name']:<28} {partition['estimated_rows']:>12,} rows "
+                      f"{partition['bytes'] / 1024 / 1024:>10.1f} MB  {partition['bounds']}")
@@ -0,0 +1,209 @@
+import threading
+import time
+from collections import Counter, defaultdict
+
+import pandas as pd
+
+from securecheck.db import fetch_data
+
+
+DEFAULT_OUTCOME = "Warning"
+DEFAULT_VIOLATION = "Speeding"
+
+# Lookup levels, most specific first; a level with no stops falls back to the next one
+KEY_FIELDS = ["driver_gender", "driver_age", "search_conducted", "stop_duration", "drugs_related_stop"]
+LEVELS = [
+    ("driver_gender", "driver_age", "search_conducted", "stop_duration", "drugs_related_stop"),
+    ("driver_gender", "search_conducted", "stop_duration", "drugs_related_stop"),
+    ("driver_gender", "search_conducted", "drugs_related_stop"),
+    ("search_conducted", "drugs_related_stop"),
+    (),
+]
+
+# Outcome/violation counts per full key for stops above a stop_id watermark. Key NULLs are
+# normalised the same way clean_data does; stops with no recorded outcome or violation (such as
+# stops saved from the form) have nothing to predict from and are left out, like known_outcomes.
+COUNTS_QUERY = """SELECT
+    COALESCE(driver_gender, 'Unknown') AS driver_gender,
+    driver_age::int AS driver_age,
+    COALESCE(search_conducted, FALSE) AS search_conducted,
+    COALESCE(stop_duration, 'Unknown') AS stop_duration,
+    COALESCE(drugs_related_stop, FALSE) AS drugs_related_stop,
+    stop_outcome,
+    violation,
+    COUNT(*) AS stops,
+    MAX(stop_id) AS last_stop_id
+FROM traffic_stops
+WHERE stop_id > :watermark
+  AND stop_outcome IS NOT NULL AND stop_outcome <> 'Unknown'
+  AND violation IS NOT NULL AND violation <> 'Unknown'
+GROUP BY 1, 2, 3, 4, 5, 6, 7"""
+
+# A few ledger stops with exactly the given key, for the form's preview
+MATCHES_QUERY = """SELECT *
+FROM traffic_stops
+WHERE COALESCE(driver_gender, 'Unknown') = :driver_gender
+  AND driver_age = :driver_age
+  AND COALESCE(search_conducted, FALSE) = :search_conducted
+  AND COALESCE(stop_duration, 'Unknown') = :stop_duration
+  AND COALESCE(drugs_related_stop, FALSE) = :drugs_related_stop
+  AND stop_outcome IS NOT NULL AND stop_outcome <> 'Unknown'
+  AND violation IS NOT NULL AND violation <> 'Unknown'
+LIMIT :limit"""
+
+
+# Rows of a cleaned ledger with a recorded outcome and violation (cleaning turned NULL into 'Unknown')
+def known_outcomes(df):
+    known = pd.Series(True, index=df.index)
+    for col in ("stop_outcome", "violation"):
+        known &= df[col].notna() & (df[col] != "Unknown")
+    return known
+
+
+# Same tie-break as pandas .mode()[0]: highest count, then the smallest value
+def _mode(counter):
+    return min(counter.items(), key=lambda item: (-item[1], item[0]))[0] if counter else None
+
+
+def make_key(driver_gender, driver_age, search_conducted, stop_duration, drugs_related_stop):
+    return (
+        str(driver_gender),
+        None if driver_age is None or pd.isna(driver_age) else int(driver_age),
+        bool(int(search_conducted)),
+        str(stop_duration),
+        bool(int(drugs_related_stop)),
+    )
+
+
+# Hash index from stop attributes to the modal stop outcome and violation
+class PredictionIndex:
+    def __init__(self):
+        self.watermark = 0
+        self.refreshed_at = 0.0
+        self.offline = False
+        # level -> sub-key -> [outcome Counter, violation Counter]
+        self._counts = {level: defaultdict(lambda: [Counter(), Counter()]) for level in LEVELS}
+        # level -> sub-key -> (stops, outcome, violation); rebuilt lazily for keys that changed
+        self._modes = {level: {} for level in LEVELS}
+        # level -> DataFrame of every sub-key's prediction, for batch scoring; dropped on any change
+        self._tables = {}
+        self._lock = threading.Lock()  # guards the counts, modes and tables
+        self._refresh_lock = threading.Lock()
+
+    # Fold counts for one full key into every lookup level
+    def _add(self, key, outcome, violation, stops):
+        values = dict(zip(KEY_FIELDS, key))
+        for level in LEVELS:
+            sub_key = tuple(values[field] for field in level)
+            counts = self._counts[level][sub_key]
+            counts[0][outcome] += stops
+            counts[1][violation] += stops
+            self._modes[level].pop(sub_key, None)
+        self._tables.clear()
+
+    # Pull in stops logged since the last refresh (the first call loads everything). The query
+    # runs outside the lock, so predictions are not held up by the round trip.
+    def refresh(self):
+        with self._refresh_lock:
+            delta = fetch_data(COUNTS_QUERY, params={"watermark": self.watermark})
+            with self._lock:
+                for row in delta.itertuples(index=False):
+                    key = make_key(row.driver_gender, row.driver_age, row.search_conducted,
+                                   row.stop_duration, row.drugs_related_stop)
+                    self._add(key, row.stop_outcome, row.violation, int(row.stops))
+                if not delta.empty:
+                    self.watermark = max(self.watermark, int(delta["last_stop_id"].max()))
+                self.refreshed_at = time.monotonic()
+            return len(delta)
+
+    def refresh_if_stale(self, max_age=30):
+        if not self.offline and time.monotonic() - self.refreshed_at >= max_age:
+            self.refresh()
+
+    # Build the counts from a cleaned in-memory ledger instead of the database
+    def load_frame(self, df):
+        with self._lock:
+            self.offline = True
+            if df.empty:
+                return 0
+            df = df[known_outcomes(df)]
+            groups = df.groupby(KEY_FIELDS + ["stop_outcome", "violation"], observed=True, dropna=False).size()
+            for (*key, outcome, violation), stops in groups.items():
+                if stops:
+                    self._add(make_key(*key), outcome, violation, int(stops))
+            if "stop_id" in df.columns:
+                self.watermark = int(df["stop_id"].max())
+            self.refreshed_at = time.monotonic()
+            return len(groups)
+
+    # Cached mode of a sub-key; the caller holds the lock
+    def _lookup(self, level, sub_key):
+        cached = self._modes[level].get(sub_key)
+        if cached is None:
+            counts = self._counts[level].get(sub_key)
+            if counts is None:
+                return None
+            cached = (sum(counts[0].values()), _mode(counts[0]), _mode(counts[1]))
+            self._modes[level][sub_key] = cached
+        return cached
+
+    # Every sub-key of a level with its prediction: the level's key columns plus matching_stops,
+    # outcome and violation. Built once per level and reused until new stops arrive.
+    def prediction_table(self, level):
+        with self._lock:
+            table = self._tables.get(level)
+            if table is None:
+                rows = [sub_key + self._lookup(level, sub_key) for sub_key in list(self._counts[level])]
+                table = pd.DataFrame(rows, columns=list(level) + ["matching_stops", "outcome", "violation"])
+                if "driver_age" in level:
+                    table["driver_age"] = table["driver_age"].astype("Int64")
+                self._tables[level] = table
+            return table
+
+    # Predicted outcome and violation for a stop: a dict lookup per level until one has data
+    def predict(self, driver_gender, driver_age, search_conducted, stop_duration, drugs_related_stop):
+        values = dict(zip(KEY_FIELDS, make_key(driver_gender, driver_age, search_conducted,
+                                                stop_duration, drugs_related_stop)))
+        with self._lock:
+            for depth, level in enumerate(LEVELS):
+                found = self._lookup(level, tuple(values[field] for field in level))
+                if found:
+                    stops, outcome, violation = found
+                    return {"outcome": outcome, "violation": violation, "matching_stops": stops,
+                            "level": level, "fallback": depth > 0}
+        return {"outcome": DEFAULT_OUTCOME, "violation": DEFAULT_VIOLATION, "matching_stops": 0,
+                "level": None, "fallback": True}
+
+
+# A few ledger stops with exactly this key: from the cleaned in-memory ledger when one is given,
+# otherwise from the database
+def matching_stops(driver_gender, driver_age, search_conducted, stop_duration, drugs_related_stop,
+                   ledger=None, limit=5):
+    key = dict(zip(KEY_FIELDS, make_key(driver_gender, driver_age, search_conducted,
+                                        stop_duration, drugs_related_stop)))
+    if ledger is None:
+        return fetch_data(MATCHES_QUERY, params={**key, "limit": limit})
+    matches = known_outcomes(ledger)
+    for field, value in key.items():
+        matches &= ledger[field].astype(object) == value
+    return ledger[matches].head(limit)
+
+
+_predictor = None
+_predictor_lock = threading.Lock()
+
+
+# Process-wide prediction index, loaded on first use from the database, or from
+# a cleaned in-memory ledger when one is given
+def get_predictor(ledger=None):
+    global _predictor
+    if _predictor is None:
+        with _predictor_lock:
+            if _predictor is None:
+                predictor = PredictionIndex()
+                if ledger is not None:
+                    predictor.load_frame(ledger)
+                else:
+                    predictor.refresh()
+                _predictor = predictor
+    return _predictor
@@ -0,0 +1,278 @@
+# Insight SQL run by the dashboard. Each query reads the full traffic_stops ledger.
+
+# Medium queries
+MEDIUM_QUERIES = {
+"1: What are the top 10 vehicle_Number involved in drug-related stops?" : """Select vehicle_number, drugs_related_stop 
+from traffic_stops 
+where drugs_related_stop limit 10""",
+"2: Which vehicles were most frequently searched?" : """select vehicle_number, count(*) as search_count
+from traffic_stops 
+where search_conducted group by vehicle_number order by search_count desc limit 1""",
+"3: Which driver age group had the highest arrest rate?" : """select 
+	case
+	when driver_age <= 18 then 'under18'
+	when driver_age <= 25 then '18-25'
+	when driver_age <= 35 then '26-35'
+	when driver_age <= 50 then '36-50'
+	when driver_age <= 65 then '51-65'
+	else '65+'
+end as age_group,
+    driver_age,
+    avg(case when is_arrested then 1 else 0 END) as arrest_rate
+from 
+    traffic_stops
+group by 
+    driver_age
+order by 
+    arrest_rate DESC
+limit 1;""",
+"4: What is the gender distribution of drivers stopped in each country?" : """select
+    country_name,
+    driver_gender,
+    count(*) as num_stops
+from
+    traffic_stops
+group by
+    country_name,
+    driver_gender
+order by
+    country_name,
+    driver_gender;""",
+"5: Which race and gender combination has the highest search rate?" : """select
+    driver_race,
+    driver_gender,
+    count(*) filter (where search_conducted) as num_searches,
+    count(*) as total_stops,
+    round(count(*) filter (where search_conducted) * 100.0 / count(*), 2) as search_rate
+from
+    traffic_stops
+group by
+    driver_race,
+    driver_gender
+order by
+    search_rate desc
+limit 1;""",
+"6: What time of day sees the most traffic stops?" : """select 
+extract (hour from stop_time) as hour_of_day,
+count(*) as no_of_stops
+from traffic_stops
+where stop_time IS NOT NULL
+group by hour_of_day
+order by no_of_stops desc
+limit 1;""",
+"7: What is the average stop duration for different violations?" : """select violation,
+round(avg(case
+	when stop_duration = '0-15 Min' then 15
+	when stop_duration = '16-30 Min' then 30
+	when stop_duration = '30+ Min' then 45
+end),3) as avg_duration
+from traffic_stops
+where stop_duration is not null
+group by violation
+order by avg_duration desc;""",
+"8: Are stops during the night more likely to lead to arrests?" : """select 
+  case when extract(HOUR from stop_time::time) between 6 and 17 then 'Day'
+    else 'Night'
+  end as time_of_day,
+  count(*) as total_stops,
+  sum(case when is_arrested then 1 else 0 end) as total_arrests,
+  round(sum(case when is_arrested then 1 else 0 END) * 100.0 / count(*),2
+  ) as arrest_rate_percentage
+from traffic_stops
+group by time_of_day;""",
+"9: Which violations are most associated with searches or arrests?" : """select 
+  violation,
+  count(*) as total_stops,
+  sum(case when search_conducted then 1 else 0 end) as total_searches,
+  sum(case when is_arrested then 1 else 0 end) as total_arrests,
+  round(sum(case when search_conducted then 1 else 0 end) * 100.0 / count(*), 2) as search_rate_percentage,
+  round(sum(case when is_arrested then 1 else 0 end) * 100.0 / count(*), 2) as arrest_rate_percentage
+from traffic_stops
+group by violation
+order by total_searches desc, total_arrests desc;""",
+"10: Which violations are most common among younger drivers (<25)?" : """select violation,
+count(*) as young_driver_stops
+from traffic_stops
+where driver_age < 25
+group by violation
+order by young_driver_stops desc;""",
+"11: Is there a violation that rarely results in search or arrest?" : """select violation,
+	count(*) as total_stops,
+	sum(case when search_conducted then 1 else 0 end) as total_searches,
+	sum(case when is_arrested then 1 else 0 end) as total_arrests,
+	round(sum(case when search_conducted then 1 else 0 end) *100.0 / count(*),2) as search_percent,
+	round(sum(case when is_arrested then 1 else 0 end) *100.0 / count(*),2) as arrest_percent
+from traffic_stops
+Group by violation
+order by total_searches asc, total_arrests asc
+limit 5;""",
+"12: Which countries report the highest rate of drug-related stops?" : """select country_name,
+count(*) as total_stops,
+sum(case when drugs_related_stop then 1 else 0 end) as total_drug_related_stops,
+round(sum(case when drugs_related_stop then 1 else 0 end) * 100.0 / count(*), 2) as total_drug_related_stops_percent
+from traffic_stops
+group by country_name
+order by total_drug_related_stops_percent desc;""",
+"13: What is the arrest rate by country and violation?" : """select country_name, violation,
+count(*) as total_stops,
+sum(case when is_arrested then 1 else 0 end) as total_arrests,
+round(sum(case when is_arrested then 1 else 0 end) *100.0 / count(*),2) as arrest_percent
+from traffic_stops
+group by country_name, violation
+order by arrest_percent desc;""",
+"14: Which country has the most stops with search conducted?" : """select country_name,
+count(*) as total_stops_per_country
+from traffic_stops
+where search_conducted
+group by country_name
+order by total_stops_per_country desc
+limit 1;"""
+}
+
+# Complex queries
+COMPLEX_QUERIES = {
+"1: Yearly Breakdown of Stops and Arrests by Country (Using Subquery and Window Functions" : """SELECT 
+    country_name,
+    year,
+    total_stops,
+    total_arrests,
+    ROUND(total_arrests * 100.0 / NULLIF(total_stops, 0), 2) AS arrest_rate,
+    SUM(total_stops) OVER (PARTITION BY country_name ORDER BY year) AS cumulative_stops,
+    SUM(total_arrests) OVER (PARTITION BY country_name ORDER BY year) AS cumulative_arrests
+FROM (
+    SELECT 
+        country_name,
+        EXTRACT(YEAR FROM stop_date) AS year,
+        COUNT(*) AS total_stops,
+        COUNT(*) FILTER (WHERE is_arrested) AS total_arrests
+    FROM 
+        traffic_stops
+    GROUP BY 
+        country_name, year
+) AS yearly_stats
+ORDER BY 
+    country_name, year;""",
+
+"2: Driver Violation Trends Based on Age and Race (Join with Subquery)" : """    
+ -- Subquery: Count of violations by driver age and race
+WITH age_race_violations AS (
+    SELECT 
+        driver_age,
+        driver_race,
+        violation,
+        COUNT(*) AS stop_count
+    FROM 
+        traffic_stops
+    WHERE 
+        driver_age IS NOT NULL AND driver_race IS NOT NULL AND violation IS NOT NULL
+    GROUP BY 
+        driver_age, driver_race, violation
+),
+
+-- Subquery: Total stops by driver age and race
+age_race_totals AS (
+    SELECT 
+        driver_age,
+        driver_race,
+        COUNT(*) AS total_stops
+    FROM 
+        traffic_stops
+    WHERE 
+        driver_age IS NOT NULL AND driver_race IS NOT NULL
+    GROUP BY 
+        driver_age, driver_race
+)
+
+-- Final Join to calculate % of each violation type per age-race group
+SELECT 
+    v.driver_age,
+    v.driver_race,
+    v.violation,
+    v.stop_count,
+    t.total_stops,
+    ROUND(v.stop_count * 100.0 / t.total_stops, 2) AS violation_percent
+FROM 
+    age_race_violations v
+JOIN 
+    age_race_totals t
+ON 
+    v.driver_age = t.driver_age AND v.driver_race = t.driver_race
+ORDER BY 
+    violation_percent DESC
+LIMIT 100;
+""",
+
+"3: Time Period Analysis of Stops (Joining with Date Functions) , Number of Stops by Year,Month, Hour of the Day" : """SELECT 
+    EXTRACT(YEAR FROM stop_date) AS stop_year,
+    TO_CHAR(stop_date, 'Month') AS stop_month_name,
+    EXTRACT(MONTH FROM stop_date) AS stop_month,
+    EXTRACT(HOUR FROM stop_time::time) AS stop_hour,
+    COUNT(*) AS total_stops
+FROM 
+    traffic_stops
+WHERE 
+    stop_date IS NOT NULL AND stop_time IS NOT NULL
+GROUP BY 
+    stop_year, stop_month_name, stop_month, stop_hour
+ORDER BY 
+    stop_year, stop_month, stop_hour;
+""",
+
+"4: Violations with High Search and Arrest Rates (Window Function)" : """SELECT *
+FROM (
+    SELECT 
+        violation,
+        COUNT(*) AS total_stops,
+        SUM(CASE WHEN search_conducted THEN 1 ELSE 0 END) AS total_searches,
+        SUM(CASE WHEN is_arrested THEN 1 ELSE 0 END) AS total_arrests,
+        ROUND(SUM(CASE WHEN search_conducted THEN 1 ELSE 0 END) * 100.0 / COUNT(*), 2) AS search_rate,
+        ROUND(SUM(CASE WHEN is_arrested THEN 1 ELSE 0 END) * 100.0 / COUNT(*), 2) AS arrest_rate,
+        RANK() OVER (ORDER BY 
+            SUM(CASE WHEN search_conducted THEN 1 ELSE 0 END) * 1.0 / COUNT(*) DESC
+        ) AS search_rank,
+        RANK() OVER (ORDER BY 
+            SUM(CASE WHEN is_arrested THEN 1 ELSE 0 END) * 1.0 / COUNT(*) DESC
+        ) AS arrest_rank
+    FROM 
+        traffic_stops
+    WHERE 
+        violation IS NOT NULL
+    GROUP BY 
+        violation
+) AS ranked_data
+ORDER BY 
+    search_rank + arrest_rank
+LIMIT 10;
+""",
+
+"5: Driver Demographics by Country (Age, Gender, and Race)" : """SELECT 
+    country_name, 
+    driver_age, 
+    driver_gender, 
+    driver_race
+FROM 
+    traffic_stops
+GROUP BY 
+    country_name, 
+    driver_age, 
+    driver_gender, 
+    driver_race
+ORDER BY 
+    country_name, 
+    driver_age;""",
+
+"6: Top 5 Violations with Highest Arrest Rates" : """SELECT 
+    violation,
+    COUNT(*) AS total_stops,
+    SUM(CASE WHEN is_arrested THEN 1 ELSE 0 END) AS total_arrests,
+    ROUND(SUM(CASE WHEN is_arrested THEN 1 ELSE 0 END) * 100.0 / COUNT(*), 2) AS arrest_rate
+FROM 
+    traffic_stops
+WHERE 
+    violation IS NOT NULL
+GROUP BY 
+    violation
+ORDER BY 
+    arrest_rate DESC
+LIMIT 5;"""
+}
@@ -0,0 +1,240 @@
+import argparse
+import datetime
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from securecheck.backends import get_backend
+from securecheck.cube import COMPLEX_ANSWERS, DIMENSIONS, MEASURES, MEDIUM_ANSWERS, predicate
+from securecheck.export import export_chunks
+from securecheck.filters import AGE_BANDS, active_filters, age_band_filters, apply_filters, tables_read
+from securecheck.parallel import run_all_insights, submit
+
+
+REPORT_FORMATS = ["parquet", "csv", "json"]
+
+# Cube dimensions as ledger expressions, for the shared scan
+DIMENSION_SQL = {
+    "country_name": "country_name",
+    "violation": "violation",
+    "driver_gender": "driver_gender",
+    "driver_race": "driver_race",
+    "driver_age": "driver_age",
+    "stop_duration": "stop_duration",
+    "stop_year": "CAST(EXTRACT(YEAR FROM stop_date) AS INTEGER)",
+    "stop_month": "CAST(EXTRACT(MONTH FROM stop_date) AS INTEGER)",
+    "stop_hour": "CAST(EXTRACT(HOUR FROM stop_time) AS INTEGER)",
+}
+NUMERIC_DIMENSIONS = {"driver_age", "stop_year", "stop_month", "stop_hour"}
+
+# One pass over the ledger for every GROUP BY shape at once: each grouping set is one shape,
+# and GROUPING() tells which set a row belongs to
+SCAN_QUERY = """SELECT {grouping} AS grouping_id, {dimensions}, {measures}
+FROM (
+    SELECT {dimension_columns}, search_conducted, is_arrested, drugs_related_stop
+    FROM traffic_stops
+) AS stops
+GROUP BY GROUPING SETS ({sets})"""
+
+
+# Insight key for a query label: "medium-3" for "3: Which driver age group..."
+def insight_key(group, label):
+    return f"{group}-{label.split(':', 1)[0].strip()}"
+
+
+# A GROUP BY shape: the dimensions a roll-up groups or filters by, in DIMENSIONS order
+def _shape(dims, where=None):
+    wanted = set(dims) | set(where or {})
+    return tuple(dim for dim in DIMENSIONS if dim in wanted)
+
+
+# Stands in for the cube while an answer runs, recording the roll-ups it asks for
+class _ShapeRecorder:
+    def __init__(self):
+        self.shapes = []
+
+    def rollup(self, dims, where=None):
+        self.shapes.append(_shape(dims, where))
+        return pd.DataFrame(columns=list(dims) + list(MEASURES))
+
+
+# GROUP BY shapes an insight answer reads
+def answer_shapes(answer):
+    recorder = _ShapeRecorder()
+    try:
+        answer(recorder, {})
+    except Exception:  # an answer may not cope with empty roll-ups; the shapes are recorded by then
+        pass
+    return recorder.shapes
+
+
+# Insights grouped by the GROUP BY shapes they read: {shape: [insight keys]}
+def plan_scan(answers):
+    plan = {}
+    for key, answer in answers.items():
+        for shape in answer_shapes(answer):
+            if key not in plan.setdefault(shape, []):
+                plan[shape].append(key)
+    return plan
+
+
+def scan_query(shapes):
+    dims = [dim for dim in DIMENSIONS if any(dim in shape for shape in shapes)]
+    return SCAN_QUERY.format(
+        grouping=f"GROUPING({', '.join(dims)})",
+        dimensions=", ".join(dims),
+        measures=", ".join("COUNT(*) AS stops" if column is None else f"COUNT(*) FILTER (WHERE {column}) AS {measure}"
+                           for measure, column in MEASURES.items()),
+        dimension_columns=", ".join(f"{DIMENSION_SQL[dim]} AS {dim}" for dim in dims),
+        sets=", ".join(f"({', '.join(shape)})" for shape in shapes),
+    ), dims
+
+
+# Dimension values as the cube holds them: plain Python values, None for NULL
+def _plain_values(values, dim):
+    if dim in NUMERIC_DIMENSIONS:
+        numbers = pd.array(pd.to_numeric(values, errors="coerce"), dtype="Int64")
+        return np.array([None if value is pd.NA else int(value) for value in numbers], dtype=object)
+    return values.astype(object).where(values.notna(), None).to_numpy(dtype=object)
+
+
+# Result of the shared scan. rollup() answers like CountCube.rollup, so the cube's insight
+# answers run on it unchanged.
+class SharedScan:
+    def __init__(self, frame, shapes, dims):
+        self._frames = {}
+        for shape in shapes:
+            grouping_id = sum(1 << (len(dims) - 1 - i) for i, dim in enumerate(dims) if dim not in shape)
+            rows = frame[frame["grouping_id"] == grouping_id]
+            self._frames[shape] = pd.DataFrame(
+                {**{dim: _plain_values(rows[dim], dim) for dim in shape},
+                 **{measure: rows[measure].astype("int64").to_numpy() for measure in MEASURES}})
+
+    def rollup(self, dims, where=None):
+        where = where or {}
+        df = self._frames[_shape(dims, where)]
+        if not where and len(dims) == len(df.columns) - len(MEASURES):
+            return df[list(dims) + list(MEASURES)].copy()
+        for dim, condition in where.items():
+            matches = predicate(condition)
+            df = df[np.fromiter((matches(value) for value in df[dim]), dtype=bool, count=len(df))]
+        df = df.groupby(list(dims), dropna=False, sort=False)[list(MEASURES)].sum().reset_index()
+        return df[df["stops"] > 0].reset_index(drop=True)
+
+
+# Run the shared scan for the given shapes; returns a SharedScan
+def shared_scan(backend, shapes, filters=None):
+    query, dims = scan_query(shapes)
+    return SharedScan(backend.run(*apply_filters(query, filters)), shapes, dims)
+
+
+def write_result(df, path, file_format):
+    if file_format == "json":
+        df.to_json(path + ".tmp", orient="records", date_format="iso", indent=2)
+        os.replace(path + ".tmp", path)
+    else:
+        export_chunks([df], path, file_format)
+    return path
+
+
+# Compute the selected insights (keys like "medium-3"; None for all) and write one file per
+# insight to out_dir. Insights the cube can answer and whose query reads the ledger itself share
+# a single scan of it, one grouping set per GROUP BY shape; the rest (rollup-served and
+# per-vehicle insights) run as their own queries alongside it. shared=False runs every insight
+# as its own query. Returns the per-insight summary (source, rows, seconds, error, file) with
+# the wall time, the number of shapes and the shared scan's error if it failed.
+def run_report(out_dir, keys=None, file_format="parquet", filters=None, backend=None, shared=True):
+    if file_format not in REPORT_FORMATS:
+        raise ValueError(f"Unknown report format {file_format!r}; use one of {', '.join(REPORT_FORMATS)}")
+    backend = backend or get_backend()
+    medium, complex_ = backend.insight_queries(filters=filters)
+    insights = {insight_key(group, label): (label, query, answers.get(label.split(":", 1)[0].strip()))
+                for group, queries, answers in (("medium", medium, MEDIUM_ANSWERS), ("complex", complex_, COMPLEX_ANSWERS))
+                for label, query in queries.items()}
+    unknown = sorted(set(keys or []) - set(insights))
+    if unknown:
+        raise ValueError(f"Unknown insights {', '.join(unknown)}; choose from {', '.join(insights)}")
+    selected = {key: insights[key] for key in (keys or insights)}
+    # A query the backend already routes to a rollup reads a few thousand rows; scanning the
+    # ledger for it instead would be slower
+    scanned = {key: answer for key, (label, query, answer) in selected.items()
+               if shared and answer is not None and tables_read(apply_filters(query, filters)[0]) == {"traffic_stops"}}
+    own = {key: apply_filters(query, filters) for key, (label, query, answer) in selected.items() if key not in scanned}
+
+    started = time.perf_counter()
+    backend.before_insights()
+    plan = plan_scan(scanned)
+    scan_started = time.perf_counter()
+    scan_future = submit(shared_scan, backend, list(plan), filters) if plan else None
+    results, summary, _ = run_all_insights(backend, own) if own else ({}, None, 0.0)
+    rows = [] if summary is None else [dict(row, source="query") for row in summary.to_dict("records")]
+    scan_error = None
+    if scan_future is not None:
+        try:
+            scan = scan_future.result()
+        except Exception as e:  # still deliver the report: its insights run one by one instead
+            scan_error = str(e)
+            fallback, fallback_summary, _ = run_all_insights(
+                backend, {key: apply_filters(selected[key][1], filters) for key in scanned})
+            results.update(fallback)
+            rows += [dict(row, source="query") for row in fallback_summary.to_dict("records")]
+            scanned, plan = {}, {}
+        scan_seconds = time.perf_counter() - scan_started
+        for key, answer in scanned.items():
+            answer_started = time.perf_counter()
+            results[key] = answer(scan, {}).reset_index(drop=True)
+            rows.append({"insight": key, "rows": len(results[key]), "error": None, "source": "shared scan",
+                         "seconds": round(scan_seconds + time.perf_counter() - answer_started, 3)})
+
+    os.makedirs(out_dir, exist_ok=True)
+    paths = {key: write_result(result, os.path.join(out_dir, f"{key}.{file_format}"), file_format)
+             for key, result in results.items()}
+    summary = pd.DataFrame(rows, columns=["insight", "source", "rows", "seconds", "error"])
+    summary["path"] = summary["insight"].map(paths)
+    summary["label"] = summary["insight"].map(lambda key: selected[key][0])
+    summary = summary.set_index("insight").loc[list(selected)].reset_index()
+    report = {"insights": summary, "seconds": time.perf_counter() - started, "shapes": len(plan), "out": out_dir,
+              "scan_error": scan_error}
+    with open(os.path.join(out_dir, "summary.json"), "w", encoding="utf-8") as f:
+        json.dump({"created": time.strftime("%Y-%m-%dT%H:%M:%S"), "filters": active_filters(filters),
+                   "seconds": report["seconds"], "shapes": report["shapes"], "scan_error": scan_error,
+                   "insights": summary.to_dict("records")},
+                  f, indent=2, default=str)
+    return report
+
+
+def format_summary(report):
+    sources = report["insights"]["source"]
+    text = (f"{len(sources)} insights in {report['seconds']:.2f}s: "
+            f"{int((sources == 'shared scan').sum())} from one shared scan over {report['shapes']} GROUP BY shapes, "
+            f"{int((sources == 'query').sum())} as their own queries; files in {report['out']}")
+    if report.get("scan_error"):
+        text += f"\nShared scan failed, its insights ran as their own queries: {report['scan_error']}"
+    return text
+
+
+# Command line, e.g. nightly from cron:
+#   python -m securecheck.report reports/$(date +%F) --format parquet
+#   python -m securecheck.report out --insights medium-3 complex-1 --date-from 2024-01-01
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compute the dashboard insights and write them to files")
+    parser.add_argument("out", help="directory for the result files (one per insight, plus summary.json)")
+    parser.add_argument("--format", choices=REPORT_FORMATS, default="parquet")
+    parser.add_argument("--insights", nargs="+", metavar="KEY", help="only these, e.g. medium-3 complex-1 (default: all)")
+    parser.add_argument("--separate", action="store_true", help="run every insight as its own query (no shared scan)")
+    parser.add_argument("--country", dest="country_name")
+    parser.add_argument("--violation")
+    parser.add_argument("--gender", dest="driver_gender")
+    parser.add_argument("--age-band", choices=list(AGE_BANDS))
+    parser.add_argument("--date-from", type=datetime.date.fromisoformat, help="first stop date (YYYY-MM-DD)")
+    parser.add_argument("--date-to", type=datetime.date.fromisoformat, help="last stop date (YYYY-MM-DD)")
+    args = parser.parse_args()
+    report_filters = {"country_name": args.country_name, "violation": args.violation,
+                      "driver_gender": args.driver_gender, "date_from": args.date_from, "date_to": args.date_to,
+                      **age_band_filters(args.age_band)}
+    report = run_report(args.out, args.insights, args.format, report_filters, shared=not args.separate)
+    print(report["insights"][["insight", "source", "rows", "seconds", "error"]].to_string(index=False))
+    print(format_summary(report))
@@ -0,0 +1,454 @@
+import threading
+import time
+
+from sqlalchemy import text
+
+from securecheck import db
+from securecheck.cache import notify_write
+from securecheck.filters import filter_columns, tables_read
+from securecheck.queries import COMPLEX_QUERIES, MEDIUM_QUERIES
+
+
+# Summary tables kept next to traffic_stops: name -> [(column, source expression, type)].
+# Every rollup stores the same measures, so insights only re-aggregate a few thousand groups.
+ROLLUPS = {
+    "rollup_country_year": [
+        ("country_name", "country_name", "text"),
+        ("stop_year", "EXTRACT(YEAR FROM stop_date::date)::int", "int"),
+    ],
+    "rollup_time": [
+        ("stop_year", "EXTRACT(YEAR FROM stop_date::date)::int", "int"),
+        ("stop_month", "EXTRACT(MONTH FROM stop_date::date)::int", "int"),
+        ("stop_hour", "EXTRACT(HOUR FROM stop_time::time)::int", "int"),
+    ],
+    "rollup_demographics": [
+        ("country_name", "country_name", "text"),
+        ("driver_gender", "driver_gender", "text"),
+        ("driver_race", "driver_race", "text"),
+        ("driver_age", "driver_age::int", "int"),
+    ],
+    "rollup_violations": [
+        ("violation", "violation", "text"),
+        ("country_name", "country_name", "text"),
+        ("driver_race", "driver_race", "text"),
+        ("driver_age", "driver_age::int", "int"),
+        ("stop_duration", "stop_duration", "text"),
+    ],
+}
+
+MEASURES = {
+    "stops": "COUNT(*)",
+    "searches": "COUNT(*) FILTER (WHERE search_conducted)",
+    "arrests": "COUNT(*) FILTER (WHERE is_arrested)",
+    "drug_stops": "COUNT(*) FILTER (WHERE drugs_related_stop)",
+}
+
+WATERMARK_DDL = """CREATE TABLE IF NOT EXISTS rollup_watermarks (
+    rollup_name text PRIMARY KEY,
+    last_stop_id bigint NOT NULL DEFAULT 0
+)"""
+
+# NULL dimensions are kept as NULL; the unique key maps them to a sentinel so upserts still match
+_NULL_SENTINEL = {"text": "'~null~'", "int": "-1"}
+
+# Advisory lock serialising refreshes; writers to traffic_stops take its shared form so a
+# refresh never moves the watermark past a stop_id whose transaction has not committed yet
+ROLLUP_LOCK_KEY = "hashtext('securecheck_rollups')"
+
+_refresh_lock = threading.Lock()
+_last_refresh = 0.0
+
+
+def _key_expressions(dimensions):
+    return ", ".join(f"(COALESCE({column}, {_NULL_SENTINEL[kind]}))" for column, _, kind in dimensions)
+
+
+def _create_statements(name, dimensions):
+    columns = ",\n    ".join(f"{column} {kind}" for column, _, kind in dimensions)
+    measures = ",\n    ".join(f"{measure} bigint NOT NULL DEFAULT 0" for measure in MEASURES)
+    return [
+        f"CREATE TABLE IF NOT EXISTS {name} (\n    {columns},\n    {measures}\n)",
+        f"CREATE UNIQUE INDEX IF NOT EXISTS {name}_key ON {name} ({_key_expressions(dimensions)})",
+    ]
+
+
+# Fold the stops with low < stop_id <= high into a rollup
+def _refresh_statement(name, dimensions):
+    columns = ", ".join(column for column, _, _ in dimensions)
+    sources = ", ".join(f"{expression} AS {column}" for column, expression, _ in dimensions)
+    group_by = ", ".join(str(i) for i in range(1, len(dimensions) + 1))
+    measures = ", ".join(f"{expression} AS {measure}" for measure, expression in MEASURES.items())
+    updates = ", ".join(f"{measure} = {name}.{measure} + EXCLUDED.{measure}" for measure in MEASURES)
+    return f"""INSERT INTO {name} ({columns}, {", ".join(MEASURES)})
+SELECT {sources}, {measures}
+FROM traffic_stops
+WHERE stop_id > :low AND stop_id <= :high
+GROUP BY {group_by}
+ON CONFLICT ({_key_expressions(dimensions)}) DO UPDATE SET {updates}"""
+
+
+# Take the stops of source with stop_id <= high back out of a rollup
+def _subtract_statement(name, dimensions, source):
+    sources = ", ".join(f"{expression} AS {column}" for column, expression, _ in dimensions)
+    group_by = ", ".join(str(i) for i in range(1, len(dimensions) + 1))
+    measures = ", ".join(f"{expression} AS {measure}" for measure, expression in MEASURES.items())
+    updates = ", ".join(f"{measure} = {name}.{measure} - removed.{measure}" for measure in MEASURES)
+    matches = " AND ".join(f"COALESCE({name}.{column}, {_NULL_SENTINEL[kind]}) = COALESCE(removed.{column}, {_NULL_SENTINEL[kind]})"
+                           for column, _, kind in dimensions)
+    return f"""UPDATE {name} SET {updates}
+FROM (
+    SELECT {sources}, {measures}
+    FROM {source}
+    WHERE stop_id <= :high
+    GROUP BY {group_by}
+) AS removed
+WHERE {matches}"""
+
+
+# Create the rollup tables and watermark bookkeeping if they do not exist yet
+def setup_rollups():
+    db.execute(WATERMARK_DDL)
+    for name, dimensions in ROLLUPS.items():
+        for statement in _create_statements(name, dimensions):
+            db.execute(statement)
+        db.execute(
+            "INSERT INTO rollup_watermarks (rollup_name) VALUES (:name) ON CONFLICT DO NOTHING",
+            {"name": name},
+        )
+
+
+# Bring every rollup up to date with the newest stops.
+# Runs in one transaction under ROLLUP_LOCK_KEY so concurrent app processes never double count.
+# Returns {rollup name: stops folded in}.
+def refresh_rollups():
+    refreshed = {}
+    with db.connect() as conn, conn.begin():
+        conn.execute(text(f"SELECT pg_advisory_xact_lock({ROLLUP_LOCK_KEY})"))
+        high = conn.execute(text("SELECT COALESCE(MAX(stop_id), 0) FROM traffic_stops")).scalar()
+        watermarks = dict(conn.execute(text("SELECT rollup_name, last_stop_id FROM rollup_watermarks")).all())
+        for name, dimensions in ROLLUPS.items():
+            low = watermarks.get(name, 0)
+            if low >= high:
+                continue
+            conn.execute(text(_refresh_statement(name, dimensions)), {"low": low, "high": high})
+            conn.execute(
+                text("UPDATE rollup_watermarks SET last_stop_id = :high WHERE rollup_name = :name"),
+                {"high": high, "name": name},
+            )
+            refreshed[name] = high - low
+    for name in refreshed:
+        notify_write(name)
+    return refreshed
+
+
+# Take the stops of a table that is leaving the ledger (an archived partition) out of every rollup,
+# up to each rollup's watermark; later stops were never folded in. Runs on the caller's
+# transaction, which holds ROLLUP_LOCK_KEY. Returns {rollup name: groups changed}.
+def subtract_rollups(conn, source):
+    if conn.execute(text("SELECT to_regclass('rollup_watermarks')")).scalar() is None:
+        return {}
+    watermarks = dict(conn.execute(text("SELECT rollup_name, last_stop_id FROM rollup_watermarks")).all())
+    changed = {}
+    for name, dimensions in ROLLUPS.items():
+        result = conn.execute(text(_subtract_statement(name, dimensions, source)), {"high": watermarks.get(name, 0)})
+        conn.execute(text(f"DELETE FROM {name} WHERE stops <= 0"))
+        changed[name] = result.rowcount
+    return changed
+
+
+# refresh_rollups() at most once every min_interval seconds per process
+def refresh_if_stale(min_interval=30):
+    global _last_refresh
+    if time.monotonic() - _last_refresh < min_interval or not _refresh_lock.acquire(blocking=False):
+        return {}
+    try:
+        refreshed = refresh_rollups()
+        _last_refresh = time.monotonic()
+        return refreshed
+    except Exception as e:
+        print(f"Error refreshing rollups: {e}")
+        return {}
+    finally:
+        _refresh_lock.release()
+
+
+# Insight SQL rewritten against the rollups; keys match queries.MEDIUM_QUERIES / COMPLEX_QUERIES.
+# Medium 1 and 2 are per-vehicle and keep reading the ledger.
+MEDIUM_ROLLUP_QUERIES = {
+"3: Which driver age group had the highest arrest rate?" : """select
+	case
+	when driver_age <= 18 then 'under18'
+	when driver_age <= 25 then '18-25'
+	when driver_age <= 35 then '26-35'
+	when driver_age <= 50 then '36-50'
+	when driver_age <= 65 then '51-65'
+	else '65+'
+end as age_group,
+    driver_age,
+    sum(arrests)::numeric / sum(stops) as arrest_rate
+from
+    rollup_demographics
+group by
+    driver_age
+order by
+    arrest_rate DESC
+limit 1;""",
+"4: What is the gender distribution of drivers stopped in each country?" : """select
+    country_name,
+    driver_gender,
+    sum(stops) as num_stops
+from
+    rollup_demographics
+group by
+    country_name,
+    driver_gender
+order by
+    country_name,
+    driver_gender;""",
+"5: Which race and gender combination has the highest search rate?" : """select
+    driver_race,
+    driver_gender,
+    sum(searches) as num_searches,
+    sum(stops) as total_stops,
+    round(sum(searches) * 100.0 / sum(stops), 2) as search_rate
+from
+    rollup_demographics
+group by
+    driver_race,
+    driver_gender
+order by
+    search_rate desc
+limit 1;""",
+"6: What time of day sees the most traffic stops?" : """select
+stop_hour as hour_of_day,
+sum(stops) as no_of_stops
+from rollup_time
+where stop_hour IS NOT NULL
+group by hour_of_day
+order by no_of_stops desc
+limit 1;""",
+"7: What is the average stop duration for different violations?" : """select violation,
+round(sum(case
+	when stop_duration = '0-15 Min' then 15 * stops
+	when stop_duration = '16-30 Min' then 30 * stops
+	when stop_duration = '30+ Min' then 45 * stops
+end)::numeric / sum(case
+	when stop_duration in ('0-15 Min', '16-30 Min', '30+ Min') then stops
+end),3) as avg_duration
+from rollup_violations
+where stop_duration is not null
+group by violation
+order by avg_duration desc;""",
+"8: Are stops during the night more likely to lead to arrests?" : """select
+  case when stop_hour between 6 and 17 then 'Day'
+    else 'Night'
+  end as time_of_day,
+  sum(stops) as total_stops,
+  sum(arrests) as total_arrests,
+  round(sum(arrests) * 100.0 / sum(stops),2
+  ) as arrest_rate_percentage
+from rollup_time
+group by time_of_day;""",
+"9: Which violations are most associated with searches or arrests?" : """select
+  violation,
+  sum(stops) as total_stops,
+  sum(searches) as total_searches,
+  sum(arrests) as total_arrests,
+  round(sum(searches) * 100.0 / sum(stops), 2) as search_rate_percentage,
+  round(sum(arrests) * 100.0 / sum(stops), 2) as arrest_rate_percentage
+from rollup_violations
+group by violation
+order by total_searches desc, total_arrests desc;""",
+"10: Which violations are most common among younger drivers (<25)?" : """select violation,
+sum(stops) as young_driver_stops
+from rollup_violations
+where driver_age < 25
+group by violation
+order by young_driver_stops desc;""",
+"11: Is there a violation that rarely results in search or arrest?" : """select violation,
+	sum(stops) as total_stops,
+	sum(searches) as total_searches,
+	sum(arrests) as total_arrests,
+	round(sum(searches) *100.0 / sum(stops),2) as search_percent,
+	round(sum(arrests) *100.0 / sum(stops),2) as arrest_percent
+from rollup_violations
+Group by violation
+order by total_searches asc, total_arrests asc
+limit 5;""",
+"12: Which countries report the highest rate of drug-related stops?" : """select country_name,
+sum(stops) as total_stops,
+sum(drug_stops) as total_drug_related_stops,
+round(sum(drug_stops) * 100.0 / sum(stops), 2) as total_drug_related_stops_percent
+from rollup_violations
+group by country_name
+order by total_drug_related_stops_percent desc;""",
+"13: What is the arrest rate by country and violation?" : """select country_name, violation,
+sum(stops) as total_stops,
+sum(arrests) as total_arrests,
+round(sum(arrests) *100.0 / sum(stops),2) as arrest_percent
+from rollup_violations
+group by country_name, violation
+order by arrest_percent desc;""",
+"14: Which country has the most stops with search conducted?" : """select country_name,
+sum(searches) as total_stops_per_country
+from rollup_violations
+group by country_name
+having sum(searches) > 0
+order by total_stops_per_country desc
+limit 1;"""
+}
+
+COMPLEX_ROLLUP_QUERIES = {
+"1: Yearly Breakdown of Stops and Arrests by Country (Using Subquery and Window Functions" : """SELECT
+    country_name,
+    year,
+    total_stops,
+    total_arrests,
+    ROUND(total_arrests * 100.0 / NULLIF(total_stops, 0), 2) AS arrest_rate,
+    SUM(total_stops) OVER (PARTITION BY country_name ORDER BY year) AS cumulative_stops,
+    SUM(total_arrests) OVER (PARTITION BY country_name ORDER BY year) AS cumulative_arrests
+FROM (
+    SELECT
+        country_name,
+        stop_year AS year,
+        SUM(stops) AS total_stops,
+        SUM(arrests) AS total_arrests
+    FROM
+        rollup_country_year
+    GROUP BY
+        country_name, year
+) AS yearly_stats
+ORDER BY
+    country_name, year;""",
+
+"2: Driver Violation Trends Based on Age and Race (Join with Subquery)" : """WITH age_race_violations AS (
+    SELECT
+        driver_age,
+        driver_race,
+        violation,
+        SUM(stops) AS stop_count
+    FROM
+        rollup_violations
+    WHERE
+        driver_age IS NOT NULL AND driver_race IS NOT NULL AND violation IS NOT NULL
+    GROUP BY
+        driver_age, driver_race, violation
+),
+age_race_totals AS (
+    SELECT
+        driver_age,
+        driver_race,
+        SUM(stops) AS total_stops
+    FROM
+        rollup_violations
+    WHERE
+        driver_age IS NOT NULL AND driver_race IS NOT NULL
+    GROUP BY
+        driver_age, driver_race
+)
+SELECT
+    v.driver_age,
+    v.driver_race,
+    v.violation,
+    v.stop_count,
+    t.total_stops,
+    ROUND(v.stop_count * 100.0 / t.total_stops, 2) AS violation_percent
+FROM
+    age_race_violations v
+JOIN
+    age_race_totals t
+ON
+    v.driver_age = t.driver_age AND v.driver_race = t.driver_race
+ORDER BY
+    violation_percent DESC
+LIMIT 100;""",
+
+"3: Time Period Analysis of Stops (Joining with Date Functions) , Number of Stops by Year,Month, Hour of the Day" : """SELECT
+    stop_year,
+    TO_CHAR(make_date(stop_year, stop_month, 1), 'Month') AS stop_month_name,
+    stop_month,
+    stop_hour,
+    SUM(stops) AS total_stops
+FROM
+    rollup_time
+WHERE
+    stop_year IS NOT NULL AND stop_hour IS NOT NULL
+GROUP BY
+    stop_year, stop_month_name, stop_month, stop_hour
+ORDER BY
+    stop_year, stop_month, stop_hour;""",
+
+"4: Violations with High Search and Arrest Rates (Window Function)" : """SELECT *
+FROM (
+    SELECT
+        violation,
+        SUM(stops) AS total_stops,
+        SUM(searches) AS total_searches,
+        SUM(arrests) AS total_arrests,
+        ROUND(SUM(searches) * 100.0 / SUM(stops), 2) AS search_rate,
+        ROUND(SUM(arrests) * 100.0 / SUM(stops), 2) AS arrest_rate,
+        RANK() OVER (ORDER BY SUM(searches) * 1.0 / SUM(stops) DESC) AS search_rank,
+        RANK() OVER (ORDER BY SUM(arrests) * 1.0 / SUM(stops) DESC) AS arrest_rank
+    FROM
+        rollup_violations
+    WHERE
+        violation IS NOT NULL
+    GROUP BY
+        violation
+) AS ranked_data
+ORDER BY
+    search_rank + arrest_rank
+LIMIT 10;""",
+
+"5: Driver Demographics by Country (Age, Gender, and Race)" : """SELECT
+    country_name,
+    driver_age,
+    driver_gender,
+    driver_race
+FROM
+    rollup_demographics
+ORDER BY
+    country_name,
+    driver_age;""",
+
+"6: Top 5 Violations with Highest Arrest Rates" : """SELECT
+    violation,
+    SUM(stops) AS total_stops,
+    SUM(arrests) AS total_arrests,
+    ROUND(SUM(arrests) * 100.0 / SUM(stops), 2) AS arrest_rate
+FROM
+    rollup_violations
+WHERE
+    violation IS NOT NULL
+GROUP BY
+    violation
+ORDER BY
+    arrest_rate DESC
+LIMIT 5;"""
+}
+
+
+# A rollup query can take the insight filters only if every rollup it reads has the filtered columns
+def _serves(query, columns):
+    return all(columns <= {dim for dim, _, _ in ROLLUPS[table]} for table in tables_read(query) if table in ROLLUPS)
+
+
+# SQL the dashboard runs for an insight: the rollup version when one exists and can take the
+# filters, else the ledger query
+def insight_queries(use_rollups=True, filters=None):
+    medium, complex_ = dict(MEDIUM_QUERIES), dict(COMPLEX_QUERIES)
+    if use_rollups:
+        columns = filter_columns(filters)
+        medium.update({label: q for label, q in MEDIUM_ROLLUP_QUERIES.items() if _serves(q, columns)})
+        complex_.update({label: q for label, q in COMPLEX_ROLLUP_QUERIES.items() if _serves(q, columns)})
+    return medium, complex_
+
+
+# Command line: python -m securecheck.rollups   (create if needed, then refresh)
+if __name__ == "__main__":
+    setup_rollups()
+    started = time.perf_counter()
+    refreshed = refresh_rollups()
+    for name, stops in refreshed.items():
+        print(f"{name}: folded in {stops:,} stop ids")
+    print(f"Rollups up to date in {time.perf_counter() - started:.2f}s")
@@ -0,0 +1,289 @@
+import argparse
+import json
+import re
+
+import pandas as pd
+from sqlalchemy import text
+
+from securecheck.db import connect
+
+
+# Data columns of traffic_stops and their types, in table order (stop_id comes first)
+LEDGER_SCHEMA = [
+    ("stop_date", "date"),
+    ("stop_time", "time"),
+    ("country_name", "text"),
+    ("driver_gender", "text"),
+    ("driver_age_raw", "double precision"),
+    ("driver_age", "smallint"),
+    ("driver_race", "text"),
+    ("violation_raw", "text"),
+    ("violation", "text"),
+    ("search_conducted", "boolean"),
+    ("search_type", "text"),
+    ("stop_outcome", "text"),
+    ("is_arrested", "boolean"),
+    ("stop_duration", "text"),
+    ("drugs_related_stop", "boolean"),
+    ("vehicle_number", "text"),
+]
+LEDGER_COLUMNS = [column for column, _ in LEDGER_SCHEMA]
+
+# information_schema.columns.data_type values accepted for each declared type
+_ACCEPTED_TYPES = {
+    "date": {"date"},
+    "time": {"time without time zone"},
+    "text": {"text", "character varying"},
+    "double precision": {"double precision", "real", "numeric", "integer", "smallint", "bigint"},
+    "smallint": {"smallint", "integer", "bigint"},
+    "boolean": {"boolean"},
+}
+
+SCHEMA_LOCK_KEY = "hashtext('securecheck_schema')"
+
+# Stops rewritten per transaction by normalize_stored_plates
+PLATE_CLEANUP_BATCH = 50_000
+
+MIGRATIONS_DDL = """CREATE TABLE IF NOT EXISTS schema_migrations (
+    version integer PRIMARY KEY,
+    name text NOT NULL,
+    applied_at timestamptz NOT NULL DEFAULT now()
+)"""
+
+
+# Cast expression that turns a column loaded as text into its declared type
+def _cast_using(column, sql_type):
+    value = f"NULLIF(trim({column}::text), '')"
+    if sql_type == "boolean":
+        return (f"CASE WHEN lower({value}) IN ('true', 't', '1', 'yes', 'y') THEN TRUE "
+                f"WHEN lower({value}) IN ('false', 'f', '0', 'no', 'n') THEN FALSE END")
+    if sql_type == "smallint":
+        return f"trunc({value}::numeric)::smallint"
+    return f"{value}::{sql_type}"
+
+
+# Tables loaded from CSV often keep everything as text ('True'/'False' flags, date strings);
+# convert any column whose type differs from LEDGER_SCHEMA
+def _normalize_column_types(conn):
+    current = dict(conn.execute(text(
+        "SELECT column_name, data_type FROM information_schema.columns "
+        "WHERE table_schema = current_schema() AND table_name = 'traffic_stops'"
+    )).all())
+    for column, sql_type in LEDGER_SCHEMA:
+        if column not in current:
+            conn.execute(text(f"ALTER TABLE traffic_stops ADD COLUMN {column} {sql_type}"))
+        elif current[column] not in _ACCEPTED_TYPES[sql_type]:
+            conn.execute(text(
+                f"ALTER TABLE traffic_stops ALTER COLUMN {column} TYPE {sql_type} USING {_cast_using(column, sql_type)}"
+            ))
+
+
+# Plates as the lookups compare them: trimmed and upper-cased, whatever was stored
+PLATE_KEY = "upper(trim(vehicle_number))"
+
+
+# Trigram index for fuzzy plate search. pg_trgm ships with PostgreSQL but creating it may need
+# extra privileges; without it the index is skipped and fuzzy search falls back to substrings.
+def _plate_trigram_index(conn, name="traffic_stops_vehicle_trgm_idx", expression="vehicle_number"):
+    try:
+        with conn.begin_nested():
+            conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+    except Exception as e:
+        print(f"pg_trgm unavailable, skipping the trigram plate index: {e}")
+        return
+    conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON traffic_stops USING gin (({expression}) gin_trgm_ops)"))
+
+
+def _plate_key_trigram_index(conn):
+    _plate_trigram_index(conn, "traffic_stops_plate_trgm_idx", PLATE_KEY)
+
+
+# Ordered schema migrations: (version, name, steps). A step is a SQL statement or a callable
+# taking the connection. Every step is idempotent, so databases created before the migration
+# table existed can run the whole list.
+MIGRATIONS = [
+    (1, "create traffic_stops", [
+        "CREATE TABLE IF NOT EXISTS traffic_stops (stop_id BIGSERIAL, "
+        + ", ".join(f"{column} {sql_type}" for column, sql_type in LEDGER_SCHEMA) + ")",
+    ]),
+    (2, "stop_id key and duplicate check", [
+        # Surrogate key for traffic_stops: a monotonically increasing id that keyset
+        # pagination and incremental refreshes can use as a high-watermark
+        "ALTER TABLE traffic_stops ADD COLUMN IF NOT EXISTS stop_id BIGSERIAL",
+        "CREATE UNIQUE INDEX IF NOT EXISTS traffic_stops_stop_id_key ON traffic_stops (stop_id)",
+        # Duplicate check for ingestion: one stop per vehicle per timestamp
+        "CREATE INDEX IF NOT EXISTS traffic_stops_vehicle_time_idx ON traffic_stops (vehicle_number, stop_date, stop_time)",
+    ]),
+    (3, "column types", [_normalize_column_types]),
+    (4, "insight indexes", [
+        # Medium 1: vehicles in drug-related stops (index-only over a few percent of the ledger)
+        "CREATE INDEX IF NOT EXISTS traffic_stops_drug_vehicle_idx ON traffic_stops (vehicle_number) "
+        "WHERE drugs_related_stop",
+        # Medium 2 and 14: searched stops by vehicle and by country
+        "CREATE INDEX IF NOT EXISTS traffic_stops_searched_idx ON traffic_stops (country_name, vehicle_number) "
+        "WHERE search_conducted",
+        # Medium 10 (driver_age < 25 by violation) and complex 2 (age x race x violation)
+        "CREATE INDEX IF NOT EXISTS traffic_stops_age_race_violation_idx ON traffic_stops "
+        "(driver_age, driver_race, violation)",
+        # Date-range filters and the yearly / monthly breakdowns
+        "CREATE INDEX IF NOT EXISTS traffic_stops_date_time_idx ON traffic_stops (stop_date, stop_time)",
+        # Overview filters and the country x violation arrest rates
+        "CREATE INDEX IF NOT EXISTS traffic_stops_country_violation_idx ON traffic_stops (country_name, violation)",
+        "ANALYZE traffic_stops",
+    ]),
+    (5, "vehicle lookup indexes", [
+        # Plate prefix search; text_pattern_ops lets LIKE 'TN12%' use the index under any collation
+        "CREATE INDEX IF NOT EXISTS traffic_stops_vehicle_prefix_idx ON traffic_stops "
+        "(vehicle_number text_pattern_ops)",
+        _plate_trigram_index,
+    ]),
+    (6, "plate key indexes", [
+        # Lookups, the Overview filter and the ingest duplicate check compare PLATE_KEY, so stops
+        # stored before plates were normalized on write still match without rewriting the table
+        f"CREATE INDEX IF NOT EXISTS traffic_stops_plate_time_idx ON traffic_stops ({PLATE_KEY}, stop_date, stop_time)",
+        f"CREATE INDEX IF NOT EXISTS traffic_stops_plate_prefix_idx ON traffic_stops (({PLATE_KEY}) text_pattern_ops)",
+        _plate_key_trigram_index,
+        # Superseded by the PLATE_KEY indexes above
+        "DROP INDEX IF EXISTS traffic_stops_vehicle_time_idx",
+        "DROP INDEX IF EXISTS traffic_stops_vehicle_prefix_idx",
+        "DROP INDEX IF EXISTS traffic_stops_vehicle_trgm_idx",
+        "ANALYZE traffic_stops",
+    ]),
+]
+
+# Version the code expects the ledger to be at
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+# Latest migration recorded in schema_migrations, 0 when none has run. The app only checks
+# this at start; migrations are applied from the command line.
+def schema_version():
+    with connect() as conn:
+        if conn.execute(text("SELECT to_regclass('schema_migrations')")).scalar() is None:
+            return 0
+        return conn.execute(text("SELECT COALESCE(MAX(version), 0) FROM schema_migrations")).scalar()
+
+
+# Apply pending migrations in one transaction; concurrent app processes wait on the lock.
+# Returns the names of the migrations applied.
+def ensure_schema():
+    applied = []
+    with connect() as conn, conn.begin():
+        conn.execute(text(f"SELECT pg_advisory_xact_lock({SCHEMA_LOCK_KEY})"))
+        conn.execute(text(MIGRATIONS_DDL))
+        done = set(conn.execute(text("SELECT version FROM schema_migrations")).scalars())
+        for version, name, steps in MIGRATIONS:
+            if version in done:
+                continue
+            for step in steps:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(text(step))
+            conn.execute(text("INSERT INTO schema_migrations (version, name) VALUES (:version, :name)"),
+                         {"version": version, "name": name})
+            applied.append(name)
+    return applied
+
+
+# Optional clean-up of plates stored before ingest normalized them: rewrites them to PLATE_KEY
+# in stop_id batches, one short transaction each, so it can run next to the app. Lookups match
+# without it; it only changes how old plates read in the Overview and in exports.
+# Returns the number of plates rewritten.
+def normalize_stored_plates(batch_size=PLATE_CLEANUP_BATCH):
+    with connect() as conn:
+        high = conn.execute(text("SELECT COALESCE(MAX(stop_id), 0) FROM traffic_stops")).scalar()
+    changed = 0
+    for low in range(0, high, batch_size):
+        with connect() as conn, conn.begin():
+            changed += conn.execute(text(
+                f"UPDATE traffic_stops SET vehicle_number = {PLATE_KEY} "
+                f"WHERE stop_id > :low AND stop_id <= :high AND vehicle_number <> {PLATE_KEY}"
+            ), {"low": low, "high": low + batch_size}).rowcount
+    return changed
+
+
+# traffic_stops and, on a partitioned ledger, every partition under it: plans and index
+# statistics name the partitions, not the parent
+def _ledger_relations(conn):
+    return set(conn.execute(text(
+        "SELECT c.relname FROM pg_partition_tree('traffic_stops') AS t JOIN pg_class AS c ON c.oid = t.relid"
+    )).scalars())
+
+
+def _plan_nodes(node):
+    yield node
+    for child in node.get("Plans", []):
+        yield from _plan_nodes(child)
+
+
+# How the planner reads traffic_stops for each query (EXPLAIN, no ANALYZE, nothing is executed).
+# A sequential scan with a filter on a ledger column is an index candidate; a sequential scan
+# without one is a full-ledger aggregate that no index helps.
+def advise_indexes(queries=None):
+    if queries is None:
+        from securecheck.queries import COMPLEX_QUERIES, MEDIUM_QUERIES
+        queries = {**{f"medium {k}": v for k, v in MEDIUM_QUERIES.items()},
+                   **{f"complex {k}": v for k, v in COMPLEX_QUERIES.items()}}
+    report = []
+    with connect() as conn:
+        relations = _ledger_relations(conn)
+        for label, query in queries.items():
+            plan = conn.execute(text(f"EXPLAIN (FORMAT JSON) {query}")).scalar()
+            plan = json.loads(plan) if isinstance(plan, str) else plan
+            for node in _plan_nodes(plan[0]["Plan"]):
+                if node.get("Relation Name") not in relations:
+                    continue
+                condition = node.get("Filter") or node.get("Index Cond") or ""
+                if node["Node Type"] == "Seq Scan":
+                    columns = [c for c in LEDGER_COLUMNS if re.search(rf"\b{c}\b", condition)]
+                    verdict = "needs index" if columns else "full scan"
+                else:
+                    columns, verdict = [], "covered"
+                report.append({
+                    "query": label,
+                    "relation": node["Relation Name"],
+                    "access": node["Node Type"],
+                    "index": node.get("Index Name"),
+                    "condition": condition,
+                    "estimated_rows": node.get("Plan Rows"),
+                    "total_cost": node.get("Total Cost"),
+                    "verdict": verdict,
+                    "suggest_columns": ", ".join(columns),
+                })
+    return pd.DataFrame(report)
+
+
+# Indexes on traffic_stops with their size and scan count since the statistics were last reset.
+# On a partitioned ledger each index is reported once, summed over its per-partition copies.
+INDEX_USAGE_QUERY = """SELECT COALESCE(pg_partition_root(s.indexrelid), s.indexrelid)::regclass::text AS index,
+    SUM(s.idx_scan) AS scans,
+    pg_size_pretty(SUM(pg_relation_size(s.indexrelid))) AS size
+FROM pg_stat_user_indexes AS s
+WHERE s.relid IN (SELECT relid FROM pg_partition_tree('traffic_stops'))
+GROUP BY 1
+ORDER BY 2"""
+
+
+def index_usage():
+    with connect() as conn:
+        rows = conn.execute(text(INDEX_USAGE_QUERY)).mappings().all()
+    return pd.DataFrame(rows)
+
+
+# Command line: python -m securecheck.schema [--advise] [--normalize-plates]
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply traffic_stops migrations and check index coverage")
+    parser.add_argument("--advise", action="store_true", help="report how each insight query reads the ledger")
+    parser.add_argument("--normalize-plates", action="store_true",
+                        help="rewrite plates stored before ingest normalized them (optional, batched)")
+    args = parser.parse_args()
+    applied = ensure_schema()
+    print(f"Applied: {', '.join(applied)}" if applied else "Schema is up to date")
+    if args.normalize_plates:
+        print(f"Normalized {normalize_stored_plates():,} stored plates")
+    if args.advise:
+        with pd.option_context("display.max_colwidth", 60, "display.width", 200):
+            print(advise_indexes().to_string(index=False))
+            print()
+            print(index_usage().to_string(index=False))
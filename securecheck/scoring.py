@@ -0,0 +1,106 @@
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from securecheck.export import export_chunks
+from securecheck.ingest import read_export
+from securecheck.loader import clean_chunk
+from securecheck.prediction import DEFAULT_OUTCOME, DEFAULT_VIOLATION, KEY_FIELDS, LEVELS, get_predictor
+
+
+SCORE_CHUNKSIZE = 50_000
+PREDICTION_COLUMNS = ["predicted_outcome", "predicted_violation", "matching_stops", "prediction_level"]
+
+
+# Prediction keys for a batch, normalized the way make_key does for one stop: text flags
+# and 0/1 parsed to booleans, missing text as 'Unknown', ages as nullable integers
+def batch_keys(df):
+    df = df.rename(columns=lambda col: str(col).strip().lower().replace(" ", "_"))
+    cleaned = clean_chunk(df[[col for col in KEY_FIELDS if col in df.columns]])
+    keys = pd.DataFrame(index=df.index)
+    for field in KEY_FIELDS:
+        if field == "driver_age":
+            keys[field] = cleaned[field].astype("Int64") if field in cleaned.columns else pd.array([pd.NA] * len(df), dtype="Int64")
+        elif field in ("search_conducted", "drugs_related_stop"):
+            keys[field] = cleaned[field].to_numpy(dtype=bool) if field in cleaned.columns else False
+        else:
+            keys[field] = cleaned[field].astype(str).to_numpy() if field in cleaned.columns else "Unknown"
+    return keys
+
+
+# Outcome and violation for every row of a batch. Each lookup level is one left merge of the
+# still-unmatched rows against that level's precomputed prediction table, so a batch costs
+# at most len(LEVELS) merges instead of a lookup per row. Returns the batch with
+# PREDICTION_COLUMNS appended.
+def score_frame(df, predictor=None):
+    predictor = predictor or get_predictor()
+    keys = batch_keys(df)
+    outcome = pd.Series(DEFAULT_OUTCOME, index=df.index, dtype=object)
+    violation = pd.Series(DEFAULT_VIOLATION, index=df.index, dtype=object)
+    stops = pd.Series(0, index=df.index, dtype="int64")
+    level_name = pd.Series(None, index=df.index, dtype=object)
+    remaining = keys
+    for level in LEVELS:
+        if remaining.empty:
+            break
+        table = predictor.prediction_table(level)
+        if table.empty:
+            continue
+        if level:
+            merged = remaining[list(level)].merge(table, on=list(level), how="left")
+            merged.index = remaining.index
+        else:  # the ledger-wide prediction applies to every row left
+            merged = pd.DataFrame({column: table[column].iloc[0] for column in table.columns}, index=remaining.index)
+        found = merged["outcome"].notna().to_numpy()
+        matched = merged[found]
+        outcome.loc[matched.index] = matched["outcome"]
+        violation.loc[matched.index] = matched["violation"]
+        stops.loc[matched.index] = matched["matching_stops"].astype("int64")
+        level_name.loc[matched.index] = ", ".join(level) or "ledger"
+        remaining = remaining[~found]
+    return df.assign(predicted_outcome=outcome, predicted_violation=violation,
+                     matching_stops=stops, prediction_level=level_name)
+
+
+# Score chunks one at a time; report (if given) collects rows and timing as they stream
+def iter_scored(chunks, predictor=None, report=None):
+    predictor = predictor or get_predictor()
+    for chunk in chunks:
+        started = time.perf_counter()
+        scored = score_frame(chunk, predictor)
+        if report is not None:
+            report["rows"] += len(scored)
+            report["score_seconds"] += time.perf_counter() - started
+            report["fallback_rows"] += int(np.sum(scored["prediction_level"].to_numpy() != ", ".join(LEVELS[0])))
+        yield scored
+
+
+# Score a stop file (CSV or JSON lines) into a CSV or Parquet file, chunk by chunk.
+# Returns rows, wall time, time spent scoring and throughput.
+def score_file(source, out, file_format=None, chunksize=SCORE_CHUNKSIZE, predictor=None, progress=None):
+    report = {"rows": 0, "score_seconds": 0.0, "fallback_rows": 0}
+    started = time.perf_counter()
+    written = export_chunks(iter_scored(read_export(source, chunksize=chunksize), predictor, report),
+                            out, progress=progress, file_format=file_format)
+    report.update({"path": written["path"], "bytes": written["bytes"], "seconds": time.perf_counter() - started})
+    report["rows_per_sec"] = report["rows"] / report["seconds"] if report["seconds"] else 0.0
+    report["scored_per_sec"] = report["rows"] / report["score_seconds"] if report["score_seconds"] else 0.0
+    return report
+
+
+def format_score_report(report):
+    return (f"{report['rows']:,} stops scored in {report['seconds']:.2f}s ({report['rows_per_sec']:,.0f} rows/sec "
+            f"end to end, {report['scored_per_sec']:,.0f} rows/sec scoring); "
+            f"{report['fallback_rows']:,} predicted from a broader key")
+
+
+# Command line: python -m securecheck.scoring shift_export.csv --out scored.csv
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Predict outcome and violation for every stop in a file")
+    parser.add_argument("file", help="CSV or JSON-lines stops")
+    parser.add_argument("--out", required=True, help="scored output; .parquet writes Parquet, anything else CSV")
+    parser.add_argument("--chunksize", type=int, default=SCORE_CHUNKSIZE)
+    args = parser.parse_args()
+    print(format_score_report(score_file(args.file, args.out, chunksize=args.chunksize)))
@@ -0,0 +1,171 @@
+import argparse
+import json
+import os
+import time
+from collections import Counter
+
+import pandas as pd
+
+from securecheck import db
+from securecheck.loader import BOOL_COLS, CATEGORY_COLS, histogram_median, iter_clean_chunks
+
+try:
+    import pyarrow as pa
+except ImportError:  # the snapshot layer is optional
+    pa = None
+
+
+# Cleaned copy of traffic_stops on local disk as Arrow IPC segments, one per refresh.
+# Segments are memory-mapped on load, so reading a snapshot costs page faults, not a network copy.
+MANIFEST = "manifest.json"
+DELTA_QUERY = "SELECT * FROM traffic_stops WHERE stop_id > :watermark ORDER BY stop_id"
+
+# Merge segments once there are more than this many
+MAX_SEGMENTS = 16
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise RuntimeError("The snapshot layer needs pyarrow: pip install pyarrow")
+
+
+def snapshot_dir(directory=None):
+    return directory or db.setting("snapshot_dir")
+
+
+def read_manifest(directory=None):
+    path = os.path.join(snapshot_dir(directory), MANIFEST)
+    if not os.path.exists(path):
+        return {"watermark": 0, "rows": 0, "segments": [], "age_histogram": {}}
+    with open(path) as f:
+        return json.load(f)
+
+
+# Write the manifest next to the segments; os.replace keeps readers from seeing a half-written file
+def _write_manifest(directory, manifest):
+    path = os.path.join(directory, MANIFEST)
+    with open(path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+# Fixed Arrow types so every segment shares one schema
+def _arrow_schema(df):
+    fields = []
+    for col in df.columns:
+        if col in CATEGORY_COLS:
+            fields.append(pa.field(col, pa.dictionary(pa.int32(), pa.string())))
+        elif col in BOOL_COLS:
+            fields.append(pa.field(col, pa.bool_()))
+        elif col == "driver_age":
+            fields.append(pa.field(col, pa.int16()))
+        elif col == "stop_time":
+            fields.append(pa.field(col, pa.int32()))
+        elif col == "stop_date":
+            fields.append(pa.field(col, pa.timestamp("ns")))
+        elif col == "stop_id":
+            fields.append(pa.field(col, pa.int64()))
+        else:
+            fields.append(pa.field(col, pa.string()))
+    return pa.schema(fields)
+
+
+def _to_batch(chunk, schema):
+    for col in chunk.columns:
+        if schema.field(col).type == pa.string():
+            chunk[col] = chunk[col].astype("string")
+    return pa.RecordBatch.from_pandas(chunk, schema=schema, preserve_index=False)
+
+
+# Append every stop added since the last refresh as a new segment; returns rows written
+def refresh_snapshot(directory=None, chunksize=100_000):
+    _require_pyarrow()
+    directory = snapshot_dir(directory)
+    os.makedirs(directory, exist_ok=True)
+    manifest = read_manifest(directory)
+    histogram = Counter({int(age): count for age, count in manifest["age_histogram"].items()})
+    segment = f"segment-{manifest['watermark'] + 1:012d}.arrow"
+    writer, rows, watermark = None, 0, manifest["watermark"]
+    try:
+        for chunk in iter_clean_chunks(DELTA_QUERY, chunksize, params={"watermark": manifest["watermark"]}):
+            if writer is None:
+                schema = _arrow_schema(chunk)
+                writer = pa.ipc.new_file(os.path.join(directory, segment), schema)
+            if "driver_age" in chunk.columns:
+                histogram.update(chunk["driver_age"].value_counts().to_dict())
+            writer.write_batch(_to_batch(chunk, schema))
+            rows += len(chunk)
+            watermark = int(chunk["stop_id"].max())
+    finally:
+        if writer is not None:
+            writer.close()
+    if rows:
+        manifest["segments"].append(segment)
+        manifest.update({
+            "watermark": watermark,
+            "rows": manifest["rows"] + rows,
+            "age_histogram": {str(age): int(count) for age, count in histogram.items()},
+            "refreshed_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        })
+        _write_manifest(directory, manifest)
+        if len(manifest["segments"]) > MAX_SEGMENTS:
+            compact_snapshot(directory)
+    return rows
+
+
+# Memory-map every segment into one Arrow table (no copy until columns are touched)
+def load_table(directory=None):
+    _require_pyarrow()
+    directory = snapshot_dir(directory)
+    manifest = read_manifest(directory)
+    tables = [
+        pa.ipc.open_file(pa.memory_map(os.path.join(directory, segment), "r")).read_all()
+        for segment in manifest["segments"]
+    ]
+    return pa.concat_tables(tables) if tables else None
+
+
+# Snapshot as a cleaned DataFrame; ages missing in the ledger get the ledger-wide median
+def load_snapshot(directory=None):
+    table = load_table(directory)
+    if table is None:
+        return pd.DataFrame()
+    df = table.to_pandas(types_mapper={pa.int16(): pd.Int16Dtype(), pa.int32(): pd.Int32Dtype()}.get)
+    median = histogram_median({int(a): c for a, c in read_manifest(directory)["age_histogram"].items()})
+    if "driver_age" in df.columns and median is not None:
+        df["driver_age"] = df["driver_age"].fillna(int(median))
+    return df
+
+
+# Rewrite all segments as one, so cold starts map a single file
+def compact_snapshot(directory=None):
+    _require_pyarrow()
+    directory = snapshot_dir(directory)
+    manifest = read_manifest(directory)
+    if len(manifest["segments"]) < 2:
+        return
+    table = load_table(directory).unify_dictionaries()
+    segment = f"segment-{1:012d}-{manifest['watermark']:012d}.arrow"
+    with pa.ipc.new_file(os.path.join(directory, segment + ".tmp"), table.schema) as writer:
+        writer.write_table(table)
+    os.replace(os.path.join(directory, segment + ".tmp"), os.path.join(directory, segment))
+    old_segments = [s for s in manifest["segments"] if s != segment]
+    manifest["segments"] = [segment]
+    _write_manifest(directory, manifest)
+    for old in old_segments:
+        os.remove(os.path.join(directory, old))
+
+
+# Command line: python -m securecheck.snapshot [--dir PATH] [--compact]
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Refresh the local traffic_stops snapshot")
+    parser.add_argument("--dir", help="snapshot directory (default: snapshot_dir setting)")
+    parser.add_argument("--compact", action="store_true", help="merge all segments into one file")
+    args = parser.parse_args()
+    started = time.perf_counter()
+    written = refresh_snapshot(args.dir)
+    if args.compact:
+        compact_snapshot(args.dir)
+    manifest = read_manifest(args.dir)
+    print(f"Snapshot: +{written:,} rows, {manifest['rows']:,} total in {len(manifest['segments'])} segment(s), "
+          f"{time.perf_counter() - started:.2f}s")
@@ -0,0 +1,109 @@
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from securecheck.schema import LEDGER_COLUMNS
+
+
+# Category mixes modelled on the check-post ledger; weights are relative
+COUNTRIES = {"USA": 0.45, "Canada": 0.30, "India": 0.25}
+GENDERS = {"M": 0.68, "F": 0.32}
+RACES = {"White": 0.62, "Black": 0.14, "Hispanic": 0.12, "Asian": 0.08, "Other": 0.04}
+VIOLATIONS = {"Speeding": 0.56, "Moving violation": 0.19, "Equipment": 0.12, "Other": 0.06,
+              "Registration/plates": 0.04, "Seat belt": 0.03}
+OUTCOMES = {"Citation": 0.70, "Warning": 0.17, "Arrest": 0.06, "N/D": 0.04, "No Action": 0.02, "Summons": 0.01}
+DURATIONS = {"0-15 Min": 0.78, "16-30 Min": 0.17, "30+ Min": 0.05}
+SEARCH_TYPES = {"Incident to Arrest": 0.40, "Probable Cause": 0.25, "Inventory": 0.15,
+                "Reasonable Suspicion": 0.12, "Protective Frisk": 0.08}
+
+# Stops per hour of day: quiet before dawn, busiest mid-morning and late afternoon
+HOUR_WEIGHTS = np.array([3, 2, 2, 1, 1, 2, 4, 6, 8, 9, 10, 10, 9, 8, 8, 9, 10, 10, 9, 8, 7, 6, 5, 4], dtype=float)
+
+SEARCH_RATE = 0.04
+DRUG_RATE_SEARCHED = 0.35
+DRUG_RATE_NOT_SEARCHED = 0.002
+MISSING_AGE_RATE = 0.05
+ARREST_RATE_SEARCHED = 0.30
+
+# Every HH:MM:SS string once, indexed by seconds since midnight
+_TIME_STRINGS = np.array([f"{s // 3600:02d}:{s // 60 % 60:02d}:{s % 60:02d}" for s in range(86400)], dtype=object)
+
+
+def _choice(rng, weights, size):
+    values = np.array(list(weights), dtype=object)
+    p = np.array(list(weights.values()), dtype=float)
+    return values[rng.choice(len(values), size=size, p=p / p.sum())]
+
+
+# One chunk of raw traffic_stops rows, shaped like a SELECT * (text, dates, time strings, bools).
+# first_row offsets the vehicle pool so chunks of one run draw from the same fleet.
+def generate_stops(rows, seed=0, start_date="2018-01-01", days=5 * 365, vehicles=None, first_row=0):
+    rng = np.random.default_rng([seed, first_row])
+    vehicles = vehicles or max(rows // 3, 1)
+
+    searched = rng.random(rows) < SEARCH_RATE
+    drugs = np.where(searched, rng.random(rows) < DRUG_RATE_SEARCHED, rng.random(rows) < DRUG_RATE_NOT_SEARCHED)
+    outcome = _choice(rng, OUTCOMES, rows)
+    outcome[searched & (rng.random(rows) < ARREST_RATE_SEARCHED)] = "Arrest"
+
+    ages = np.clip(np.round(rng.gamma(6.0, 6.0, rows) + 15), 16, 88)
+    age = pd.array(ages, dtype="Float64")
+    age[rng.random(rows) < MISSING_AGE_RATE] = pd.NA
+
+    hours = rng.choice(24, size=rows, p=HOUR_WEIGHTS / HOUR_WEIGHTS.sum())
+    seconds = hours * 3600 + rng.integers(0, 3600, rows)
+    violation = _choice(rng, VIOLATIONS, rows)
+    search_type = np.where(searched, _choice(rng, SEARCH_TYPES, rows), None)
+    vehicle_ids = rng.integers(0, vehicles, rows)
+
+    df = pd.DataFrame({
+        "stop_date": np.datetime64(start_date, "D") + rng.integers(0, days, rows),
+        "stop_time": _TIME_STRINGS[seconds],
+        "country_name": _choice(rng, COUNTRIES, rows),
+        "driver_gender": _choice(rng, GENDERS, rows),
+        "driver_age_raw": age,
+        "driver_age": age,
+        "driver_race": _choice(rng, RACES, rows),
+        "violation_raw": violation,
+        "violation": violation,
+        "search_conducted": searched,
+        "search_type": search_type,
+        "stop_outcome": outcome,
+        "is_arrested": outcome == "Arrest",
+        "stop_duration": _choice(rng, DURATIONS, rows),
+        "drugs_related_stop": drugs,
+        "vehicle_number": pd.Series(vehicle_ids).map("{:07d}".format).radd("TN").to_numpy(dtype=object),
+    })
+    return df[LEDGER_COLUMNS]
+
+
+# A large synthetic ledger as chunks, so 50M rows never have to sit in memory at once
+def iter_stops(rows, chunksize=1_000_000, seed=0, **kwargs):
+    kwargs.setdefault("vehicles", max(rows // 3, 1))
+    for first_row in range(0, rows, chunksize):
+        yield generate_stops(min(chunksize, rows - first_row), seed=seed, first_row=first_row, **kwargs)
+
+
+# Command line: python -m securecheck.synthetic 1000000 [--out stops.csv | --load]
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic traffic_stops rows")
+    parser.add_argument("rows", type=int)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--chunksize", type=int, default=1_000_000)
+    parser.add_argument("--out", help="write a CSV (or .parquet) file")
+    parser.add_argument("--load", action="store_true", help="bulk load into the configured database")
+    args = parser.parse_args()
+    started = time.perf_counter()
+    chunks = iter_stops(args.rows, args.chunksize, args.seed)
+    if args.load:
+        from securecheck.ingest import format_report, ingest_frames
+        print(format_report(ingest_frames(chunks)))
+    elif args.out:
+        # One chunk in memory at a time, through a single ParquetWriter for .parquet files
+        from securecheck.export import export_chunks
+        export_chunks(chunks, args.out)
+    else:
+        parser.error("give --out or --load")
+    print(f"{args.rows:,} synthetic stops in {time.perf_counter() - started:.2f}s")
@@ -0,0 +1,284 @@
+import argparse
+import bisect
+import threading
+import time
+from collections import OrderedDict, deque
+
+import numpy as np
+import pandas as pd
+
+from securecheck import db
+from securecheck.schema import PLATE_KEY
+
+
+HISTORY_COLUMNS = ["stop_date", "stop_time", "country_name", "violation", "stop_outcome", "search_conducted",
+                   "search_type", "is_arrested", "stop_duration", "drugs_related_stop"]
+COUNT_NAMES = ["stops", "searches", "arrests", "drug_stops"]
+
+HISTORY_LIMIT = 50
+SUGGESTION_LIMIT = 10
+# Lookup latencies kept for the p50 / p99 readout
+LATENCY_WINDOW = 1000
+# pg_trgm's default similarity threshold for the % operator
+FUZZY_THRESHOLD = 0.3
+
+# A plate's most recent stops plus its all-time counts in one round trip. The window
+# aggregates are computed over every stop of the plate before the LIMIT is applied;
+# both the filter and the order come from the (PLATE_KEY, stop_date, stop_time) index.
+HISTORY_QUERY = f"""SELECT {', '.join(HISTORY_COLUMNS)},
+    COUNT(*) OVER () AS stops,
+    COUNT(*) FILTER (WHERE search_conducted) OVER () AS searches,
+    COUNT(*) FILTER (WHERE is_arrested) OVER () AS arrests,
+    COUNT(*) FILTER (WHERE drugs_related_stop) OVER () AS drug_stops,
+    MIN(stop_date) OVER () AS first_seen,
+    MAX(stop_date) OVER () AS last_seen
+FROM traffic_stops
+WHERE {PLATE_KEY} = :plate
+ORDER BY stop_date DESC, stop_time DESC
+LIMIT :history_limit"""
+
+# Plates starting with the typed text, read in order from the text_pattern_ops index
+PREFIX_QUERY = f"""SELECT DISTINCT {PLATE_KEY} AS vehicle_number
+FROM traffic_stops
+WHERE {PLATE_KEY} LIKE :prefix
+ORDER BY 1
+LIMIT :limit"""
+
+# Plates that look like the typed text (pg_trgm similarity, served by the trigram GIN index)
+FUZZY_QUERY = f"""SELECT {PLATE_KEY} AS vehicle_number, MAX(similarity({PLATE_KEY}, :plate)) AS similarity
+FROM traffic_stops
+WHERE {PLATE_KEY} % :plate
+GROUP BY 1
+ORDER BY similarity DESC, 1
+LIMIT :limit"""
+
+# Without pg_trgm, fuzzy search degrades to a substring match
+SUBSTRING_QUERY = f"""SELECT DISTINCT {PLATE_KEY} AS vehicle_number
+FROM traffic_stops
+WHERE {PLATE_KEY} LIKE :pattern
+ORDER BY 1
+LIMIT :limit"""
+
+
+# Plates as typed at the check-post: surrounding spaces dropped, letters upper-cased.
+# New stops are stored this way (see ingest.prepare_rows); SQL compares schema.PLATE_KEY,
+# the same normalization as an indexed expression, so older stops match as well.
+def normalize_plate(plate):
+    return str(plate or "").strip().upper()
+
+
+# normalize_plate for a column of plates
+def normalize_plates(values):
+    return values.astype("string").str.strip().str.upper()
+
+
+def _like_escape(value):
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+# Padded trigram set, the same way pg_trgm splits a word
+def _trigrams(value):
+    padded = f"  {value.lower()} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _similarity(a, b):
+    union = len(a | b)
+    return len(a & b) / union if union else 0.0
+
+
+# Counts and history for a plate from its history rows (window columns already attached)
+def _result(plate, rows):
+    if rows.empty:
+        counts = {name: 0 for name in COUNT_NAMES}
+        counts.update({"first_seen": None, "last_seen": None})
+        return {"plate": plate, **counts, "history": pd.DataFrame(columns=HISTORY_COLUMNS)}
+    first = rows.iloc[0]
+    counts = {name: int(first[name]) for name in COUNT_NAMES}
+    counts.update({"first_seen": first["first_seen"], "last_seen": first["last_seen"]})
+    history = rows[[col for col in HISTORY_COLUMNS if col in rows.columns]].reset_index(drop=True)
+    return {"plate": plate, **counts, "history": history}
+
+
+# Exact, prefix and fuzzy vehicle_number search with a hot cache of recently looked-up plates.
+# Reads the database through prepared statements, or a cleaned in-memory ledger (the local
+# snapshot) through a plate -> row positions index built once.
+class VehicleLookup:
+    def __init__(self, cache_size, cache_ttl, frame=None):
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self._cache = OrderedDict()  # plate -> (result, expires_at)
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._frame = None
+        self._trigram = None
+        if frame is not None:
+            self._index_frame(frame)
+
+    def _index_frame(self, df):
+        plates = normalize_plates(df["vehicle_number"])
+        self._frame = df
+        self._positions = plates.groupby(plates).indices
+        self._plates = sorted(self._positions)
+        self._grams = None  # built on the first fuzzy search
+
+    # Whether the database has pg_trgm; checked once
+    def _has_trigram(self):
+        if self._trigram is None:
+            found = db.fetch_data("SELECT 1 AS found FROM pg_extension WHERE extname = 'pg_trgm'")
+            self._trigram = not found.empty
+        return self._trigram
+
+    def _cached(self, plate):
+        with self._lock:
+            entry = self._cache.get(plate)
+            if entry is None or entry[1] < time.monotonic():
+                if entry is not None:
+                    del self._cache[plate]
+                self.misses += 1
+                return None
+            self._cache.move_to_end(plate)
+            self.hits += 1
+            return entry[0]
+
+    def _remember(self, plate, result):
+        with self._lock:
+            self._cache[plate] = (result, time.monotonic() + self.cache_ttl)
+            self._cache.move_to_end(plate)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _fetch(self, plate, limit):
+        if self._frame is None:
+            return _result(plate, db.fetch_prepared(HISTORY_QUERY, {"plate": plate, "history_limit": limit}))
+        positions = self._positions.get(plate)
+        if positions is None:
+            return _result(plate, pd.DataFrame())
+        stops = self._frame.iloc[positions]
+        flags = {col: stops[col].sum() if col in stops.columns else 0
+                 for col in ("search_conducted", "is_arrested", "drugs_related_stop")}
+        history = stops.sort_values(["stop_date", "stop_time"], ascending=False, na_position="last").head(limit)
+        history = history[[col for col in HISTORY_COLUMNS if col in history.columns]].reset_index(drop=True)
+        if "stop_time" in history.columns:
+            history["stop_time"] = pd.to_timedelta(history["stop_time"].to_numpy("float64", na_value=np.nan), unit="s")
+        return {"plate": plate, "stops": len(stops), "searches": int(flags["search_conducted"]),
+                "arrests": int(flags["is_arrested"]), "drug_stops": int(flags["drugs_related_stop"]),
+                "first_seen": stops["stop_date"].min(), "last_seen": stops["stop_date"].max(), "history": history}
+
+    # Has this plate been stopped before, and what happened? Returns the counts, first and
+    # last stop dates and the most recent stops (newest first); "cached" tells whether the
+    # answer came from the hot cache. Cached results are shared, so treat them as read-only.
+    def lookup(self, plate, limit=HISTORY_LIMIT, use_cache=True):
+        started = time.perf_counter()
+        plate = normalize_plate(plate)
+        result = self._cached(plate) if use_cache and limit == HISTORY_LIMIT else None
+        cached = result is not None
+        if result is None:
+            result = self._fetch(plate, limit)
+            # Unknown plates are not kept: a failed query also comes back empty
+            if limit == HISTORY_LIMIT and result["stops"]:
+                self._remember(plate, result)
+        seconds = time.perf_counter() - started
+        with self._lock:
+            self._latencies.append(seconds)
+        return {**result, "cached": cached, "ms": seconds * 1000}
+
+    # Plates matching typed text: mode "prefix" (starts with) or "fuzzy" (trigram similarity)
+    def search(self, text, mode="prefix", limit=SUGGESTION_LIMIT):
+        text = normalize_plate(text)
+        if not text:
+            return pd.DataFrame(columns=["vehicle_number"])
+        if mode not in ("prefix", "fuzzy"):
+            raise ValueError(f"Unknown plate search mode {mode!r}; use 'prefix' or 'fuzzy'")
+        if self._frame is not None:
+            return self._search_frame(text, mode, limit)
+        if mode == "prefix":
+            return db.fetch_prepared(PREFIX_QUERY, {"prefix": _like_escape(text) + "%", "limit": limit})
+        if self._has_trigram():
+            return db.fetch_prepared(FUZZY_QUERY, {"plate": text, "limit": limit})
+        return db.fetch_prepared(SUBSTRING_QUERY, {"pattern": f"%{_like_escape(text)}%", "limit": limit})
+
+    def _search_frame(self, text, mode, limit):
+        if mode == "prefix":
+            start = bisect.bisect_left(self._plates, text)
+            found = []
+            for plate in self._plates[start:start + limit]:
+                if not plate.startswith(text):
+                    break
+                found.append(plate)
+            return pd.DataFrame({"vehicle_number": found})
+        if self._grams is None:
+            self._grams = [_trigrams(plate) for plate in self._plates]
+        wanted = _trigrams(text)
+        scores = np.array([_similarity(wanted, grams) for grams in self._grams])
+        order = [i for i in np.argsort(-scores, kind="stable")[:limit] if scores[i] >= FUZZY_THRESHOLD]
+        return pd.DataFrame({"vehicle_number": [self._plates[i] for i in order],
+                             "similarity": scores[order] if order else []})
+
+    # Drop cached plates after their stops changed; None drops every plate
+    def forget(self, plates=None):
+        with self._lock:
+            if plates is None:
+                self._cache.clear()
+                return
+            for plate in plates:
+                self._cache.pop(normalize_plate(plate), None)
+
+    # Latency percentiles over the recent lookups, in milliseconds
+    def latency(self):
+        with self._lock:
+            timings = list(self._latencies)
+        if not timings:
+            return {"lookups": 0, "p50_ms": None, "p99_ms": None}
+        ms = np.array(timings) * 1000
+        return {"lookups": len(ms), "p50_ms": float(np.percentile(ms, 50)), "p99_ms": float(np.percentile(ms, 99))}
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._cache), "hits": self.hits, "misses": self.misses}
+
+
+_lookup = None
+_lookup_lock = threading.Lock()
+
+
+# Process-wide plate lookup, over the database or, when one is given, a cleaned in-memory ledger
+def get_vehicle_lookup(ledger=None):
+    global _lookup
+    if _lookup is None:
+        with _lookup_lock:
+            if _lookup is None:
+                _lookup = VehicleLookup(
+                    cache_size=int(db.setting("lookup_cache_size")),
+                    cache_ttl=float(db.setting("lookup_cache_ttl")),
+                    frame=ledger,
+                )
+    return _lookup
+
+
+# Drop plates from the hot cache of this process, if the lookup has been used
+def forget_plates(plates=None):
+    if _lookup is not None:
+        _lookup.forget(plates)
+
+
+# Command line: python -m securecheck.vehicles TN0001234 [--prefix | --fuzzy]
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Look up a vehicle's stop history")
+    parser.add_argument("plate")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--prefix", action="store_true", help="list plates starting with the text")
+    mode.add_argument("--fuzzy", action="store_true", help="list plates similar to the text")
+    args = parser.parse_args()
+    lookup = get_vehicle_lookup()
+    if args.prefix or args.fuzzy:
+        print(lookup.search(args.plate, "prefix" if args.prefix else "fuzzy").to_string(index=False))
+    else:
+        found = lookup.lookup(args.plate)
+        print(f"{found['plate']}: {found['stops']:,} stops, {found['searches']:,} searched, "
+              f"{found['arrests']:,} arrests, {found['drug_stops']:,} drug-related "
+              f"({found['first_seen']} to {found['last_seen']}) in {found['ms']:.1f} ms")
+        if not found["history"].empty:
+            print(found["history"].to_string(index=False))
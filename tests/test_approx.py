@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("duckdb")
+
+from securecheck.approx import Synopsis, distinct_query, rate_query
+from securecheck.backends import DuckDBBackend
+from securecheck.loader import clean_chunk
+from securecheck.synthetic import generate_stops
+
+
+# A ledger as the database holds it, some violations and countries NULL; small enough that the
+# sample holds every stop, so the sampled answers are exact
+@pytest.fixture(scope="module")
+def ledger():
+    raw = generate_stops(2000, seed=5)
+    rng = np.random.default_rng(1)
+    for column in ("country_name", "violation"):
+        raw.loc[rng.random(len(raw)) < 0.05, column] = None
+    return clean_chunk(raw, fill_unknown=False)
+
+
+# {group: (stops, arrests)}, NULL groups as None
+def _by_group(df, by):
+    return {None if pd.isna(group) else group: (int(stops), int(arrests))
+            for group, stops, arrests in zip(df[by], df["stops"], df["arrests"])}
+
+
+def test_synopsis_matches_exact_sql_with_nulls(ledger):
+    backend = DuckDBBackend(ledger)
+    synopsis = Synopsis(sample_size=len(ledger))
+    synopsis.add_frame(ledger)
+
+    exact = _by_group(backend.run(rate_query("violation", "arrests")), "violation")
+    rates = _by_group(synopsis.rates("violation", "arrests"), "violation")
+    assert None in rates
+    assert rates == exact
+
+    distinct = backend.run(distinct_query("violation"))["distinct_values"].iloc[0]
+    assert synopsis.distinct("violation")["estimate"] == distinct
@@ -0,0 +1,63 @@
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+from securecheck.backends import DuckDBBackend
+from securecheck.loader import clean_chunks
+from securecheck.parallel import run_all_insights
+from securecheck.queries import MEDIUM_QUERIES
+from securecheck.synthetic import generate_stops
+
+pytest.importorskip("duckdb")
+pa = pytest.importorskip("pyarrow")
+
+
+@pytest.fixture(scope="module")
+def ledger():
+    return clean_chunks([generate_stops(2000, seed=1)])
+
+
+# A frame or Arrow table is registered per cursor, so queries on new cursors can read it
+@pytest.mark.parametrize("wrap", [lambda df: df, lambda df: pa.Table.from_pandas(df, preserve_index=False)])
+def test_insight_over_in_memory_ledger(ledger, wrap):
+    backend = DuckDBBackend(wrap(ledger))
+    result = backend.run_insight(MEDIUM_QUERIES["4: What is the gender distribution of drivers stopped in each country?"])
+    assert result["num_stops"].sum() == len(ledger)
+    chunks = list(backend.iter_chunks("SELECT * FROM traffic_stops", chunksize=500))
+    assert sum(len(chunk) for chunk in chunks) == len(ledger)
+
+
+def test_run_all_insights_in_memory(ledger):
+    backend = DuckDBBackend(ledger)
+    queries = {label: (query, {}) for label, query in MEDIUM_QUERIES.items()}
+    _, summary, _ = run_all_insights(backend, queries, concurrency=4)
+    assert summary["error"].isna().all(), summary[summary["error"].notna()]
+
+
+# Insights run on the shared query pool, never more in flight than asked for
+def test_run_all_insights_bounds_the_shared_pool():
+    class Recorder:
+        def __init__(self):
+            self.lock, self.running, self.peak, self.threads = threading.Lock(), 0, 0, set()
+
+        def before_insights(self):
+            pass
+
+        def run(self, query, params=None):
+            with self.lock:
+                self.running += 1
+                self.peak = max(self.peak, self.running)
+                self.threads.add(threading.current_thread().name)
+            time.sleep(0.01)
+            with self.lock:
+                self.running -= 1
+            return pd.DataFrame({"query": [query]})
+
+    backend = Recorder()
+    results, summary, _ = run_all_insights(backend, {f"q{i}": (f"SELECT {i}", {}) for i in range(12)}, concurrency=2)
+    assert backend.peak <= 2
+    assert all(name.startswith("query") for name in backend.threads)
+    assert list(results) == list(summary["insight"]) == [f"q{i}" for i in range(12)]
+    assert [result["query"].iloc[0] for result in results.values()] == [f"SELECT {i}" for i in range(12)]
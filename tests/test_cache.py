@@ -0,0 +1,28 @@
+from securecheck.cache import referenced_tables
+from securecheck.queries import COMPLEX_QUERIES, MEDIUM_QUERIES
+from securecheck.cube import COMPLEX_ANSWERS, MEDIUM_ANSWERS
+from securecheck.report import plan_scan, scan_query
+from securecheck.rollups import ROLLUPS, insight_queries
+
+RELATIONS = {"traffic_stops", *ROLLUPS}
+
+
+# Every insight, on the ledger and on the rollups, is scoped to the relations it really reads:
+# no EXTRACT(... FROM column) and no CTE names
+def test_insights_reference_only_relations():
+    medium_query_map, complex_query_map = insight_queries()
+    queries = [*MEDIUM_QUERIES.values(), *COMPLEX_QUERIES.values(),
+               *medium_query_map.values(), *complex_query_map.values()]
+    for query in queries:
+        tables = referenced_tables(query)
+        assert tables and tables <= RELATIONS, query
+    extract = [query for query in queries if "EXTRACT(" in query.upper() and "FROM STOP_DATE" in query.upper()]
+    ctes = [query for query in queries if query.lstrip().upper().startswith("WITH ")]
+    assert extract and ctes
+    for query in extract + ctes:
+        assert not referenced_tables(query) & {"stop_date", "stop_time", "age_race_violations"}, query
+
+
+def test_report_scan_reads_the_ledger():
+    query, _ = scan_query(list(plan_scan({**MEDIUM_ANSWERS, **COMPLEX_ANSWERS})))
+    assert referenced_tables(query) == {"traffic_stops"}
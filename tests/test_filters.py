@@ -0,0 +1,71 @@
+import datetime
+import re
+
+import pandas as pd
+import pytest
+
+from securecheck.filters import active_filters, age_band_filters, apply_filters, tables_read
+from securecheck.queries import COMPLEX_QUERIES, MEDIUM_QUERIES
+
+FILTERS = {"country_name": "India", "driver_gender": "M", "date_from": datetime.date(2021, 1, 1),
+           "age_min": 26, "age_max": 35, "violation": "All", "date_to": None, "unknown": "x"}
+ACTIVE = {"country_name": "India", "driver_gender": "M", "date_from": datetime.date(2021, 1, 1),
+          "age_min": 26, "age_max": 35}
+WHERE = ("driver_age <= :age_max AND driver_age >= :age_min AND country_name = :country_name "
+         "AND stop_date >= :date_from AND driver_gender = :driver_gender")
+
+
+def test_active_filters_drop_unset_values():
+    assert active_filters(FILTERS) == ACTIVE
+    assert age_band_filters("26-35") == {"age_min": 26, "age_max": 35}
+    assert age_band_filters("All") == {"age_min": None, "age_max": None}
+
+
+def test_no_filters_leave_the_query_alone():
+    query = next(iter(MEDIUM_QUERIES.values()))
+    assert apply_filters(query, {"violation": "All"}) == (query, {})
+
+
+# Values travel as bind parameters; every read keeps its alias (or the table name as one)
+def test_filters_become_bind_parameters():
+    query, params = apply_filters(
+        "SELECT COUNT(*) FROM traffic_stops t JOIN rollup_time AS u ON t.stop_id = u.stop_id WHERE t.x = 1", FILTERS)
+    assert params == ACTIVE
+    assert query == (f"SELECT COUNT(*) FROM (SELECT * FROM traffic_stops WHERE {WHERE}) AS t "
+                     f"JOIN (SELECT * FROM rollup_time WHERE {WHERE}) AS u ON t.stop_id = u.stop_id WHERE t.x = 1")
+    query, _ = apply_filters("select count(*) from traffic_stops where is_arrested", {"violation": "Speeding"})
+    assert query == ("select count(*) from (SELECT * FROM traffic_stops WHERE violation = :violation) "
+                     "AS traffic_stops where is_arrested")
+
+
+# Every insight keeps reading the same relations, each read filtered, and no value is inlined
+def test_every_insight_is_filtered_where_it_reads():
+    for query in [*MEDIUM_QUERIES.values(), *COMPLEX_QUERIES.values()]:
+        filtered, params = apply_filters(query, FILTERS)
+        assert params == ACTIVE
+        assert tables_read(filtered) == tables_read(query)
+        reads = len(re.findall(r"\b(?:FROM|JOIN)\s+(?:traffic_stops|rollup_\w+)\b", query, re.IGNORECASE))
+        assert reads and filtered.count(f"WHERE {WHERE})") == reads
+        assert "India" not in filtered
+
+
+# A filtered insight on DuckDB returns what the unfiltered one returns over a pre-filtered ledger
+def test_filtered_insight_matches_filtered_ledger():
+    pytest.importorskip("duckdb")
+    from securecheck.backends import DuckDBBackend
+    from securecheck.loader import clean_chunk
+    from securecheck.synthetic import generate_stops
+
+    ledger = clean_chunk(generate_stops(3000, seed=11), fill_unknown=False)
+    filters = {"country_name": "India", "age_min": 26, "age_max": 35}
+    kept = ledger[(ledger["country_name"] == "India") & ledger["driver_age"].between(26, 35)]
+    full, part = DuckDBBackend(ledger), DuckDBBackend(kept.reset_index(drop=True))
+    for query in [*MEDIUM_QUERIES.values(), *COMPLEX_QUERIES.values()]:
+        expected = part.run(query)
+        got = full.run(*apply_filters(query, filters))
+        if "limit" in query.lower():  # ties under a LIMIT may come back in either order
+            assert len(got) == len(expected), query
+        else:
+            pd.testing.assert_frame_equal(got.sort_values(list(got.columns)).reset_index(drop=True),
+                                          expected.sort_values(list(expected.columns)).reset_index(drop=True),
+                                          check_dtype=False)
@@ -0,0 +1,46 @@
+import pandas as pd
+
+from securecheck.ingest import prepare_rows
+
+
+# A COPY column as plain values, None for NULL
+def _values(column):
+    return [None if pd.isna(value) else value for value in column]
+
+
+def _export(**columns):
+    base = {"Vehicle Number": [" tn01ab1234 ", "TN01AB9999"], "stop_date": ["2024-03-01", "2024-03-01"],
+            "stop_time": ["10:15", "22:40:05"]}
+    base.update(columns)
+    return pd.DataFrame(base)
+
+
+# Missing values stay missing: no median age, no 'Unknown', no false flag
+def test_missing_values_are_stored_as_null():
+    rows, rejected = prepare_rows(_export(driver_age=[31, None], stop_outcome=["Arrest", None],
+                                          violation=[None, "Speeding"], is_arrested=["t", None],
+                                          search_conducted=[None, "0"]))
+    assert rejected == 0
+    assert _values(rows["driver_age"]) == ["31", None]
+    assert _values(rows["stop_outcome"]) == ["Arrest", None]
+    assert _values(rows["violation"]) == [None, "Speeding"]
+    assert _values(rows["is_arrested"]) == ["t", None]
+    assert _values(rows["search_conducted"]) == [None, "f"]
+
+
+# Column names, plates, dates and times are normalized to what COPY and the lookups expect
+def test_rows_are_normalized_for_copy():
+    rows, _ = prepare_rows(_export())
+    assert _values(rows["vehicle_number"]) == ["TN01AB1234", "TN01AB9999"]
+    assert _values(rows["stop_date"]) == ["2024-03-01", "2024-03-01"]
+    assert _values(rows["stop_time"]) == ["10:15:00", "22:40:05"]
+
+
+# Rows without a dedup key are rejected; repeats within a batch are kept once
+def test_rejects_incomplete_keys_and_drops_repeats():
+    df = pd.DataFrame({"vehicle_number": ["TN1", "tn1", "TN2", "  ", "TN3"],
+                       "stop_date": ["2024-01-01", "2024-01-01", None, "2024-01-01", "2024-01-01"],
+                       "stop_time": ["08:00", "08:00", "09:00", "09:00", "not a time"]})
+    rows, rejected = prepare_rows(df)
+    assert rejected == 3
+    assert _values(rows["vehicle_number"]) == ["TN1"]
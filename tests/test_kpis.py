@@ -0,0 +1,19 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("duckdb")
+
+from securecheck.backends import DuckDBBackend
+from securecheck.kpis import KPI_NAMES, KPI_QUERY, statistics_from_frame
+from securecheck.loader import clean_chunk, clean_chunks
+from securecheck.synthetic import generate_stops
+
+
+# The snapshot's KPIs match KPI_QUERY over the same stops, NULL violations included
+def test_frame_statistics_match_sql():
+    raw = generate_stops(2000, seed=12)
+    raw.loc[np.random.default_rng(4).random(len(raw)) < 0.05, "violation"] = None
+    kpis, _ = statistics_from_frame(clean_chunks([raw]))
+    result = DuckDBBackend(clean_chunk(raw, fill_unknown=False)).run(KPI_QUERY)
+    totals = result[result["is_total"] == 1].iloc[0]
+    assert kpis == {name: int(totals[name]) for name in KPI_NAMES}
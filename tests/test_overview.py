@@ -0,0 +1,69 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("duckdb")
+
+from securecheck import overview
+from securecheck.backends import DuckDBBackend
+from securecheck.loader import clean_chunk
+from securecheck.synthetic import generate_stops
+
+PAGE_SIZE = 7
+# Few distinct values (long runs of ties) and NULLs in every sort column
+SORT_COLUMNS = ["country_name", "driver_age", "stop_date", "stop_outcome"]
+
+
+@pytest.fixture(scope="module")
+def ledger():
+    raw = generate_stops(300, seed=9, days=20)
+    rng = np.random.default_rng(2)
+    for column in SORT_COLUMNS:
+        raw.loc[rng.random(len(raw)) < 0.1, column] = None
+    ledger = clean_chunk(raw, fill_unknown=False)
+    ledger.insert(0, "stop_id", np.arange(1, len(ledger) + 1))
+    return ledger
+
+
+# Every page of the grid, following the keyset cursor until there is none
+def _keyset_ids(monkeypatch, ledger, sort_column, descending, filters=None):
+    monkeypatch.setattr(overview, "fetch_data", DuckDBBackend(ledger).run)
+    ids, cursor = [], None
+    while True:
+        page, cursor = overview.fetch_page(sort_column, descending, filters, PAGE_SIZE, cursor)
+        assert len(page) <= PAGE_SIZE
+        ids += page["stop_id"].tolist()
+        if cursor is None:
+            return ids
+
+
+def _frame_ids(ledger, sort_column, descending, filters=None):
+    ids, page_index = [], 0
+    while True:
+        page, total = overview.frame_page(ledger, sort_column, descending, filters, PAGE_SIZE, page_index)
+        ids += page["stop_id"].tolist()
+        page_index += 1
+        if page_index * PAGE_SIZE >= total:
+            return ids
+
+
+# Paging through ties and NULL sort keys visits every row once, in the same order on the
+# server (keyset cursor) and in memory (frame_page)
+@pytest.mark.parametrize("sort_column", SORT_COLUMNS)
+@pytest.mark.parametrize("descending", [False, True])
+def test_pages_are_continuous(monkeypatch, ledger, sort_column, descending):
+    assert ledger[sort_column].isna().any() and ledger[sort_column].duplicated().any()
+    keyset = _keyset_ids(monkeypatch, ledger, sort_column, descending)
+    frame = _frame_ids(ledger, sort_column, descending)
+    assert sorted(keyset) == ledger["stop_id"].tolist()
+    assert keyset == frame
+    values = ledger.set_index("stop_id").loc[keyset, sort_column]
+    assert values.isna().to_numpy()[values.notna().sum():].all()
+
+
+def test_filtered_pages_are_continuous(monkeypatch, ledger):
+    filters = {"country_name": ledger["country_name"].dropna().iloc[0], "vehicle_number": " tn"}
+    keyset = _keyset_ids(monkeypatch, ledger, "driver_age", True, filters)
+    expected = overview.frame_slice(ledger, filters)["stop_id"]
+    assert sorted(keyset) == sorted(expected) and len(expected) > PAGE_SIZE
+    assert keyset == _frame_ids(ledger, "driver_age", True, filters)
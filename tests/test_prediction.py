@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+from securecheck import prediction
+from securecheck.backends import DuckDBBackend
+from securecheck.loader import clean_chunk, clean_chunks
+from securecheck.prediction import LEVELS, PredictionIndex
+from securecheck.synthetic import generate_stops
+
+
+# Stops as the database holds them: some outcomes and violations NULL or recorded as 'Unknown'.
+# Ages are all present, since the cleaned snapshot fills missing ones with the median.
+@pytest.fixture(scope="module")
+def raw():
+    raw = generate_stops(3000, seed=7)
+    raw["driver_age"] = raw["driver_age"].fillna(40)
+    rng = np.random.default_rng(2)
+    for column in ("stop_outcome", "violation", "driver_gender"):
+        raw.loc[rng.random(len(raw)) < 0.05, column] = None
+    raw.loc[rng.random(len(raw)) < 0.03, "stop_outcome"] = "Unknown"
+    raw.insert(0, "stop_id", np.arange(1, len(raw) + 1))
+    return raw
+
+
+@pytest.fixture(scope="module")
+def frame_index(raw):
+    index = PredictionIndex()
+    index.load_frame(clean_chunks([raw]))
+    return index
+
+
+# The index built from COUNTS_QUERY, run on DuckDB over the same stops
+@pytest.fixture(scope="module")
+def db_index(raw):
+    pytest.importorskip("duckdb")
+    backend = DuckDBBackend(clean_chunk(raw, fill_unknown=False))
+    index = PredictionIndex()
+    original = prediction.fetch_data
+    prediction.fetch_data = backend.run
+    try:
+        index.refresh()
+    finally:
+        prediction.fetch_data = original
+    return index
+
+
+def test_database_and_frame_builds_agree(frame_index, db_index):
+    assert db_index.watermark == frame_index.watermark
+    for level in LEVELS:
+        by_frame = frame_index.prediction_table(level).sort_values(list(level)).reset_index(drop=True)
+        by_db = db_index.prediction_table(level).sort_values(list(level)).reset_index(drop=True)
+        assert by_db.equals(by_frame), level
+    assert "Unknown" not in set(frame_index.prediction_table(()).loc[:, ["outcome", "violation"]].values.ravel())
+
+
+# A key with no stops falls back level by level; an empty index falls back to the defaults
+def test_hierarchical_fallback(frame_index):
+    exact = frame_index.predict("M", 30, "0", "0-15 Min", "0")
+    assert exact["level"] == LEVELS[0] and not exact["fallback"]
+
+    no_age = frame_index.predict("M", 150, "0", "0-15 Min", "0")
+    assert no_age["level"] == LEVELS[1] and no_age["fallback"]
+
+    no_gender = frame_index.predict("X", 150, "0", "0-15 Min", "0")
+    assert no_gender["level"] == LEVELS[3]
+    assert no_gender["matching_stops"] == frame_index.predict("Y", 20, "0", "9 Hours", "0")["matching_stops"]
+
+    empty = PredictionIndex().predict("M", 30, "0", "0-15 Min", "0")
+    assert (empty["outcome"], empty["violation"], empty["level"]) == (
+        prediction.DEFAULT_OUTCOME, prediction.DEFAULT_VIOLATION, None)
@@ -0,0 +1,50 @@
+import pytest
+
+pytest.importorskip("duckdb")
+
+from securecheck.backends import DuckDBBackend
+from securecheck.filters import tables_read
+from securecheck.loader import clean_chunk
+from securecheck.report import format_summary, insight_key, run_report
+from securecheck.rollups import insight_queries
+from securecheck.synthetic import generate_stops
+
+
+# DuckDB standing in for PostgreSQL: the insight queries are the rollup-routed ones, and the
+# rollup tables are missing, so any insight sent to a rollup fails as its own query
+class RollupBackend(DuckDBBackend):
+    def insight_queries(self, filters=None):
+        return insight_queries(use_rollups=True, filters=filters)
+
+
+class FailingScanBackend(DuckDBBackend):
+    def run(self, query, params=None):
+        if "GROUPING SETS" in query:
+            raise RuntimeError("scan failed")
+        return super().run(query, params)
+
+
+@pytest.fixture(scope="module")
+def ledger():
+    return clean_chunk(generate_stops(2000, seed=5), fill_unknown=False)
+
+
+# An age filter leaves some insights on the rollups and sends the rest back to the ledger
+def test_rollup_served_insights_keep_their_own_queries(ledger, tmp_path):
+    filters = {"age_min": 30}
+    report = run_report(str(tmp_path), file_format="csv", filters=filters, backend=RollupBackend(ledger))
+    medium, complex_ = insight_queries(use_rollups=True, filters=filters)
+    on_rollups = {insight_key(group, label) for group, queries in (("medium", medium), ("complex", complex_))
+                  for label, query in queries.items() if tables_read(query) != {"traffic_stops"}}
+    assert on_rollups
+    sources = report["insights"].set_index("insight")["source"]
+    assert (sources[sorted(on_rollups)] == "query").all()
+    assert (sources == "shared scan").any()
+
+
+def test_failed_scan_is_reported(ledger, tmp_path):
+    report = run_report(str(tmp_path), file_format="csv", backend=FailingScanBackend(ledger))
+    assert report["scan_error"] == "scan failed"
+    assert (report["insights"]["source"] == "query").all()
+    assert report["insights"]["error"].isna().all()
+    assert "scan failed" in format_summary(report)
@@ -0,0 +1,74 @@
+import datetime
+
+import numpy as np
+import pytest
+
+pytest.importorskip("duckdb")
+
+from securecheck.backends import DuckDBBackend, translate
+from securecheck.filters import tables_read
+from securecheck.loader import clean_chunk
+from securecheck.queries import COMPLEX_QUERIES, MEDIUM_QUERIES
+from securecheck.rollups import (COMPLEX_ROLLUP_QUERIES, MEDIUM_ROLLUP_QUERIES, ROLLUPS, _create_statements,
+                                 _refresh_statement, insight_queries)
+from securecheck.synthetic import generate_stops
+
+NULL_COLUMNS = ["country_name", "violation", "driver_gender", "driver_race", "stop_duration", "driver_age"]
+
+
+# A ledger with some NULL dimensions, and the rollups folded from it with the refresh SELECT
+# (DuckDB has no ON CONFLICT on expressions, so everything is folded in one batch)
+@pytest.fixture(scope="module")
+def backend():
+    raw = generate_stops(3000, seed=7)
+    rng = np.random.default_rng(1)
+    for column in NULL_COLUMNS:
+        raw.loc[rng.random(len(raw)) < 0.05, column] = None
+    ledger = clean_chunk(raw, fill_unknown=False)
+    ledger.insert(0, "stop_id", np.arange(1, len(ledger) + 1))
+    backend = DuckDBBackend(ledger)
+    cursor = backend._cursor()
+    for name, dimensions in ROLLUPS.items():
+        cursor.execute(_create_statements(name, dimensions)[0])
+        fold = _refresh_statement(name, dimensions).split("\nON CONFLICT")[0]
+        cursor.execute(translate(fold, "duckdb"), {"low": 0, "high": len(ledger)})
+    return backend
+
+
+def _records(df):
+    rows = []
+    for record in df.astype(object).where(df.notna(), None).to_dict("records"):
+        rows.append(tuple(sorted((key, round(float(value), 2) if isinstance(value, (float, int)) else value)
+                                 for key, value in record.items())))
+    return sorted(rows, key=repr)
+
+
+# Each rollup query returns what its ledger query returns; under a LIMIT only the row count is
+# compared, since ties may come back in either order
+def test_rollup_queries_match_ledger_queries(backend):
+    for ledger_queries, rollup_queries in ((MEDIUM_QUERIES, MEDIUM_ROLLUP_QUERIES), (COMPLEX_QUERIES, COMPLEX_ROLLUP_QUERIES)):
+        for label, query in rollup_queries.items():
+            expected = backend.run(ledger_queries[label])
+            got = backend.run(query)
+            assert len(got) == len(expected), label
+            if "limit" not in query.lower():
+                assert _records(got) == _records(expected), label
+
+
+# A filter keeps an insight on its rollup only when every rollup it reads has the filtered column
+def test_filters_route_to_rollups_that_serve_them():
+    medium, complex_ = insight_queries(use_rollups=True)
+    assert medium == {**MEDIUM_QUERIES, **MEDIUM_ROLLUP_QUERIES}
+    assert complex_ == {**COMPLEX_QUERIES, **COMPLEX_ROLLUP_QUERIES}
+    assert insight_queries(use_rollups=False) == (MEDIUM_QUERIES, COMPLEX_QUERIES)
+    # No rollup has stop_date: a date range sends every insight back to the ledger
+    medium, complex_ = insight_queries(filters={"date_from": datetime.date(2021, 1, 1)})
+    assert all(tables_read(query) == {"traffic_stops"} for query in [*medium.values(), *complex_.values()])
+    for filters, column in (({"age_min": 30}, "driver_age"), ({"driver_gender": "M"}, "driver_gender")):
+        medium, complex_ = insight_queries(filters=filters)
+        for label, query in [*medium.items(), *complex_.items()]:
+            rollups = tables_read(query) - {"traffic_stops"}
+            assert all(column in [dim for dim, _, _ in ROLLUPS[name]] for name in rollups), label
+            rollup_query = MEDIUM_ROLLUP_QUERIES.get(label) or COMPLEX_ROLLUP_QUERIES.get(label)
+            if rollup_query and not rollups:
+                assert any(column not in [dim for dim, _, _ in ROLLUPS[name]] for name in tables_read(rollup_query)), label
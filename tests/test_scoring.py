@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from securecheck.loader import clean_chunks
+from securecheck.prediction import PredictionIndex
+from securecheck.scoring import score_frame
+from securecheck.synthetic import generate_stops
+
+FLAG_TEXT = {True: ["True", "t", "1", "yes"], False: ["False", "f", "0", "no"]}
+
+
+@pytest.fixture(scope="module")
+def index():
+    index = PredictionIndex()
+    index.load_frame(clean_chunks([generate_stops(3000, seed=4)]))
+    return index
+
+
+# Stops as the form sends them, plus the same stops as an uploaded file spells them (text
+# flags, ages as text). Unseen genders, ages and durations force every fallback level.
+@pytest.fixture(scope="module")
+def stops():
+    rng = np.random.default_rng(6)
+    stops = generate_stops(400, seed=8)[["driver_gender", "driver_age", "search_conducted", "stop_duration",
+                                          "drugs_related_stop"]].reset_index(drop=True)
+    stops["driver_age"] = stops["driver_age"].astype(object)
+    stops.loc[rng.random(len(stops)) < 0.1, "driver_gender"] = "X"
+    stops.loc[rng.random(len(stops)) < 0.1, "driver_age"] = 120
+    stops.loc[rng.random(len(stops)) < 0.1, "driver_age"] = None
+    stops.loc[rng.random(len(stops)) < 0.1, "stop_duration"] = "2+ Hours"
+    return stops
+
+
+def _as_file(stops):
+    rng = np.random.default_rng(3)
+    upload = stops.copy()
+    for column in ("search_conducted", "drugs_related_stop"):
+        upload[column] = [FLAG_TEXT[bool(value)][rng.integers(4)] for value in stops[column]]
+    upload["driver_age"] = [None if age is None or pd.isna(age) else str(int(age)) for age in stops["driver_age"]]
+    return upload.rename(columns={"driver_gender": "Driver Gender"})
+
+
+# Batch scoring answers every row the way a single prediction from the form does
+def test_score_frame_matches_predict(index, stops):
+    expected = [index.predict(*row) for row in stops.itertuples(index=False)]
+    assert len({("ledger" if not found["level"] else ", ".join(found["level"])) for found in expected}) >= 3
+    for batch in (stops, _as_file(stops)):
+        scored = score_frame(batch, index)
+        for row, found in zip(scored.itertuples(index=False), expected):
+            assert (row.predicted_outcome, row.predicted_violation, row.matching_stops) == (
+                found["outcome"], found["violation"], found["matching_stops"])
+            assert row.prediction_level == (", ".join(found["level"]) or "ledger" if found["level"] is not None else None)